@@ -24,6 +24,7 @@ import tarfile
 import itertools
 import collections
 import functools
+import re
 
 from accelerator.job import Job, JobWithFile
 from accelerator.dataset import Dataset
@@ -31,9 +32,9 @@ from accelerator.unixhttp import call, WaitressServer
 from accelerator.build import fmttime
 from accelerator.configfile import resolve_listen
 from accelerator.error import NoSuchWhateverError
-from accelerator.shell.workdir import job_data, workdir_jids
 from accelerator.compat import setproctitle, url_quote, urlencode
 from accelerator import __version__ as ax_version
+from accelerator import sampling
 
 def get_job(jobid):
 	if jobid.endswith('-LATEST'):
@@ -41,6 +42,9 @@ def get_job(jobid):
 		jobid = os.readlink(Job(base + '-0').path[:-2] + '-LATEST')
 	return Job(jobid)
 
+WORKDIR_PAGE_SIZE = 500
+WORKDIR_STATES = ('current', 'old', 'unfinished',)
+
 # why wasn't Accept specified in a sane manner (like sending it in preference order)?
 def get_best_accept(*want):
 	d = {want[0]: -1} # fallback to first specified
@@ -321,20 +325,47 @@ def run(cfg, from_shell=False):
 			files = [fn for fn in job.files() if fn[0] != '/']
 			subjobs = [Job(jobid) for jobid in post.subjobs]
 			current = call_s('job_is_current', job)
+			iostats = post.get('iostats')
 		else:
 			aborted = True
 			current = False
 			files = None
 			subjobs = None
+			iostats = None
 		return dict(
 			job=job,
 			aborted=aborted,
 			current=current,
 			output=os.path.exists(job.filename('OUTPUT')),
+			profiled=os.path.exists(job.filename('PROFILE')),
 			datasets=job.datasets,
 			params=job.params,
 			subjobs=subjobs,
 			files=files,
+			iostats=iostats,
+		)
+
+	@bottle.get('/flamegraph/<jobid>')
+	@view('flamegraph')
+	def flamegraph(jobid):
+		job = get_job(jobid)
+		try:
+			profiles = sampling.load(job.path)
+		except OSError:
+			return bottle.HTTPError(404, 'Job %s was not profiled' % (job,))
+		names = sorted(profiles)
+		q = bottle.request.query
+		if q.name:
+			if q.name not in profiles:
+				return bottle.HTTPError(404, 'No profile %r in %s' % (q.name, job,))
+			profiles = {q.name: profiles[q.name]}
+		total, boxes = sampling.flamegraph(profiles)
+		return dict(
+			job=job,
+			names=names,
+			selected=q.name,
+			total=total,
+			boxes=boxes,
 		)
 
 	@bottle.get('/dataset/<dsid:path>')
@@ -355,36 +386,71 @@ def run(cfg, from_shell=False):
 			bottle.response.content_type = 'application/json; charset=UTF-8'
 			return json.dumps(res)
 		else:
-			return dict(ds=ds)
-
-	def load_workdir(jobs, name):
-		known = call_s('workdir', name)
-		jobs[name + '-LATEST'] = None # Sorts first
+			return dict(ds=ds, stats=find_stats(ds))
+
+	def find_stats(ds):
+		"""Result of the newest current dataset_stats job for ds, if any.
+		(The board never builds it, see the dataset page for how to.)"""
+		url = cfg.url + '/jobs_with_source/dataset_stats?' + urlencode(dict(source=ds))
+		for jobid in call(url):
+			job = Job(jobid)
+			try:
+				return dict(job=job, columns=job.load())
+			except (IOError, OSError):
+				pass
+		return None
+
+	def load_workdir(name, names):
+		"""A page of jobs from the server, or with ?since=generation just
+		what changed since then (for updating a page that is already shown)."""
+		q = bottle.request.query
 		try:
-			latest = os.readlink(os.path.join(cfg.workdirs[name], name + '-LATEST'))
-		except OSError:
-			latest = None
-		for jid in workdir_jids(cfg, name):
-			jobs[jid] = job_data(known, jid)
-		if latest in jobs:
-			jobs[name + '-LATEST'] = jobs[latest]
+			page = max(int(q.page or 1), 1)
+		except ValueError:
+			return bottle.HTTPError(400, 'Bad page')
+		state = [v for v in q.getall('state') if v in WORKDIR_STATES]
+		if set(state) == set(WORKDIR_STATES):
+			state = []
+		method = q.method.strip()
+		bad_method = False
+		for v in method.split():
+			try:
+				re.compile(v)
+			except re.error:
+				bad_method = True
+		args = dict(state=','.join(state))
+		if not bad_method:
+			args['method'] = method
+		if q.since:
+			args['since'] = q.since
 		else:
-			del jobs[name + '-LATEST']
-		return jobs
+			args['offset'] = (page - 1) * WORKDIR_PAGE_SIZE
+			args['limit'] = WORKDIR_PAGE_SIZE
+		url = os.path.join(cfg.url, 'workdir_jobs', *map(url_quote, names))
+		res = call(url + '?' + urlencode(args))
+		def fix(jobid, info, state):
+			if info['totaltime'] is not None:
+				info['totaltime'] = fmttime(info['totaltime'])
+			return dict(info, jobid=jobid, klass=state)
+		res.jobs = [fix(*job) for job in res.get('jobs', ())]
+		res.latest = [(name + '-LATEST', fix(*res.latest[name])) for name in names if name in res.latest]
+		if 'total' in res:
+			res.pages = max((res.total + WORKDIR_PAGE_SIZE - 1) // WORKDIR_PAGE_SIZE, 1)
+		res.update(name=name, page=page, method=method, bad_method=bad_method, state=state or WORKDIR_STATES)
+		return res
 
 	@bottle.get('/workdir/<name>')
-	@view('workdir', 'jobs')
+	@view('workdir')
 	def workdir(name):
-		return dict(name=name, jobs=load_workdir(collections.OrderedDict(), name))
+		if name not in cfg.workdirs:
+			return bottle.HTTPError(404, 'No such workdir')
+		return load_workdir(name, [name])
 
 	@bottle.get('/workdir')
 	@bottle.get('/workdir/')
-	@view('workdir', 'jobs')
+	@view('workdir')
 	def all_workdirs():
-		jobs = collections.OrderedDict()
-		for name in sorted(cfg.workdirs):
-			load_workdir(jobs, name)
-		return dict(name='ALL', jobs=jobs)
+		return load_workdir('ALL', sorted(cfg.workdirs))
 
 	@bottle.get('/methods')
 	@view('methods')
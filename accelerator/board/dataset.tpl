@@ -34,6 +34,60 @@
 		% end
 	</tbody>
 	</table>
+	<h2>statistics:</h2>
+	% if stats:
+	<table id="stats" class="ds-table">
+	<thead>
+		<tr><th>name</th><th>nulls</th><th>distinct</th><th>histogram</th></tr>
+	</thead>
+	<tbody>
+		% for name, col in sorted(stats['columns'].items()):
+			<tr>
+				<td>{{ name }}</td>
+				<td>{{ sum(col['nulls']) }}</td>
+				<td>{{ '' if col['distinct_exact'] else '~' }}{{ col['distinct_total'] }}</td>
+				<td>
+				% histogram = col['histogram']
+				% if histogram:
+					% edges, counts = histogram['edges'], histogram['counts']
+					% top = max(counts) or 1
+					<div class="histogram">
+					% for ix, count in enumerate(counts):
+						<div style="height: {{ '%.1f' % (100.0 * count / top,) }}%" title="{{ edges[ix] }} - {{ edges[ix + 1] }}: {{ count }}"></div>
+					% end
+					</div>
+				% end
+				</td>
+			</tr>
+		% end
+	</tbody>
+	</table>
+	<details>
+		<summary>per slice (from {{ ! ax_link(stats['job']) }})</summary>
+		<table class="ds-table">
+		<thead>
+			<tr><th>name</th><th>slice</th><th>lines</th><th>nulls</th><th>distinct</th><th>min</th><th>max</th></tr>
+		</thead>
+		<tbody>
+			% for name, col in sorted(stats['columns'].items()):
+				% for sliceno, lines in enumerate(col['lines']):
+				<tr>
+					<td>{{ name }}</td>
+					<td>{{ sliceno }}</td>
+					<td>{{ lines }}</td>
+					<td>{{ col['nulls'][sliceno] }}</td>
+					<td>{{ col['distinct'][sliceno] }}</td>
+					<td>{{ '' if col['min'][sliceno] is None else col['min'][sliceno] }}</td>
+					<td>{{ '' if col['max'][sliceno] is None else col['max'][sliceno] }}</td>
+				</tr>
+				% end
+			% end
+		</tbody>
+		</table>
+	</details>
+	% else:
+	No statistics yet, build <a href="/method/dataset_stats">dataset_stats</a> with datasets={source: '{{ ds }}'} to get them.
+	% end
 	% cols, lines = ds.shape
 	{{ cols }} columns<br>
 	{{ lines }} lines {{ ds.lines }}<br>
@@ -0,0 +1,49 @@
+{{ ! template('head', title='profile ' + job) }}
+
+	<style>
+		#flamegraph {
+			position: relative;
+			overflow: hidden;
+			font-size: 12px;
+		}
+		#flamegraph div {
+			position: absolute;
+			box-sizing: border-box;
+			height: 17px;
+			padding: 1px 2px;
+			overflow: hidden;
+			white-space: nowrap;
+			border: 1px solid var(--bg0);
+			background: var(--bg2);
+		}
+		#flamegraph div.phase {
+			background: var(--border2);
+		}
+	</style>
+	<h1>profile <a href="/job/{{ job }}">{{ job }}</a></h1>
+	<div class="box">
+		% if selected:
+			<a href="/flamegraph/{{ job }}">all</a>
+		% else:
+			<b>all</b>
+		% end
+		% for name in names:
+			% if name == selected:
+				<b>{{ name }}</b>
+			% else:
+				<a href="/flamegraph/{{ job }}?name={{ name }}">{{ name }}</a>
+			% end
+		% end
+	</div>
+	% if not total:
+		<p>No samples.</p>
+	% else:
+		% rows = max(box[0] for box in boxes) + 1
+		<p>{{ total }} samples. Width is wall clock time, added over all analysis processes.</p>
+		<div id="flamegraph" style="height: {{ rows * 18 }}px">
+			% for depth, start, width, label, count in boxes:
+				<div{{ ! ' class="phase"' if depth == 0 else '' }} style="top: {{ depth * 18 }}px; left: {{ '%.4f' % (start * 100) }}%; width: {{ '%.4f' % (width * 100) }}%" title="{{ label }}: {{ count }} samples ({{ '%.1f' % (width * 100) }}%)">{{ label }}</div>
+			% end
+		</div>
+	% end
+</body>
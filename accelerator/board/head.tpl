@@ -384,6 +384,9 @@
 		.filter tbody td {
 			padding-right: 0.3em;
 		}
+		.workdir .pages {
+			margin: 0.5em 0;
+		}
 		table.job-table tr.unfinished {
 			background: var(--bgwarn);
 		}
@@ -394,6 +397,41 @@
 		#status-stacks td {
 			padding: 1px 1px;
 		}
+		#progress td {
+			padding: 1px 0.5em;
+			text-align: right;
+		}
+		#progress td:first-child {
+			text-align: left;
+		}
+		#progress .bar {
+			display: inline-block;
+			height: 0.8em;
+			background: var(--fg-weak);
+		}
+		#progress td.bar-cell {
+			width: 10em;
+			text-align: left;
+		}
+		#progress tr.behind {
+			background: var(--bg2);
+		}
+		#progress tr.stalled {
+			background: var(--bgwarn);
+		}
+		#stats .histogram {
+			display: flex;
+			align-items: flex-end;
+			height: 2em;
+		}
+		#stats .histogram div {
+			width: 0.4em;
+			margin-right: 1px;
+			background: var(--fg-weak);
+		}
+		#stats td {
+			vertical-align: bottom;
+		}
 		.output {
 			background: var(--bg1);
 			border: 2px solid var(--border1);
@@ -29,6 +29,9 @@
 	<div class="box">
 		<a href="/method/{{ params.method }}">{{ params.package }}.{{ params.method }}</a><br>
 		<a href="/job/{{ job }}/method.tar.gz/">Source</a>
+		% if profiled:
+			<br><a href="/flamegraph/{{ job }}">Profile</a>
+		% end
 		<div class="box" id="other-params">
 			% blacklist = {
 			%     'package', 'method', 'options', 'datasets', 'jobs', 'params',
@@ -40,7 +43,9 @@
 					<tr><td>endtime</td><td>=</td><td>{{ datetime.fromtimestamp(params['endtime']) }}</td></tr>
 					% exectime = params['exectime']
 					% for k in sorted(exectime):
-						<tr><td>exectime.{{ k }}</td><td>=</td><td>{{ ! ax_repr(exectime[k]) }}</td></tr>
+						% if k != 'rusage':
+							<tr><td>exectime.{{ k }}</td><td>=</td><td>{{ ! ax_repr(exectime[k]) }}</td></tr>
+						% end
 					% end
 				% end
 				% for k in sorted(set(params) - blacklist):
@@ -52,6 +57,32 @@
 				% end
 			</table>
 		</div>
+		% usage = {} if aborted else params['exectime'].get('rusage')
+		% if usage:
+			% from accelerator.rusage import sort_key
+			% from accelerator.iostats import fmt_size
+			<h3>rusage</h3>
+			<div class="box">
+				<table class="ds-table">
+					<thead>
+						<tr><th>process</th><th>peak RSS</th><th>user</th><th>system</th><th>major faults</th><th>context switches</th></tr>
+					</thead>
+					<tbody>
+					% for name in sorted(usage, key=sort_key):
+						% u = usage[name]
+						<tr>
+							<td>{{ name }}</td>
+							<td>{{ fmt_size(u['maxrss']) }}</td>
+							<td>{{ '%.2fs' % (u['utime'],) }}</td>
+							<td>{{ '%.2fs' % (u['stime'],) }}</td>
+							<td>{{ u['majflt'] }}</td>
+							<td title="voluntary/involuntary">{{ '%d/%d' % (u['nvcsw'], u['nivcsw'],) }}</td>
+						</tr>
+					% end
+					</tbody>
+				</table>
+			</div>
+		% end
 		% if params.options:
 			<h3>options</h3>
 			<div class="box">
@@ -97,6 +128,32 @@
 			</ul>
 		</div>
 	% end
+	% if iostats:
+		% from accelerator.iostats import totals, fmt_size
+		<h2>io</h2>
+		<div class="box">
+			<table class="ds-table">
+				<thead>
+					<tr><th></th><th>dataset</th><th>column</th><th>compressed</th><th>uncompressed</th><th>values</th><th>(de)compressing</th></tr>
+				</thead>
+				<tbody>
+				% for kind, ds, column, (compressed, uncompressed, values, seconds) in totals(iostats):
+					% slices = sorted(iostats[kind][ds][column].items(), key=lambda item: int(item[0]))
+					% per_slice = '\n'.join('slice %s: %s, %s, %d values, %.3fs' % (sliceno, fmt_size(c), fmt_size(u), v, t) for sliceno, (c, u, v, t) in slices)
+					<tr title="{{ per_slice }}">
+						<td>{{ kind }}</td>
+						<td><a href="/dataset/{{ ds }}">{{ ds }}</a></td>
+						<td>{{ column }}</td>
+						<td>{{ fmt_size(compressed) }}</td>
+						<td>{{ fmt_size(uncompressed) }}</td>
+						<td>{{ values }}</td>
+						<td>{{ '%.3fs' % (seconds,) }}</td>
+					</tr>
+				% end
+				</tbody>
+			</table>
+		</div>
+	% end
 	% if output:
 		<h2>output</h2>
 		<div class="box" id="output">
@@ -24,6 +24,97 @@
 			% end
 		</table>
 	% end
+	<div id="progress-container"{{ ! '' if get('progress') else ' style="display: none"' }}>
+		<h2>Progress</h2>
+		<p>
+			Rows and (uncompressed) bytes read by each analysis process.
+			Slices far behind the others in their job are shaded, slices
+			that are not reading or using any CPU are highlighted.
+		</p>
+		<table id="progress">
+			<thead><tr>
+				<th>process</th><th></th><th>rows</th><th>rows/s</th>
+				<th>read</th><th>read/s</th><th>RSS</th><th>CPU</th><th>updated</th>
+			</tr></thead>
+			<tbody></tbody>
+		</table>
+	</div>
+	<script language="javascript">
+	(function () {
+		const container = document.getElementById('progress-container');
+		const tbody = document.querySelector('#progress tbody');
+		const fmt_size = function (num) {
+			for (const unit of ['B', 'KB', 'MB', 'GB']) {
+				if (num < 1024) return (unit === 'B' ? num.toFixed(0) : num.toFixed(1)) + ' ' + unit;
+				num /= 1024;
+			}
+			return num.toFixed(1) + ' TB';
+		};
+		const fmt_rate = (v, f) => (v === null ? '' : f(v));
+		const render = function (status) {
+			const progress = status.progress || [];
+			container.style.display = progress.length ? 'block' : 'none';
+			const max_rows = {};
+			for (const p of progress) {
+				max_rows[p.job] = Math.max(max_rows[p.job] || 0, p.rows);
+			}
+			tbody.innerHTML = '';
+			let prev_job;
+			for (const p of progress) {
+				if (p.job !== prev_job) {
+					const tr = tbody.insertRow();
+					const td = tr.insertCell();
+					td.colSpan = 9;
+					const a = document.createElement('A');
+					a.href = '/job/' + encodeURIComponent(p.job);
+					a.innerText = p.job;
+					td.appendChild(a);
+					prev_job = p.job;
+				}
+				const tr = tbody.insertRow();
+				const fraction = max_rows[p.job] ? p.rows / max_rows[p.job] : 0;
+				if (p.cpu_percent !== null && p.cpu_percent < 5 && p.rows_per_second === 0) {
+					tr.className = 'stalled';
+				} else if (max_rows[p.job] && fraction < 0.5) {
+					tr.className = 'behind';
+				}
+				const cell = function (text) {
+					tr.insertCell().innerText = text;
+				};
+				cell(p.name + ' (' + p.pid + ')');
+				const bar_cell = tr.insertCell();
+				bar_cell.className = 'bar-cell';
+				const bar = document.createElement('SPAN');
+				bar.className = 'bar';
+				bar.style.width = (fraction * 100).toFixed(1) + '%';
+				bar_cell.appendChild(bar);
+				cell(p.rows.toLocaleString());
+				cell(fmt_rate(p.rows_per_second, v => Math.round(v).toLocaleString()));
+				cell(fmt_size(p.bytes));
+				cell(fmt_rate(p.bytes_per_second, v => fmt_size(v) + '/s'));
+				cell(fmt_size(p.rss));
+				cell(fmt_rate(p.cpu_percent, v => v.toFixed(0) + '%'));
+				cell((status.report_t - p.t).toFixed(0) + 's ago');
+			}
+		};
+		const update = function () {
+			fetch('/status', {headers: {Accept: 'application/json'}})
+			.then(res => {
+				if (res.ok) return res.json();
+				throw new Error('error response');
+			})
+			.then(status => {
+				render(status);
+				setTimeout(update, 2000);
+			})
+			.catch(error => {
+				console.log(error);
+				setTimeout(update, 10000);
+			});
+		};
+		update();
+	})();
+	</script>
 	% if get('last_error_time'):
 		<p><a href="last_error?t={{ last_error_time }}">Last error at
 			{{ datetime.fromtimestamp(last_error_time).replace(microsecond=0) }}
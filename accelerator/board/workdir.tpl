@@ -1,71 +1,139 @@
 {{ ! template('head', title=name, bodyclass='workdir') }}
+% import json
+% from accelerator.compat import urlencode
+% def page_link(page):
+%	args = [('page', page)] + [('state', s) for s in state]
+%	if method:
+%		args.append(('method', method))
+%	end
+%	return '?' + urlencode(args)
+% end
 
 <h1>{{ name }}</h1>
 <div class="filter">
 	<h1>Filter</h1>
+	<form id="filter" method="get">
 	<table>
-		<tr><td>Method</td><td><input type="text" id="f-method" autocapitalize="off" disabled></td></tr>
+		<tr><td>Method</td><td><input type="text" id="f-method" name="method" value="{{ method }}" autocapitalize="off"{{ ! ' class="error"' if bad_method else '' }}></td></tr>
 		<tr>
 			<td>State</td>
 			<td>
-				% for state in ('current', 'old', 'unfinished'):
-				<input id="f-{{ state }}" value="{{ state }}" type="checkbox" checked disabled>
-				<label for="f-{{ state }}"> {{ state }}</label><br>
+				% for s in ('current', 'old', 'unfinished'):
+				<input id="f-{{ s }}" name="state" value="{{ s }}" type="checkbox"{{ ! ' checked' if s in state else '' }}>
+				<label for="f-{{ s }}"> {{ s }}</label><br>
 				% end
 			</td>
 		</tr>
 	</table>
+	</form>
+</div>
+<div class="pages">
+	{{ total }} jobs.
+	% if pages > 1:
+		% if page > 1:
+		<a href="{{ page_link(page - 1) }}">&larr;</a>
+		% end
+		page {{ page }} of {{ pages }}
+		% if page < pages:
+		<a href="{{ page_link(page + 1) }}">&rarr;</a>
+		% end
+	% end
 </div>
 <table class="job-table">
-	% for job, data in jobs.items():
-		<tr class="{{ data.klass }}">
-			<td><a href="/job/{{ job }}">{{ job }}</a></td>
-			<td>{{ data.method }}</td><td>{{ data.totaltime or 'DID NOT FINISH' }}</td>
+	% if page == 1:
+		% for latest, data in latest:
+		<tr class="{{ data['klass'] }}" data-latest="{{ latest }}">
+			<td><a href="/job/{{ latest }}">{{ latest }}</a></td>
+			<td>{{ data['method'] }}</td><td>{{ data['totaltime'] or 'DID NOT FINISH' }}</td>
+		</tr>
+		% end
+	% end
+	% for data in jobs:
+		<tr class="{{ data['klass'] }}" data-jobid="{{ data['jobid'] }}">
+			<td><a href="/job/{{ data['jobid'] }}">{{ data['jobid'] }}</a></td>
+			<td>{{ data['method'] }}</td><td>{{ data['totaltime'] or 'DID NOT FINISH' }}</td>
 		</tr>
 	% end
 </table>
 <script language="javascript">
 (function () {
-	const filter_change = function () {
-		const want = f_method.value.toLowerCase().split(/\s+/).filter(v => !!v).map(v => {
-			try {
-				return new RegExp(v);
-			} catch (e) {
-				console.log('Failed to parse ' + JSON.stringify(v) + ' as regexp: ' + e.message);
+	const form = document.getElementById('filter');
+	for (const el of document.querySelectorAll('.filter input[type="checkbox"]')) {
+		el.onchange = () => form.submit();
+	}
+	// Only fetch what changed since the page was made (or the last update).
+	let generation = {{! json.dumps(generation) }};
+	const table = document.querySelector('.job-table');
+	const split_jobid = function (jobid) {
+		const ix = jobid.lastIndexOf('-');
+		return [jobid.substring(0, ix), parseInt(jobid.substring(ix + 1))];
+	};
+	const fill = function (tr, data, name) {
+		tr.className = data.klass;
+		tr.innerHTML = '<td><a></a></td><td></td><td></td>';
+		const a = tr.querySelector('a');
+		a.href = '/job/' + encodeURIComponent(name);
+		a.innerText = name;
+		tr.children[1].innerText = data.method;
+		tr.children[2].innerText = data.totaltime || 'DID NOT FINISH';
+	};
+	const insert = function (tr, jobid) {
+		// Only new jobs on the first page, they would sort first on other pages.
+		if ({{ page }} !== 1) return false;
+		const [wd, num] = split_jobid(jobid);
+		for (const el of table.querySelectorAll('tr[data-jobid]')) {
+			const [el_wd, el_num] = split_jobid(el.dataset.jobid);
+			if (el_wd > wd || (el_wd === wd && el_num < num)) {
+				el.before(tr);
+				return true;
 			}
-		});
-		if (want.includes(undefined)) {
-			f_method.className = 'error';
-			return;
 		}
-		f_method.className = '';
-		if (want.length == 0) want.push(/./); // nothing -> all
-		const classes = Array.from(
-			document.querySelectorAll('.filter input[type="checkbox"]:checked'),
-			el => el.value,
-		);
-		const filtered = function(el) {
-			if (!classes.some(cls => el.classList.contains(cls))) return true;
-			// innerText is '' when collapsed (at least in FF), so use innerHTML.
-			const method = el.querySelector('td ~ td').innerHTML.toLowerCase();
-			return !want.some(re => re.test(method));
+		if ({{ pages }} === 1) {
+			table.appendChild(tr);
+			return true;
 		}
-		for (const el of document.querySelectorAll('.job-table tr')) {
-			if (filtered(el)) {
-				el.classList.add('filtered');
-			} else {
-				el.classList.remove('filtered');
+		return false;
+	};
+	const update = function () {
+		const url = new URL(location.href);
+		url.searchParams.delete('page');
+		url.searchParams.set('since', generation);
+		fetch(url, {headers: {Accept: 'application/json'}})
+		.then(res => {
+			if (res.ok) return res.json();
+			throw new Error('error response');
+		})
+		.then(res => {
+			if (res.reset) {
+				location.reload();
+				return;
 			}
-		}
+			generation = res.generation;
+			for (const jobid of res.dropped) {
+				const tr = table.querySelector('tr[data-jobid="' + jobid + '"]');
+				if (tr) tr.remove();
+			}
+			for (const data of res.jobs) {
+				let tr = table.querySelector('tr[data-jobid="' + data.jobid + '"]');
+				if (!tr) {
+					tr = document.createElement('TR');
+					tr.dataset.jobid = data.jobid;
+					if (!insert(tr, data.jobid)) continue;
+				}
+				fill(tr, data, data.jobid);
+			}
+			for (const [name, data] of res.latest) {
+				const tr = table.querySelector('tr[data-latest="' + name + '"]');
+				if (tr) fill(tr, data, name);
+			}
+			setTimeout(update, 2000);
+		})
+		.catch(error => {
+			console.log(error);
+			setTimeout(update, 10000);
+		});
 	};
-	const f_method = document.getElementById('f-method');
-	filter_change();
-	for (const el of document.querySelectorAll('.filter input[type="checkbox"]')) {
-		el.oninput = filter_change;
-		el.disabled = false;
-	}
-	f_method.oninput = filter_change;
-	f_method.disabled = false;
+	setTimeout(update, 2000);
 })();
 </script>
 </body>
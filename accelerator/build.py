@@ -55,7 +55,7 @@ class Automata:
 
 	method = '?' # fall-through case when we resume waiting for something
 
-	def __init__(self, server_url, verbose=False, flags=None, subjob_cookie=None, infoprints=False, print_full_jobpath=False, concurrency_map={}):
+	def __init__(self, server_url, verbose=False, flags=None, subjob_cookie=None, infoprints=False, print_full_jobpath=False, concurrency_map={}, profile_methods=()):
 		self.url = server_url
 		self.subjob_cookie = subjob_cookie
 		self.history = []
@@ -79,6 +79,7 @@ class Automata:
 			self.siginfo_check = lambda: False
 		self.print_full_jobpath = print_full_jobpath
 		self.concurrency_map = concurrency_map
+		self.profile_methods = profile_methods
 
 	def clear_record(self):
 		self.record = defaultdict(JobList)
@@ -102,7 +103,7 @@ class Automata:
 	def config(self):
 		return self._url_json('config')
 
-	def _submit(self, method, options, datasets, jobs, caption=None, wait=True, why_build=False, force_build=False, workdir=None, concurrency=None):
+	def _submit(self, method, options, datasets, jobs, caption=None, wait=True, why_build=False, force_build=False, workdir=None, concurrency=None, profile=False):
 		"""
 		Submit job to server and conditionaly wait for completion.
 		"""
@@ -123,6 +124,10 @@ class Automata:
 			data.concurrency = concurrency
 		if self.concurrency_map:
 			data.concurrency_map = self.concurrency_map
+		if profile:
+			data.profile = True
+		if self.profile_methods:
+			data.profile_methods = sorted(self.profile_methods)
 		self.job_retur = self._server_submit(data)
 		self.history.append((data, self.job_retur))
 		#
@@ -248,7 +253,7 @@ class Automata:
 	def list_workdirs(self):
 		return self._url_json('list_workdirs')
 
-	def call_method(self, method, options={}, datasets={}, jobs={}, record_in=None, record_as=None, why_build=False, force_build=False, caption=None, workdir=None, concurrency=None, **kw):
+	def call_method(self, method, options={}, datasets={}, jobs={}, record_in=None, record_as=None, why_build=False, force_build=False, caption=None, workdir=None, concurrency=None, profile=False, **kw):
 		if method not in self._method_info:
 			raise Exception('Unknown method %s' % (method,))
 		info = self._method_info[method]
@@ -263,7 +268,7 @@ class Automata:
 			if len(argmap[k]) != 1:
 				raise Exception('Keyword %s has several targets on method %s: %r' % (k, method, argmap[k],))
 			params[argmap[k][0]][k] = v
-		jid, res = self._submit(method, caption=caption, why_build=why_build, force_build=force_build, workdir=workdir, concurrency=concurrency, **params)
+		jid, res = self._submit(method, caption=caption, why_build=why_build, force_build=force_build, workdir=workdir, concurrency=concurrency, profile=profile, **params)
 		if why_build: # specified by caller
 			return res.why_build
 		if 'why_build' in res: # done by server anyway (because --flags why_build)
@@ -455,6 +460,7 @@ class Urd(object):
 		self._headers = {'Content-Type': 'application/json', 'Authorization': 'Basic ' + auth}
 		self._auth_tested = False
 		self._warnings = []
+		self._cache = {} # (path, timestamp): entry, for timestamps that are not relative
 
 	def _path(self, path):
 		if '/' not in path:
@@ -466,17 +472,53 @@ class Urd(object):
 		url = url.replace(' ', '%20')
 		return call(url, data=data, fmt=fmt, headers=self._headers, server_name='urd')
 
-	def _get(self, path, *a):
+	def _fetch(self, lookups):
+		"""Look up a list of (path, timestamp), with a single request for
+		everything not in the cache. Entries don't change (unless updated
+		or truncated, which we don't worry about unless we do it ourselves),
+		so entries looked up by a specific timestamp are cached."""
+		res = [self._cache.get(item) for item in lookups]
+		missing = [item for item, d in zip(lookups, res) if d is None]
+		if len(missing) == 1:
+			path, timestamp = missing[0]
+			fetched = [self._call('/'.join((self._url, path, timestamp,)))]
+		elif missing:
+			fetched = self._call(self._url + '/batch', missing, fmt=json.loads)
+			fetched = [_urd_typeify(d) if d else d for d in fetched]
+		else:
+			fetched = []
+		fetched = iter(fetched)
+		for ix, ((path, timestamp), d) in enumerate(zip(lookups, res)):
+			if d is None:
+				d = res[ix] = next(fetched)
+				if d:
+					if timestamp[0] not in '<>' and timestamp not in ('latest', 'first',):
+						self._cache[(path, timestamp)] = d
+					self._cache[(path, d.timestamp)] = d
+		return [UrdResponse(d) for d in res]
+
+	def _forget(self):
+		# Entries that depend on what changed become ghosts too, and
+		# those can be in any list, so it all has to go.
+		self._cache.clear()
+
+	def _get_many(self, lookups):
 		assert self._current, "Can't record dependency with nothing running"
-		path = self._path(path)
-		assert path not in self._deps, 'Duplicate ' + path
-		url = '/'.join((self._url, path,) + a)
-		res = UrdResponse(self._call(url))
-		if res:
-			self._deps[path] = res.as_dep
-		self._latest_joblist = res.joblist
+		lookups = [(self._path(path), timestamp,) for path, timestamp in lookups]
+		seen = set(self._deps)
+		for path, _ in lookups:
+			assert path not in seen, 'Duplicate ' + path
+			seen.add(path)
+		res = self._fetch(lookups)
+		for (path, _), r in zip(lookups, res):
+			if r:
+				self._deps[path] = r.as_dep
+			self._latest_joblist = r.joblist
 		return res
 
+	def _get(self, path, timestamp):
+		return self._get_many([(path, timestamp,)])[0]
+
 	def _latest_str(self):
 		if self.horizon:
 			return '<=' + self.horizon
@@ -492,10 +534,18 @@ class Urd(object):
 	def first(self, path):
 		return self.get(path, 'first')
 
+	def get_many(self, lookups):
+		"""Like get for each (path, timestamp) in lookups, but with a single
+		request to urd. Returns a list of responses."""
+		return self._get_many([(path, _tsfix(timestamp),) for path, timestamp in lookups])
+
 	def peek(self, path, timestamp):
-		path = self._path(path)
-		url = '/'.join((self._url, path, _tsfix(timestamp),))
-		return UrdResponse(self._call(url))
+		return self.peek_many([(path, timestamp,)])[0]
+
+	def peek_many(self, lookups):
+		"""Like peek for each (path, timestamp) in lookups, but with a single
+		request to urd. Returns a list of responses."""
+		return self._fetch([(self._path(path), _tsfix(timestamp),) for path, timestamp in lookups])
 
 	def peek_latest(self, path):
 		return self.peek(path, self._latest_str())
@@ -554,19 +604,22 @@ class Urd(object):
 		)
 		if self._update:
 			data.flags = ['update']
+			self._forget()
 		url = self._url + '/add'
 		return self._call(url, data)
 
 	def truncate(self, path, timestamp):
-		url = '%s/truncate/%s/%s' % (self._url, self._path(path), _tsfix(timestamp),)
+		path = self._path(path)
+		self._forget()
+		url = '%s/truncate/%s/%s' % (self._url, path, _tsfix(timestamp),)
 		return self._call(url, '')
 
 	def set_workdir(self, workdir):
 		"""Build jobs in this workdir, None to restore default"""
 		self.workdir = workdir
 
-	def build(self, method, options={}, datasets={}, jobs={}, name=None, caption=None, why_build=False, force_build=False, workdir=None, concurrency=None, **kw):
-		return self._a.call_method(method, options=options, datasets=datasets, jobs=jobs, record_as=name, caption=caption, why_build=why_build, force_build=force_build, workdir=workdir or self.workdir or self.default_workdir, concurrency=concurrency, **kw)
+	def build(self, method, options={}, datasets={}, jobs={}, name=None, caption=None, why_build=False, force_build=False, workdir=None, concurrency=None, profile=False, **kw):
+		return self._a.call_method(method, options=options, datasets=datasets, jobs=jobs, record_as=name, caption=caption, why_build=why_build, force_build=force_build, workdir=workdir or self.workdir or self.default_workdir, concurrency=concurrency, profile=profile, **kw)
 
 	def build_chained(self, method, options={}, datasets={}, jobs={}, name=None, caption=None, why_build=False, force_build=False, workdir=None, **kw):
 		assert 'previous' not in set(datasets) | set(jobs) | set(kw), "Don't specify previous to build_chained"
@@ -660,9 +713,23 @@ def find_automata(a, package, script):
 					raise
 	raise Exception('No build script "%s" found in {%s}' % (script, ', '.join(package)))
 
+def make_urd(a, horizon=None, workdir=None):
+	"""Urd for Automata a, with user and password from $URD_AUTH (or $USER)"""
+	if 'URD_AUTH' in os.environ:
+		assert ':' in os.environ['URD_AUTH'], "Set $URD_AUTH to user:password"
+		user, password = os.environ['URD_AUTH'].split(':', 1)
+	else:
+		user = os.environ.get('USER')
+		if not user:
+			user = 'NO-USER'
+			print("No $URD_AUTH or $USER in environment, using %r" % (user,), file=sys.stderr)
+		password = ''
+	info = a.info()
+	return Urd(a, info, user, password, horizon, workdir)
+
 def run_automata(options, cfg):
 	g.running = 'build'
-	a = Automata(cfg.url, verbose=options.verbose, flags=options.flags.split(','), infoprints=True, print_full_jobpath=options.full_path, concurrency_map=options.concurrency_map)
+	a = Automata(cfg.url, verbose=options.verbose, flags=options.flags.split(','), infoprints=True, print_full_jobpath=options.full_path, concurrency_map=options.concurrency_map, profile_methods=options.profile)
 
 	try:
 		a.wait(ignore_old_errors=not options.just_wait)
@@ -676,17 +743,7 @@ def run_automata(options, cfg):
 	module_ref = find_automata(a, options.package, options.script)
 
 	assert getarglist(module_ref.main) == ['urd'], "Only urd-enabled automatas are supported"
-	if 'URD_AUTH' in os.environ:
-		assert ':' in os.environ['URD_AUTH'], "Set $URD_AUTH to user:password"
-		user, password = os.environ['URD_AUTH'].split(':', 1)
-	else:
-		user = os.environ.get('USER')
-		if not user:
-			user = 'NO-USER'
-			print("No $URD_AUTH or $USER in environment, using %r" % (user,), file=sys.stderr)
-		password = ''
-	info = a.info()
-	urd = Urd(a, info, user, password, options.horizon, options.workdir)
+	urd = make_urd(a, options.horizon, options.workdir)
 	if options.quick:
 		a.update_method_info()
 	else:
@@ -704,6 +761,7 @@ def main(argv, cfg):
 	parser.add_argument('-f', '--flags',    default='',          help="comma separated list of flags", )
 	parser.add_argument('-q', '--quick',    action='store_true', help="skip method updates and checking workdirs for new jobs", )
 	parser.add_argument('-c', '--concurrency', action='append',  metavar='SPEC', help="set max concurrency for methods, either method=N\nor just N to set for all other methods", )
+	parser.add_argument('--profile',        action='append',     metavar='METHOD', help="profile jobs for METHOD (\"all\" for all methods),\nview the result on the board. can be specified\nseveral times", )
 	parser.add_argument('-w', '--workdir',  default=None,        help="build in this workdir\nset_workdir() and workdir= override this.", )
 	parser.add_argument('-W', '--just_wait',action='store_true', help="just wait for running job, don't run any build script", )
 	parser.add_argument('-p', '--full-path',action='store_true', help="print full path to jobdirs")
@@ -733,6 +791,7 @@ def main(argv, cfg):
 			except ValueError:
 				raise Exception('Bad concurrency spec %r' % (v,))
 	options.concurrency_map = concurrency_map
+	options.profile = set('-all-' if method == 'all' else method for method in options.profile or ())
 
 	try:
 		run_automata(options, cfg)
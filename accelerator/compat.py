@@ -46,6 +46,7 @@ if sys.version_info[0] == 2:
 		from monotonic import monotonic
 	except ImportError:
 		from time import time as monotonic
+	from time import clock as process_time # CPU time on unix
 	from types import NoneType
 	str_types = (str, unicode,)
 	int_types = (int, long,)
@@ -96,7 +97,7 @@ else:
 	imap = map
 	ifilter = filter
 	from queue import Queue, Full as QueueFull, Empty as QueueEmpty
-	from time import monotonic
+	from time import monotonic, process_time
 	NoneType = type(None)
 	str_types = (str,)
 	int_types = (int,)
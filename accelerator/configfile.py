@@ -67,7 +67,7 @@ def load_config(filename):
 
 	multivalued = {'workdirs', 'method packages', 'interpreters'}
 	required = {'slices', 'workdirs', 'method packages'}
-	known = {'target workdir', 'listen', 'urd', 'board listen', 'result directory', 'input directory', 'project directory'} | required | multivalued
+	known = {'target workdir', 'listen', 'urd', 'board listen', 'result directory', 'input directory', 'project directory', 'analysis memory'} | required | multivalued
 	cfg = {key: [] for key in multivalued}
 
 	def fixpath(fn, realpath=True):
@@ -104,6 +104,12 @@ def load_config(filename):
 		if path in (v[1] for v in cfg['workdirs']):
 			raise _E('Workdir path %r re-used' % (path,))
 
+	def parse_size(val):
+		m = re.match(r'^(\d+(?:\.\d+)?)\s*([kmgt]?)b?$', val, re.I)
+		if not m:
+			raise _E('Expected a size like 512M or 16G, not %r' % (val,))
+		return int(float(m.group(1)) * 1024 ** ' kmgt'.index(m.group(2).lower() or ' '))
+
 	def resolve_urd(val):
 		orig_val = val
 		is_local = (val[0] == 'local')
@@ -126,6 +132,7 @@ def load_config(filename):
 		'input directory': (['path'], fixpath),
 		'result directory': (['path'], fixpath),
 		'method packages': (['package', '[auto-discover]'], parse_package),
+		'analysis memory': (['size'], parse_size),
 	}
 	checkers = dict(
 		interpreter=check_interpreter,
@@ -213,6 +220,7 @@ def load_config(filename):
 			'result directory': 'result_directory',
 			'project directory': 'project_directory',
 			'board listen': 'board_listen',
+			'analysis memory': 'analysis_memory',
 		}
 		res = DotDict({rename.get(k, k): v for k, v in cfg.items()})
 		if 'listen' not in res:
@@ -21,12 +21,14 @@
 from __future__ import print_function
 from __future__ import division
 
-from threading import Thread
+from threading import Thread, Lock
 import multiprocessing
 import signal
-from os import unlink
+import traceback
+from os import unlink, readlink
 from os.path import join
 import time
+import re
 
 from accelerator import dependency
 from accelerator import dispatch
@@ -65,8 +67,12 @@ class Main:
 		WORKDIRS.clear()
 		WORKDIRS.update({k: v.path for k, v in self.workspaces.items()})
 		self.DataBase = database.DataBase(self)
+		self._db_lock = Lock()
 		self.update_database()
 		self.broken = False
+		t = Thread(target=self._refresh_loop, name='Refresh workdirs')
+		t.daemon = True
+		t.start()
 
 	def _update_methods(self):
 		print('Update methods')
@@ -113,14 +119,42 @@ class Main:
 
 
 	def add_single_jobid(self, jobid):
-		ws = self.workspaces[jobid.rsplit('-', 1)[0]]
-		ws.add_single_jobid(jobid)
-		return self.DataBase.add_single_jobid(jobid)
+		with self._db_lock:
+			ws = self.workspaces[jobid.rsplit('-', 1)[0]]
+			ws.add_single_jobid(jobid)
+			return self.DataBase.add_single_jobid(jobid)
+
+	def _refresh_loop(self):
+		while True:
+			time.sleep(1)
+			try:
+				self.refresh_database()
+			except Exception:
+				traceback.print_exc()
+
+	def refresh_database(self):
+		"""Pick up jobs finished (or removed) by others since the last update,
+		without rescanning everything."""
+		with self._db_lock:
+			new = []
+			gone = []
+			for ws in self.workspaces.values():
+				ws_new, ws_gone = ws.refresh()
+				new.extend(ws_new)
+				gone.extend(ws_gone)
+			if gone:
+				self.DataBase.remove_jobids(gone)
+			if new:
+				self.DataBase.add_jobids(new, self.Methods.hash)
 
 	def update_database(self):
 		"""Insert all new jobids (from all workdirs) in database,
 		discard all deleted or with incorrect hash.
 		"""
+		with self._db_lock:
+			self._update_database()
+
+	def _update_database(self):
 		if hasattr(multiprocessing, 'get_context') and not running_under_wsl():
 			# forkserver is apparently broken under (some versions of) WSL1
 			ctx = multiprocessing.get_context('forkserver')
@@ -157,20 +191,131 @@ class Main:
 		self.DataBase._update_finish(self.Methods.hash)
 
 
+	def workdir_jobs(self, names, since=None, offset=0, limit=None, method=(), state=()):
+		"""Jobs in workdirs names (newest first, workdirs in order) that
+		match any of the regexps in method and any of the states (current,
+		old and unfinished). Empty method or state matches everything.
+		Returns the part from offset (at most limit jobs) and the total
+		number of matching jobs.
+
+		With since (the generation token from an earlier call) only jobs
+		that changed after that are returned, matching ones as jobs and the
+		others (including removed jobs) as dropped. (Or reset=True if the
+		token is from before a server restart, then start over.)
+
+		Jobs are [jobid, listinfo, state], latest is {workdir: such a job}."""
+		method = [re.compile(m, re.IGNORECASE) for m in method]
+		def matches(info, state_):
+			if state and state_ not in state:
+				return False
+			return not method or any(m.search(info['method']) for m in method)
+		def job_state(info):
+			if info['totaltime'] is None:
+				return 'unfinished'
+			elif info['current']:
+				return 'current'
+			else:
+				return 'old'
+		with self._db_lock:
+			if since is not None:
+				# Only the changes, without looking at the whole joblists.
+				changed = [(name, self.DataBase.changes(self.workspaces[name], since)) for name in names]
+			else:
+				joblists = [(name, self.DataBase.joblist(self.workspaces[name])) for name in names]
+			res = DotDict(generation=self.DataBase.generation_token(), latest={})
+			for name in names:
+				try:
+					latest = readlink(join(self.workspaces[name].path, name + '-LATEST'))
+				except OSError:
+					continue
+				info = self.DataBase.db_by_workdir[name].get(latest)
+				if info:
+					res.latest[name] = [latest, info, job_state(info)]
+			if since is not None:
+				if any(jids is None for _, jids in changed):
+					res.reset = True
+					return res
+				res.jobs = []
+				res.dropped = []
+				for name, jids in changed:
+					ws = self.workspaces[name]
+					for jid in sorted(jids, key=lambda jid: int(jid.rsplit('-', 1)[1]), reverse=True):
+						info = self.DataBase.listinfo(ws, jid)
+						if info is None:
+							res.dropped.append(jid) # no longer exists
+							continue
+						state_ = job_state(info)
+						if matches(info, state_):
+							res.jobs.append([jid, info, state_])
+						else:
+							res.dropped.append(jid)
+				return res
+			matching = []
+			for name, joblist in joblists:
+				for jid, info in joblist:
+					state_ = job_state(info)
+					if matches(info, state_):
+						matching.append([jid, info, state_])
+		res.total = len(matching)
+		if limit is None:
+			res.jobs = matching[offset:]
+		else:
+			res.jobs = matching[offset:offset + limit]
+		return res
+
+	# The database is updated in place by refresh_database (from another
+	# thread), so everything that looks in it has to hold _db_lock.
+
+	def workdir_listing(self, name):
+		"""{jobid: listinfo} for all jobs in workdir name"""
+		with self._db_lock:
+			return dict(self.DataBase.db_by_workdir.get(name, {}))
+
+	def job_is_current(self, job):
+		with self._db_lock:
+			info = self.DataBase.db_by_workdir.get(job.workdir, {}).get(job)
+			return bool(info and info['current'])
+
+	def jobs_with_source(self, method, source, options={}):
+		"""[jobid] of current jobs of method made from dataset source
+		(and with these options), newest first"""
+		with self._db_lock:
+			return self.DataBase.jobs_with_source(method, source, options)
+
+	def method2job(self, method, num, start_from=None):
+		"""{'id': jobid} for the current job with method num jobs back from
+		start_from (or the newest), or {'error': message}"""
+		with self._db_lock:
+			jobs = self.DataBase.db_by_method.get(method, ())
+			start_ix = 0
+			if start_from:
+				for start_ix, job in enumerate(jobs):
+					if job.id == start_from:
+						break
+				else:
+					return {'error': '%s is not a current %s job' % (start_from, method,)}
+			if not jobs:
+				return {'error': 'no current jobs with method %s available' % (method,)}
+			elif num + start_ix >= len(jobs):
+				return {'error': 'tried to go %d jobs back from %s, but only %d earlier (current) jobs available' % (num, jobs[start_ix].id, len(jobs) - start_ix - 1,)}
+			else:
+				return {'id': jobs[num + start_ix].id}
+
 	def initialise_jobs(self, setup, workdir=None):
 		""" Updata database, check deps, create jobids. """
 		ws = workdir or self.target_workdir
 		if ws not in self.workspaces:
 			raise Exception("Workdir %s does not exist" % (ws,))
-		return dependency.initialise_jobs(
-			setup,
-			self.workspaces[ws],
-			self.DataBase,
-			self.Methods,
-		)
+		with self._db_lock:
+			return dependency.initialise_jobs(
+				setup,
+				self.workspaces[ws],
+				self.DataBase,
+				self.Methods,
+			)
 
 
-	def run_job(self, jobid, subjob_cookie=None, parent_pid=0, concurrency=None):
+	def run_job(self, jobid, subjob_cookie=None, parent_pid=0, concurrency=None, profile=False):
 		W = self.workspaces[Job(jobid).workdir]
 		#
 		active_workdirs = {name: ws.path for name, ws in self.workspaces.items()}
@@ -179,7 +324,7 @@ class Main:
 		t0 = time.time()
 		setup = update_setup(jobid, starttime=t0)
 		prof = setup.get('exectime', DotDict())
-		new_prof, files, subjobs = dispatch.launch(W.path, setup, self.config, self.Methods, active_workdirs, slices, concurrency, self.debug, self.server_url, subjob_cookie, parent_pid)
+		new_prof, files, subjobs, iostats = dispatch.launch(W.path, setup, self.config, self.Methods, active_workdirs, slices, concurrency, self.debug, self.server_url, subjob_cookie, parent_pid, profile)
 		prefix = join(W.path, jobid) + '/'
 		if not self.debug:
 			for filename, temp in list(files.items()):
@@ -199,6 +344,7 @@ class Main:
 		update_setup(jobid, **data)
 		data['files'] = sorted(fn[len(prefix):] if fn.startswith(prefix) else fn for fn in files)
 		data['subjobs'] = subjobs
+		data['iostats'] = iostats
 		data['version'] = 1
 		json_save(data, jobid.filename('post.json'))
 
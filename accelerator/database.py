@@ -24,10 +24,13 @@ from __future__ import division
 from collections import defaultdict
 from operator import attrgetter
 from collections import namedtuple
+from bisect import bisect_left
+from random import getrandbits
 
 from accelerator.compat import iteritems, itervalues
 
 from accelerator.extras import _job_params, job_post, OptionEnum, OptionDefault
+from accelerator.setupfile import load_setup
 
 
 Job = namedtuple('Job', 'id method optset hash time total')
@@ -88,17 +91,130 @@ class DataBase:
 		global _control
 		assert not _control, "Only one DataBase instance allowed"
 		_control = control
+		# Every change to db_by_workdir (and to the set of unfinished jobs)
+		# gets a new generation, so clients can ask for just what changed
+		# since the generation they have. Clients get it as a token with
+		# a per process server id, so a restarted server can tell.
+		self.generation = 0
+		self.server_id = '%08x' % (getrandbits(32),)
+		self.db_by_workdir = defaultdict(dict)
+		self._changes = defaultdict(list) # workdir: [(generation, jobid)], oldest first
+		self._unfinished = defaultdict(set) # workdir: jobids
+		self._unfinished_info = {}
+		self._joblists = {} # workdir: (generation, [(jobid, listinfo)])
+
+	def _changed(self, jobid):
+		self.generation += 1
+		self._changes[jobid.rsplit('-', 1)[0]].append((self.generation, jobid,))
+
+	def generation_token(self):
+		return '%s:%d' % (self.server_id, self.generation,)
+
+	def _finished(self, jobid):
+		wd = jobid.rsplit('-', 1)[0]
+		self._unfinished[wd].discard(jobid)
+		self._unfinished_info.pop(jobid, None)
 
 	def _update_begin(self):
 		self._fsjid = set()
 
 	def add_single_jobid(self, jobid):
+		ws = _control.workspaces[jobid.rsplit('-', 1)[0]]
+		ws.index.add(jobid, ws.mtimes.get(jobid), _paramsdict[jobid])
+		ws.index.flush()
 		setup = _paramsdict[jobid][0]
 		job = _mkjob(setup)
+		self._forget_current(jobid)
 		self.db_by_method[job.method].insert(0, job)
 		self.db_by_workdir[job.id.rsplit('-', 1)[0]][job.id] = _mklistinfo(setup)
+		self._finished(job.id)
+		self._changed(job.id)
 		return job
 
+	def add_jobids(self, jobids, dict_of_hashes):
+		"""Insert jobs that were found after the last full update (probably
+		built by another server). Same filtering as _update_finish."""
+		for jobid in jobids:
+			ws = _control.workspaces[jobid.rsplit('-', 1)[0]]
+			ws.index.add(jobid, ws.mtimes.get(jobid), _paramsdict[jobid])
+		for ws in _control.workspaces.values():
+			ws.index.flush()
+		todo = {jobid: _paramsdict[jobid] for jobid in jobids}
+		def add(jobid):
+			setup, subjobs = todo.pop(jobid)
+			# Subjobs start after their parents, but must be added first.
+			for j in subjobs:
+				if j in todo:
+					add(j)
+			self._forget_current(setup.jobid)
+			li = _mklistinfo(setup)
+			li['current'] = (
+				setup.hash in dict_of_hashes.get(setup.method, ()) and
+				all(self.db_by_workdir[j.rsplit('-', 1)[0]].get(j, {}).get('current') for j in subjobs)
+			)
+			self.db_by_workdir[setup.jobid.rsplit('-', 1)[0]][setup.jobid] = li
+			self._finished(setup.jobid)
+			self._changed(setup.jobid)
+			if li['current']:
+				job = _mkjob(setup)
+				l = self.db_by_method[job.method]
+				# Newest first
+				ix = 0
+				while ix < len(l) and l[ix].time > job.time:
+					ix += 1
+				l.insert(ix, job)
+		for jobid in sorted(todo, key=lambda jobid: todo[jobid][0].starttime):
+			if jobid in todo:
+				add(jobid)
+
+	def remove_jobids(self, jobids):
+		"""Drop jobs whose directories are gone (probably removed by hand
+		or by another server) without a full update. Jobs that have them
+		as subjobs are no longer current."""
+		gone = set(jobids)
+		for jobid in gone:
+			_control.workspaces[jobid.rsplit('-', 1)[0]].index.remove(jobid)
+			self._forget_current(jobid)
+			self.db_by_workdir[jobid.rsplit('-', 1)[0]].pop(jobid, None)
+			_paramsdict.pop(jobid, None)
+			self._finished(jobid)
+			self._changed(jobid)
+		while gone:
+			parents = {}
+			for setup, subjobs in itervalues(_paramsdict):
+				if gone.intersection(subjobs):
+					li = self.db_by_workdir[setup.jobid.rsplit('-', 1)[0]].get(setup.jobid)
+					if li and li['current']:
+						parents[setup.jobid] = li
+			for jobid, li in iteritems(parents):
+				self._forget_current(jobid)
+				li['current'] = False
+				self._changed(jobid)
+			gone = set(parents)
+
+	def jobs_with_source(self, method, source, options):
+		"""Current jobs of method that have source as datasets.source and
+		the values in options as options, newest first. The params are
+		already in memory, so this does not read anything from disk."""
+		def dsname(name):
+			name = name or ''
+			return name[:-len('/default')] if name.endswith('/default') else name
+		source = dsname(source)
+		res = []
+		for job in self.db_by_method.get(method, ()):
+			setup = _paramsdict[job.id][0]
+			if dsname(setup.datasets.get('source')) != source:
+				continue
+			if all(setup.options.get(k) == v for k, v in iteritems(options)):
+				res.append(job.id)
+		return res
+
+	def _forget_current(self, jobid):
+		li = self.db_by_workdir[jobid.rsplit('-', 1)[0]].get(jobid)
+		if li and li['current']:
+			l = self.db_by_method[li['method']]
+			l[:] = [job for job in l if job.id != jobid]
+
 	def _update_workspace(self, WorkSpace, pool, verbose=False):
 		"""Insert all items in WorkSpace in database (call update_finish too)"""
 		if verbose:
@@ -109,9 +225,19 @@ class DataBase:
 			print('DATABASE:  update found these jobids in workdir', filesystem_jobids)
 		# Insert any new jobids, including with invalid hash
 		new_jobids = filesystem_jobids.difference(_paramsdict)
+		index = WorkSpace.index
+		for jobid in list(new_jobids):
+			params = index.get(jobid, WorkSpace.mtimes.get(jobid))
+			if params:
+				_paramsdict[jobid] = params
+				new_jobids.discard(jobid)
 		if new_jobids:
-			_paramsdict.update(pool.imap_unordered(_get_params, new_jobids, chunksize=64))
+			for jobid, params in pool.imap_unordered(_get_params, new_jobids, chunksize=64):
+				_paramsdict[jobid] = params
+				index.add(jobid, WorkSpace.mtimes.get(jobid), params)
+		index.flush(filesystem_jobids)
 		if verbose:
+			print("DATABASE:  %d jobs loaded from disk, the rest from the index" % (len(new_jobids),))
 			print("DATABASE:  Database \"%s\" contains %d potential items" % (WorkSpace.name, len(filesystem_jobids), ))
 
 	def _update_finish(self, dict_of_hashes, verbose=False):
@@ -123,6 +249,7 @@ class DataBase:
 		for j in set(_paramsdict) - self._fsjid:
 			del _paramsdict[j]
 		discarded_due_to_hash_list = []
+		old_db_by_workdir = self.db_by_workdir
 		self.db_by_workdir = defaultdict(dict) # includes all known jobs, not just current ones.
 
 		# Keep only jobs with valid hashes.
@@ -152,6 +279,16 @@ class DataBase:
 				if jid not in job_candidates:
 					li['current'] = False
 
+		for name in set(old_db_by_workdir) | set(self.db_by_workdir):
+			old, new = old_db_by_workdir.get(name, {}), self.db_by_workdir.get(name, {})
+			for jid in set(old) | set(new):
+				if old.get(jid) != new.get(jid):
+					self._changed(jid)
+		# Anything could have changed, so look at all jobs.
+		for ws in itervalues(_control.workspaces):
+			ws.known_changes.clear()
+			self._update_unfinished(ws, ws.known_jobids | self._unfinished[ws.name])
+
 		# Keep lists of jobs per method, only with valid hashes and subjobs.
 		self.db_by_method = defaultdict(list)
 		for setup, _ in itervalues(job_candidates):
@@ -165,6 +302,76 @@ class DataBase:
 				print("DATABASE:  discarding due to unknown hash: %s" % ', '.join(discarded_due_to_hash_list))
 			print("DATABASE:  Full database contains %d items" % (sum(len(v) for v in itervalues(self.db_by_method)),))
 
+	def _update_unfinished(self, ws, jobids):
+		"""Update the unfinished jobs in ws for jobids, which are all known
+		jobs that may have changed (appeared, gone or finished)."""
+		known = self.db_by_workdir[ws.name]
+		unfinished = self._unfinished[ws.name]
+		for jid in jobids:
+			if jid in ws.known_jobids and jid not in known:
+				if jid not in unfinished:
+					unfinished.add(jid)
+					self._changed(jid)
+			elif jid in unfinished:
+				unfinished.discard(jid)
+				self._unfinished_info.pop(jid, None)
+				self._changed(jid)
+
+	def _sync_unfinished(self, ws):
+		"""Pick up the changes to ws.known_jobids since last time."""
+		jobids = set()
+		while ws.known_changes:
+			jobids.add(ws.known_changes.pop())
+		self._update_unfinished(ws, jobids)
+
+	def joblist(self, ws):
+		"""All jobs in WorkSpace ws, including unfinished ones, as
+		[(jobid, listinfo)] newest first. Unfinished jobs have
+		totaltime=None."""
+		self._sync_unfinished(ws)
+		generation, res = self._joblists.get(ws.name, (None, None))
+		if generation != self.generation:
+			res = [(jid, self._unfinished_listinfo(jid)) for jid in self._unfinished[ws.name]]
+			res.extend(iteritems(self.db_by_workdir[ws.name]))
+			res.sort(key=lambda item: int(item[0].rsplit('-', 1)[1]), reverse=True)
+			self._joblists[ws.name] = (self.generation, res)
+		return res
+
+	def listinfo(self, ws, jobid):
+		"""listinfo for jobid in WorkSpace ws (as in joblist), or None
+		if there is no such job."""
+		if jobid in self._unfinished[ws.name]:
+			return self._unfinished_listinfo(jobid)
+		return self.db_by_workdir[ws.name].get(jobid)
+
+	def changes(self, ws, token):
+		"""jobids in WorkSpace ws that changed after the generation in
+		token (from generation_token), or None if token is not from
+		this server process."""
+		server_id, _, generation = token.partition(':')
+		if server_id != self.server_id:
+			return None
+		try:
+			since = int(generation)
+		except ValueError:
+			return None
+		if since > self.generation:
+			return None
+		self._sync_unfinished(ws)
+		changes = self._changes[ws.name]
+		return set(jid for _, jid in changes[bisect_left(changes, (since + 1,)):])
+
+	def _unfinished_listinfo(self, jobid):
+		info = self._unfinished_info.get(jobid)
+		if not info:
+			try:
+				method = load_setup(jobid).method
+			except Exception:
+				# Probably so new that setup.json isn't written yet.
+				return dict(method='???', totaltime=None, current=False)
+			info = self._unfinished_info[jobid] = dict(method=method, totaltime=None, current=False)
+		return info
+
 	def match_complex(self, reqlist):
 		for method, uid, opttuple in reqlist:
 			# These are already sorted newest to oldest.
@@ -180,3 +387,38 @@ class DataBase:
 				if opttuple == job.optset:
 					yield uid, job
 					break
+
+	def match_closest(self, method, optset):
+		"""Find the current jobs that differ from optset in the fewest options.
+		Returns a list of (job, the options in optset the job does not have),
+		with only the newest job for each set of differing options.
+		This gives the same result (in the same order) as trying
+		match_complex with ever smaller subsets of optset from
+		itertools.combinations, but in linear time.
+		"""
+		newest = {}
+		for ix, job in enumerate(self.db_by_method[method]):
+			# These are already sorted newest to oldest.
+			missing = frozenset(optset - job.optset)
+			if missing not in newest:
+				newest[missing] = (ix, job)
+		if not newest:
+			return []
+		mincount = min(len(missing) for missing in newest)
+		if mincount:
+			# Ordered like combinations(optset, mincount), which is by position.
+			opts = list(optset)
+			position = {opt: pos for pos, opt in enumerate(opts)}
+			res = sorted(
+				(tuple(sorted(position[opt] for opt in missing)), job)
+				for missing, (ix, job) in iteritems(newest) if len(missing) == mincount
+			)
+			return [(job, tuple(opts[pos] for pos in positions)) for positions, job in res]
+		# Some job has everything in optset (and more), so removing any
+		# single option matches that job, or a newer one missing only that.
+		res = {}
+		superset = newest[frozenset()]
+		for opt in optset:
+			ix, job = min(superset, newest.get(frozenset((opt,)), superset))
+			res[job.id] = (job, (opt,))
+		return list(res.values())
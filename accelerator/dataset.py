@@ -38,7 +38,8 @@ from accelerator.compat import builtins, open, getarglist, izip, izip_longest
 from accelerator.compat import str_types, int_types, FileNotFoundError
 
 from accelerator import blob
-from accelerator.extras import DotDict, job_params, _ListTypePreserver, quote
+from accelerator import iostats
+from accelerator.extras import DotDict, job_params, _ListTypePreserver, quote, json_encode
 from accelerator.job import Job
 from accelerator.dsutil import typed_writer, _type2iter
 from accelerator.error import NoSuchDatasetError, DatasetUsageError, DatasetError
@@ -376,17 +377,24 @@ class Dataset(unicode):
 		_datasets_written.append(name)
 		return job.dataset(name) # new_ds has the wrong string value, so we must make a new instance here.
 
-	def _column_iterator(self, sliceno, col, _type=None, **kw):
+	def _column_iterator(self, sliceno, col, _type=None, _count_rows=False, **kw):
 		if sliceno is not None and self.lines[sliceno] == 0:
 			return _dummy_iter
 		dc = self.columns[col]
 		mkiter = partial(_type2iter[_type or dc.type], compression=dc.compression, **kw)
 		def one_slice(sliceno):
 			fn = self.column_filename(col, sliceno)
+			if iostats.enabled:
+				stats = iostats.reader(unicode(self), col, sliceno, _count_rows)
+			else:
+				stats = None
 			if dc.offsets:
-				return mkiter(fn, seek=dc.offsets[sliceno], want_count=self.lines[sliceno])
+				it = mkiter(fn, seek=dc.offsets[sliceno], want_count=self.lines[sliceno], stats=stats)
 			else:
-				return mkiter(fn, want_count=self.lines[sliceno])
+				it = mkiter(fn, want_count=self.lines[sliceno], stats=stats)
+			if stats:
+				iostats.track(it, _count_rows)
+			return it
 		if sliceno is None:
 			from accelerator.g import slices
 			from itertools import chain
@@ -399,11 +407,13 @@ class Dataset(unicode):
 		not_found = []
 		for col in columns or sorted(self.columns):
 			if col in self.columns:
+				# All columns have the same number of rows, so count the first.
+				count_rows = not res
 				if copy_mode:
 					t = _copy_mode_overrides.get(self.columns[col].type)
-					res.append(self._column_iterator(sliceno, col, _type=t))
+					res.append(self._column_iterator(sliceno, col, _type=t, _count_rows=count_rows))
 				else:
-					res.append(self._column_iterator(sliceno, col))
+					res.append(self._column_iterator(sliceno, col, _count_rows=count_rows))
 			else:
 				not_found.append(col)
 		if not_found:
@@ -449,6 +459,81 @@ class Dataset(unicode):
 		"""Iterate just this dataset. See .iterate_list for details."""
 		return self.iterate_list(sliceno, columns, [self], hashlabel=hashlabel, pre_callback=pre_callback, post_callback=post_callback, filters=filters, translators=translators, status_reporting=status_reporting, rehash=rehash, slice=slice, copy_mode=copy_mode)
 
+	def lookup(self, column, value, columns=None, index=None):
+		"""Lines where column == value, found with a dataset_index job
+		for this dataset and column. Specify index to use a specific
+		one, otherwise the newest one the server knows about is used
+		(which only works from a job).
+		columns are as for iterate (default all of them). Columns that
+		are not in the index are read from the dataset, skipping over the
+		lines that don't match.
+		Lines are returned in order (by slice, then line in the slice)."""
+		index, info = self._index(column, index)
+		if columns is None:
+			columns = sorted(self.columns)
+		if isinstance(columns, str_types):
+			want = [columns]
+			get = itemgetter(columns)
+		else:
+			want = columns
+			get = lambda d: tuple(d[n] for n in columns)
+		missing = set(want) - set(self.columns)
+		if missing:
+			raise DatasetUsageError("Columns %r are not in %s" % (sorted(missing), self,))
+		return [get(d) for _, _, d in self._lookup(column, value, index, info, columns=want)]
+
+	def _index(self, column, index=None):
+		if index is None:
+			from accelerator import g
+			server_url = getattr(g, 'server_url', None)
+			if server_url:
+				index = find_index(server_url, self, column)
+			if not index:
+				raise DatasetError("No index for %s in %s, build dataset_index with source=%r and column=%r" % (column, self, self, column,))
+		index = Job(index)
+		info = index.load()
+		if info['source'] != self or info['column'] != column:
+			raise DatasetUsageError("%s is an index for %s in %s, not %s in %s" % (index, info['column'], info['source'], column, self,))
+		return index, info
+
+	def _lookup(self, column, value, index, info, sliceno=None, columns=None):
+		"""(sliceno, lineno, {column: value}) for lines where column == value,
+		with the columns in the index and columns (read from the dataset)"""
+		from struct import unpack
+		import zlib
+		from accelerator.compat import pickle
+		from accelerator.g import slices
+		h = typed_writer(self.columns[column].type).hash(value)
+		if sliceno is not None:
+			want_slices = [sliceno]
+		elif self.hashlabel == column and value is not None:
+			want_slices = [h % slices]
+		else:
+			want_slices = range(slices)
+		read_columns = [n for n in columns or () if n not in info['columns']]
+		for sliceno in want_slices:
+			if not self.lines[sliceno]:
+				continue
+			with index.open('index', 'rb', sliceno=sliceno) as fh:
+				nbuckets, = unpack('<Q', fh.read(8))
+				fh.seek(8 + 8 * (h // slices % nbuckets))
+				start, end = unpack('<2Q', fh.read(16))
+				fh.seek(start)
+				bucket = pickle.loads(zlib.decompress(fh.read(end - start)))
+			readers = None
+			pos = 0
+			for line in bucket:
+				if line[1] == value:
+					d = dict(zip(info['columns'], line[1:]))
+					if read_columns:
+						if readers is None:
+							readers = [self._column_iterator(sliceno, n) for n in read_columns]
+						for n, reader in zip(read_columns, readers):
+							reader.skip(line[0] - pos)
+							d[n] = next(reader)
+						pos = line[0] + 1
+					yield sliceno, line[0], d
+
 	@staticmethod
 	def iterate_list(sliceno, columns, datasets, range=None, sloppy_range=False, hashlabel=None, pre_callback=None, post_callback=None, filters=None, translators=None, status_reporting=True, rehash=False, slice=None, copy_mode=False):
 		"""Iterator over the specified columns from datasets
@@ -1388,10 +1473,15 @@ class DatasetWriter(object):
 	def _close(self, sliceno, writers):
 		lens = {}
 		minmax = {}
+		if iostats.enabled:
+			from accelerator.g import job
+			ds_name = unicode(job) if self.name == 'default' else '%s/%s' % (job, self.name,)
 		for k, w in writers.items():
 			lens[k] = w.count
 			minmax[k] = (w.min, w.max,)
 			w.close()
+			if iostats.enabled:
+				iostats.written(ds_name, k, sliceno, w)
 		len_set = set(lens.values())
 		if len(len_set) != 1:
 			raise DatasetUsageError("Not all columns have the same linecount in slice %d: %r" % (sliceno, lens))
@@ -1535,6 +1625,16 @@ class DatasetChain(_ListTypePreserver):
 		return Dataset.iterate_list(sliceno, columns, self, range=range, sloppy_range=sloppy_range, hashlabel=hashlabel, pre_callback=pre_callback, post_callback=post_callback, filters=filters, translators=translators, status_reporting=status_reporting, rehash=rehash, slice=slice, copy_mode=copy_mode)
 
 
+def find_index(server_url, ds, column):
+	"""The newest dataset_index job for column in ds that the server at
+	server_url knows about, or None"""
+	from accelerator.unixhttp import call
+	from accelerator.compat import urlencode
+	args = dict(source=ds, options=json_encode(dict(column=column), as_str=True))
+	res = call(server_url + '/jobs_with_source/dataset_index?' + urlencode(args))
+	if res:
+		return Job(res[0])
+
 def range_check_function(bottom, top):
 	"""Returns a function that checks if bottom <= arg < top, allowing bottom and/or top to be None"""
 	import operator
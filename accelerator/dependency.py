@@ -22,7 +22,6 @@ from __future__ import division
 
 from random import randint
 from collections import OrderedDict, defaultdict
-from itertools import combinations
 from copy import deepcopy
 
 from accelerator.compat import iteritems
@@ -37,23 +36,18 @@ def find_possible_jobs(db, methods, job):
 	optset = methods.params2optset(params)
 	if not optset:
 		return {}
-	def inner():
-		for uid, job in db.match_exact([(method, 0, optset,)]):
-			yield job.id, ()
-			return # no depjobs is enough - stop
-		for remset in combinations(optset, remcount):
-			for uid, job in db.match_complex([(method, 0, optset - set(remset),)]):
-				yield job.id, remset
-	res = {}
-	remcount = 0
-	while not res:
-		remcount += 1
-		for jobid, remset in inner():
-			remset = tuple(s.split()[1] for s in remset)
-			res[jobid] = remset
-		if remcount == len(optset):
-			break
-	return dict(_job_candidates_options(res))
+	return dict(_job_candidates_options(_find_candidates(db, method, optset)))
+
+def _find_candidates(db, method, optset):
+	"""The closest current jobs, as {jobid: names of the options in optset
+	that differ}"""
+	res = OrderedDict()
+	for uid, job in db.match_exact([(method, 0, optset,)]):
+		res[job.id] = () # no depjobs is enough
+	if not res:
+		for job, remset in db.match_closest(method, optset):
+			res[job.id] = tuple(s.split()[1] for s in remset)
+	return res
 
 def _job_candidates_options(candidates):
 	for jobid, remset in iteritems(candidates):
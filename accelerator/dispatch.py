@@ -76,7 +76,7 @@ def run(cmd, close_in_child, keep_in_child, no_stdin=True):
 	os.execv(cmd[0], cmd)
 	os._exit()
 
-def launch(workdir, setup, config, Methods, active_workdirs, slices, concurrency, debug, server_url, subjob_cookie, parent_pid):
+def launch(workdir, setup, config, Methods, active_workdirs, slices, concurrency, debug, server_url, subjob_cookie, parent_pid, profile=False):
 	starttime = monotonic()
 	jobid = setup.jobid
 	method = setup.method
@@ -98,6 +98,8 @@ def launch(workdir, setup, config, Methods, active_workdirs, slices, concurrency
 		subjob_cookie=subjob_cookie,
 		parent_pid=parent_pid,
 		debuggable=config.debuggable,
+		profile=profile,
+		analysis_memory=config.get('analysis_memory'),
 	)
 	from accelerator.runner import runners
 	runner = runners[Methods.db[method].version]
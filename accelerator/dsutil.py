@@ -99,6 +99,15 @@ class WriteJson(object):
 	@property
 	def compression(self):
 		return self.fh.compression
+	@property
+	def compressed_bytes(self):
+		return self.fh.compressed_bytes
+	@property
+	def uncompressed_bytes(self):
+		return self.fh.uncompressed_bytes
+	@property
+	def compress_time(self):
+		return self.fh.compress_time
 	def close(self):
 		self.fh.close()
 	def __enter__(self):
@@ -126,6 +135,8 @@ class ReadJson(object):
 	def __next__(self):
 		return self.decode(next(self.fh))
 	next = __next__
+	def skip(self, count):
+		self.fh.skip(count)
 	def close(self):
 		self.fh.close()
 	def __iter__(self):
@@ -151,6 +162,15 @@ class WritePickle(object):
 	@property
 	def compression(self):
 		return self.fh.compression
+	@property
+	def compressed_bytes(self):
+		return self.fh.compressed_bytes
+	@property
+	def uncompressed_bytes(self):
+		return self.fh.uncompressed_bytes
+	@property
+	def compress_time(self):
+		return self.fh.compress_time
 	def close(self):
 		self.fh.close()
 	def __enter__(self):
@@ -166,6 +186,8 @@ class ReadPickle(object):
 	def __next__(self):
 		return pickle_loads(next(self.fh))
 	next = __next__
+	def skip(self, count):
+		self.fh.skip(count)
 	def close(self):
 		self.fh.close()
 	def __iter__(self):
@@ -25,8 +25,9 @@ import os
 import datetime
 import json
 from traceback import print_exc
-from collections import OrderedDict
+from collections import OrderedDict, Counter
 import sys
+from functools import partial
 
 from accelerator.compat import PY2, PY3, pickle, izip, iteritems, first_value
 from accelerator.compat import num_types, uni, unicode, str_types
@@ -103,6 +104,47 @@ def pickle_load(filename='result.pickle', jobid=None, sliceno=None, encoding='by
 			else:
 				return pickle.load(fh)
 
+# For analysis results, which are only loaded by the same python that saved
+# them. Buffers (numpy arrays and such) are written raw to a separate file,
+# which is then mapped instead of read and copied when loading. The mapping
+# is copy-on-write, so the loaded arrays are still writable.
+# This needs pickle protocol 5 (python 3.8), older pythons just pickle.
+_BUFFER_ALIGN = 64
+
+def _pickle_save_buffers(variable, filename, sliceno=None, temp=None):
+	if sys.version_info < (3, 8):
+		return pickle_save(variable, filename, sliceno, temp)
+	filename = _fn(filename, None, sliceno)
+	buffers = []
+	with FileWriteMove(filename, temp) as fh:
+		pickle.Pickler(fh, 5, buffer_callback=buffers.append).dump(variable)
+	if buffers:
+		buffers = [buf.raw() for buf in buffers]
+		with FileWriteMove(filename + '.buffers', temp) as fh:
+			pickle.dump([buf.nbytes for buf in buffers], fh, 5)
+			for buf in buffers:
+				fh.write(b'\0' * (-fh.tell() % _BUFFER_ALIGN))
+				fh.write(buf)
+
+def _pickle_load_buffers(filename, sliceno=None):
+	if sys.version_info < (3, 8):
+		return pickle_load(filename, sliceno=sliceno)
+	import mmap
+	filename = _fn(filename, None, sliceno)
+	buffers = []
+	if os.path.exists(filename + '.buffers'):
+		with open(filename + '.buffers', 'rb') as fh:
+			lengths = pickle.load(fh)
+			pos = fh.tell()
+			m = memoryview(mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_COPY))
+		for length in lengths:
+			pos += -pos % _BUFFER_ALIGN
+			buffers.append(m[pos:pos + length])
+			pos += length
+	with status('Loading ' + filename):
+		with open(filename, 'rb') as fh:
+			return pickle.load(fh, buffers=buffers)
+
 
 def json_encode(variable, sort_keys=True, as_str=False):
 	"""Return variable serialised as json bytes (or str with as_str=True).
@@ -242,28 +284,137 @@ class FileWriteMove(object):
 				print_exc()
 
 class ResultIter(object):
-	def __init__(self, slices):
+	def __init__(self, slices, wait_for=None, parts=None, merge_parts=None):
+		"""wait_for(sliceno) is called before loading the results from
+		a slice, so they can be loaded while other slices still run.
+		parts is {sliceno: count} for slices where analysis was split,
+		the results from those parts are combined with merge_parts(a, b)
+		(from the method) here, or merged like merge_auto if there is no
+		merge_parts (but then it is an error for parts to have the same
+		key in a dict, that would overwrite instead of combine)."""
+		self.slices = slices
+		self._parts = parts or {}
+		self._merge_parts = merge_parts
+		self._merged = {}
 		slices = range(slices)
 		self._slices = iter(slices)
+		self._wait_for = wait_for or (lambda sliceno: None)
+		self._wait_for(0)
 		tuple_len = pickle_load("Analysis.tuple")
 		if tuple_len is False:
 			self._is_tupled = False
+			self._names = ["Analysis."]
 		else:
 			self._is_tupled = True
+			self._names = ["Analysis.%d." % (ix,) for ix in range(tuple_len)]
 			self._loaders = [self._loader(ix, iter(slices)) for ix in range(tuple_len)]
 			self._tupled = izip(*self._loaders)
 	def __iter__(self):
 		return self
+	def _files(self, name, sliceno):
+		"""[(name, sliceno)] to load for this slice, in order"""
+		parts = self._parts.get(sliceno)
+		if parts:
+			return [(_part_name(name, partno), sliceno) for partno in range(parts)]
+		else:
+			return [(name, sliceno)]
+	def _load(self, name, sliceno, ix=-1):
+		self._wait_for(sliceno)
+		if sliceno not in self._parts:
+			return _pickle_load_buffers(name, sliceno)
+		if self._merge_parts:
+			return self._load_merged(sliceno, ix)
+		files = self._files(name, sliceno)
+		return _merge_auto((_pickle_load_buffers(*part) for part in files), ix, parts=True)
+	def _load_merged(self, sliceno, ix):
+		"""merge_parts takes whole results, so with a tuple all items of
+		the slice are combined when the first one is loaded."""
+		if sliceno not in self._merged:
+			def load(partno):
+				items = [_pickle_load_buffers(_part_name(name, partno), sliceno) for name in self._names]
+				return tuple(items) if self._is_tupled else items[0]
+			res = load(0)
+			for partno in range(1, self._parts[sliceno]):
+				res = self._merge_parts(res, load(partno))
+			if not self._is_tupled:
+				return res
+			if not isinstance(res, tuple) or len(res) != len(self._names):
+				raise Exception("merge_parts should return a tuple of length %d for slice %d" % (len(self._names), sliceno,))
+			self._merged[sliceno] = dict(enumerate(res))
+		items = self._merged[sliceno]
+		res = items.pop(ix)
+		if not items:
+			del self._merged[sliceno]
+		return res
+	def _load_all(self, sliceno):
+		"""All items for sliceno (one per name)"""
+		return [self._load(name, sliceno, ix if self._is_tupled else -1) for ix, name in enumerate(self._names)]
 	def _loader(self, ix, slices):
 		for sliceno in slices:
-			yield pickle_load("Analysis.%d." % (ix,), sliceno=sliceno)
+			yield self._load("Analysis.%d." % (ix,), sliceno, ix)
 	def __next__(self):
 		if self._is_tupled:
 			return next(self._tupled)
 		else:
-			return pickle_load("Analysis.", sliceno=next(self._slices))
+			return self._load("Analysis.", next(self._slices))
 	next = __next__
 
+def _part_name(name, partno):
+	return '%spart%d.' % (name, partno,)
+
+def _merge_auto(it, ix, exc=Exception, parts=False):
+	"""parts=True when merging the parts of one split slice. Those
+	have the same keys as often as not, so then it is an error to have
+	the same key in a plain dict (or a non-mergeable top level)."""
+	# find a non-empty one, so we can look at the data in it
+	data = next(it)
+	if isinstance(data, num_types):
+		# special case for when you have something like (count, dict)
+		return sum(it, data)
+	if isinstance(data, list):
+		for part in it:
+			data.extend(part)
+		return data
+	while not data:
+		try:
+			data = next(it)
+		except StopIteration:
+			# All were empty, return last one
+			return data
+	depth = 0
+	to_check = data
+	while hasattr(to_check, "values"):
+		if not to_check:
+			raise exc("Empty value at depth %d (index %d)" % (depth, ix,))
+		to_check = first_value(to_check)
+		depth += 1
+	if hasattr(to_check, "update"): # like a set
+		depth += 1
+	if not depth:
+		if parts:
+			raise exc("Top level has no .values (index %d), define merge_parts in the method to combine the parts of split slices" % (ix,))
+		raise exc("Top level has no .values (index %d)" % (ix,))
+	def upd(aggregate, part, level):
+		if level == depth:
+			if parts and isinstance(aggregate, dict) and not isinstance(aggregate, Counter):
+				for k in part:
+					if k in aggregate:
+						raise exc("Parts of a split slice both have %r (index %d), merging would overwrite it. Use a Counter or define merge_parts in the method." % (k, ix,))
+			aggregate.update(part)
+		else:
+			for k, v in iteritems(part):
+				if k in aggregate:
+					upd(aggregate[k], v, level + 1)
+				else:
+					aggregate[k] = v
+	for part in it:
+		upd(data, part, 1)
+	return data
+
+# merge_auto is done in parallel when the pickled analysis results are
+# at least this large.
+_PARALLEL_MERGE_SIZE = 32 * 1024 * 1024
+
 class ResultIterMagic(object):
 	"""Wrap a ResultIter to give magic merging functionality,
 	and so that you get an error if you attempt to use it after it is first
@@ -271,8 +422,9 @@ class ResultIterMagic(object):
 	it was a list.
 	"""
 
-	def __init__(self, slices, reuse_msg="Attempted to iterate past end of iterator.", exc=Exception):
-		self._inner = ResultIter(slices)
+	def __init__(self, slices, reuse_msg="Attempted to iterate past end of iterator.", exc=Exception, wait_for=None, concurrency=None, parts=None, merge_parts=None):
+		self._inner = ResultIter(slices, wait_for, parts, merge_parts)
+		self._concurrency = concurrency
 		self._reuse_msg = reuse_msg
 		self._exc = exc
 		self._done = False
@@ -294,7 +446,7 @@ class ResultIterMagic(object):
 		return item
 	next = __next__
 
-	def merge_auto(self):
+	def merge_auto(self, parallel=None):
 		"""Merge values from iterator using magic.
 		Currenly supports data that has .update, .itervalues and .iteritems
 		methods.
@@ -302,53 +454,154 @@ class ResultIterMagic(object):
 		level, otherwise the value will be overwritten by later slices.
 		Don't try to use this if all your values don't have the same depth,
 		or if you have empty dicts at the last level.
+		When there is a lot of data the slices are first merged pairwise in
+		separate processes, in rounds for as long as that makes the data
+		shrink (i.e. there are many common keys). parallel=True/False
+		overrides the size check. The result is the same either way.
 		"""
 		if self._started:
 			raise self._exc("Will not merge after iteration started")
+		if parallel is None:
+			from multiprocessing import cpu_count
+			parallel = cpu_count() > 1 and self._merge_size() >= _PARALLEL_MERGE_SIZE
+		if parallel and self._concurrency and self._inner.slices > 2:
+			res = self._merge_parallel()
+			if res is not None:
+				self._started = self._done = True
+				if self._inner._is_tupled:
+					return (v for v in res)
+				else:
+					return res[0]
+			print("Parallel merge_auto failed, merging serially.")
 		if self._inner._is_tupled:
 			return (self._merge_auto_single(it, ix) for ix, it in enumerate(self._inner._loaders))
 		else:
 			return self._merge_auto_single(self, -1)
 
 	def _merge_auto_single(self, it, ix):
-		# find a non-empty one, so we can look at the data in it
-		data = next(it)
-		if isinstance(data, num_types):
-			# special case for when you have something like (count, dict)
-			return sum(it, data)
-		if isinstance(data, list):
-			for part in it:
-				data.extend(part)
-			return data
-		while not data:
-			try:
-				data = next(it)
-			except StopIteration:
-				# All were empty, return last one
-				return data
-		depth = 0
-		to_check = data
-		while hasattr(to_check, "values"):
-			if not to_check:
-				raise self._exc("Empty value at depth %d (index %d)" % (depth, ix,))
-			to_check = first_value(to_check)
-			depth += 1
-		if hasattr(to_check, "update"): # like a set
-			depth += 1
-		if not depth:
-			raise self._exc("Top level has no .values (index %d)" % (ix,))
-		def upd(aggregate, part, level):
-			if level == depth:
-				aggregate.update(part)
-			else:
-				for k, v in iteritems(part):
-					if k in aggregate:
-						upd(aggregate[k], v, level + 1)
-					else:
-						aggregate[k] = v
-		for part in it:
-			upd(data, part, 1)
-		return data
+		return _merge_auto(it, ix, self._exc)
+
+	def _part_size(self, part):
+		fn = _fn(part[0], None, part[1])
+		return sum(os.path.getsize(fn) for fn in (fn, fn + '.buffers') if os.path.exists(fn))
+
+	def _merge_size(self):
+		inner = self._inner
+		size = 0
+		for sliceno in range(inner.slices):
+			inner._wait_for(sliceno)
+			for name in inner._names:
+				size += sum(self._part_size(part) for part in inner._files(name, sliceno))
+		return size
+
+	def _merge_parallel(self):
+		"""Merge pairs of slices in parallel, then pairs of those results
+		and so on, as long as the merged data is clearly smaller than the
+		parts were. (Otherwise it is faster to just merge the rest here.)
+		Returns a list of merged results (one per tuple index), or None
+		if any merge failed."""
+		inner = self._inner
+		self._merge_size() # waits for all slices
+		levels = [[(name, sliceno) for sliceno in range(inner.slices)] for name in inner._names]
+		tmp_names = []
+		try:
+			# The parts of split slices are combined first (they can't be
+			# merged like whole slices), then it goes on as if not split.
+			todo = []
+			for sliceno in sorted(inner._parts):
+				dests = []
+				for ix, name in enumerate(inner._names):
+					dest = ('Analysis.merge.%d.parts.%d' % (ix, sliceno,), None)
+					tmp_names.append(dest[0])
+					dests.append(dest)
+					levels[ix][sliceno] = dest
+				todo.append(('parts of slice %d' % (sliceno,), partial(self._merge_parts, sliceno, dests)))
+			if todo:
+				with status('Merging parts of split slices in analysis_res'):
+					if not self._run_merges(todo):
+						return None
+			merge_round = 0
+			while len(levels[0]) > 1:
+				todo = []
+				pairs = []
+				size_before = size_after = 0
+				for ix, parts in enumerate(levels):
+					next_parts = []
+					for pos in range(0, len(parts), 2):
+						if pos + 1 < len(parts):
+							dest = ('Analysis.merge.%d.%d.%d' % (ix, merge_round, pos,), None)
+							tmp_names.append(dest[0])
+							todo.append((dest[0], partial(self._merge_pair, parts[pos], parts[pos + 1], dest, ix if inner._is_tupled else -1)))
+							pairs.append((parts[pos], parts[pos + 1], dest))
+							next_parts.append(dest)
+						else:
+							next_parts.append(parts[pos])
+					levels[ix] = next_parts
+				with status('Merging analysis_res (round %d)' % (merge_round + 1,)):
+					if not self._run_merges(todo):
+						return None
+				for a, b, dest in pairs:
+					size_before += self._part_size(a) + self._part_size(b)
+					size_after += self._part_size(dest)
+				merge_round += 1
+				if size_after > size_before * 0.75:
+					break
+			with status('Merging analysis_res'):
+				return [
+					self._merge_auto_single((_pickle_load_buffers(*part) for part in parts), ix if inner._is_tupled else -1)
+					for ix, parts in enumerate(levels)
+				]
+		finally:
+			for name in tmp_names:
+				for fn in (name, name + '.buffers'):
+					try:
+						os.unlink(fn)
+					except OSError:
+						pass
+
+	def _merge_pair(self, a, b, dest, ix):
+		data = self._merge_auto_single(iter([_pickle_load_buffers(*a), _pickle_load_buffers(*b)]), ix)
+		_pickle_save_buffers(data, dest[0], temp=False)
+
+	def _merge_parts(self, sliceno, dests):
+		for data, dest in zip(self._inner._load_all(sliceno), dests):
+			_pickle_save_buffers(data, dest[0], temp=False)
+
+	def _run_merges(self, todo):
+		"""Run each (name, merge function) in todo in a forked process, at
+		most concurrency at a time. Returns False if any of them failed."""
+		from accelerator import statmsg
+		parent_pid = os.getpid()
+		todo = list(todo)
+		running = []
+		ok = True
+		while todo or running:
+			while todo and len(running) < self._concurrency:
+				name, merge = todo.pop(0)
+				sys.stdout.flush()
+				sys.stderr.flush()
+				pid = os.fork()
+				if not pid:
+					rc = 1
+					try:
+						statmsg._start('merge_auto %s' % (name,), parent_pid)
+						merge()
+						rc = 0
+					except Exception:
+						print_exc()
+					finally:
+						statmsg._end()
+						sys.stdout.flush()
+						sys.stderr.flush()
+						os._exit(rc)
+				running.append(pid)
+			# Merges in the same round are about the same size, so waiting
+			# for them in order is fine. (Don't use os.wait, that would reap
+			# other children too.)
+			_, exitstatus = os.waitpid(running.pop(0), 0)
+			if exitstatus:
+				ok = False
+		return ok
 
 
 class DotDict(dict):
@@ -0,0 +1,102 @@
+############################################################################
+#                                                                          #
+# Copyright (c) 2021 Carl Drougge                                          #
+#                                                                          #
+# Licensed under the Apache License, Version 2.0 (the "License");          #
+# you may not use this file except in compliance with the License.         #
+# You may obtain a copy of the License at                                  #
+#                                                                          #
+#  http://www.apache.org/licenses/LICENSE-2.0                              #
+#                                                                          #
+# Unless required by applicable law or agreed to in writing, software      #
+# distributed under the License is distributed on an "AS IS" BASIS,        #
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. #
+# See the License for the specific language governing permissions and      #
+# limitations under the License.                                           #
+#                                                                          #
+############################################################################
+
+# Minimal ctypes wrapper for linux inotify, used by the server to notice
+# new jobs without rescanning the workdirs. Inotify.create() returns None
+# where inotify is not available, callers must handle that (and should
+# not rely on seeing changes made by other hosts on network filesystems).
+
+from __future__ import print_function
+from __future__ import division
+
+import os
+import struct
+import errno
+
+IN_MOVED_FROM  = 0x00000040
+IN_MOVED_TO    = 0x00000080
+IN_CREATE      = 0x00000100
+IN_DELETE      = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF   = 0x00000800
+IN_Q_OVERFLOW  = 0x00004000
+IN_IGNORED     = 0x00008000
+IN_ONLYDIR     = 0x01000000
+IN_ISDIR       = 0x40000000
+
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+
+_event = struct.Struct('iIII')
+
+
+class Inotify:
+	def __init__(self, libc, fd):
+		self._libc = libc
+		self.fd = fd
+
+	@classmethod
+	def create(cls):
+		try:
+			import ctypes
+			libc = ctypes.CDLL(None, use_errno=True)
+			fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+		except Exception:
+			return None
+		if fd < 0:
+			return None
+		return cls(libc, fd)
+
+	def fileno(self):
+		return self.fd
+
+	def add_watch(self, path, mask):
+		"""Returns the watch descriptor, or None if it failed (e.g. too many watches)"""
+		if not isinstance(path, bytes):
+			path = path.encode('utf-8')
+		wd = self._libc.inotify_add_watch(self.fd, path, mask)
+		if wd < 0:
+			return None
+		return wd
+
+	def rm_watch(self, wd):
+		self._libc.inotify_rm_watch(self.fd, wd)
+
+	def read(self):
+		"""All currently available events as a list of (wd, mask, name)"""
+		res = []
+		while True:
+			try:
+				data = os.read(self.fd, 65536)
+			except OSError as e:
+				if e.errno in (errno.EAGAIN, errno.EINTR,):
+					return res
+				raise
+			if not data:
+				return res
+			pos = 0
+			while pos < len(data):
+				wd, mask, _, namelen = _event.unpack_from(data, pos)
+				pos += _event.size
+				name = data[pos:pos + namelen].rstrip(b'\0').decode('utf-8', 'replace')
+				pos += namelen
+				res.append((wd, mask, name,))
+
+	def close(self):
+		os.close(self.fd)
+		self.fd = -1
@@ -0,0 +1,137 @@
+############################################################################
+#                                                                          #
+# Copyright (c) 2021 Carl Drougge                                          #
+#                                                                          #
+# Licensed under the Apache License, Version 2.0 (the "License");          #
+# you may not use this file except in compliance with the License.         #
+# You may obtain a copy of the License at                                  #
+#                                                                          #
+#  http://www.apache.org/licenses/LICENSE-2.0                              #
+#                                                                          #
+# Unless required by applicable law or agreed to in writing, software      #
+# distributed under the License is distributed on an "AS IS" BASIS,        #
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. #
+# See the License for the specific language governing permissions and      #
+# limitations under the License.                                           #
+#                                                                          #
+############################################################################
+
+# I/O counters for dataset columns, collected while a job runs and saved
+# as "iostats" in post.json. The layout is
+#     {"read" or "write": {dataset: {column: {sliceno: counters}}}}
+# where counters is [compressed bytes, uncompressed bytes, values, seconds]
+# and seconds is the time spent in decompression (or compression).
+# sliceno is a string, as it has to be in json.
+#
+# There is also a running count of rows and (uncompressed) bytes read by
+# this process, including from readers that are still open, for progress
+# reports while a job runs.
+
+from __future__ import print_function
+from __future__ import division
+
+from threading import Lock
+from weakref import WeakKeyDictionary
+
+from accelerator.compat import iteritems
+
+FIELDS = ('compressed', 'uncompressed', 'values', 'seconds',)
+
+# Only collected when running a job (set by launch).
+enabled = False
+
+_stats = {'read': {}, 'write': {}}
+
+_progress = [0, 0] # rows, bytes from closed readers
+_live = WeakKeyDictionary() # reader: counts rows
+_live_lock = Lock()
+
+
+def add(kind, ds, column, sliceno, compressed, uncompressed, values, seconds):
+	slices = _stats[kind].setdefault(ds, {}).setdefault(column, {})
+	c = slices.get(str(sliceno))
+	if c:
+		c[0] += compressed
+		c[1] += uncompressed
+		c[2] += values
+		c[3] += seconds
+	else:
+		slices[str(sliceno)] = [compressed, uncompressed, values, seconds]
+
+
+def reader(ds, column, sliceno, rows=False):
+	"""stats callback for a dsutil reader. Its values count as rows
+	in progress() if rows is set."""
+	def stats(compressed, uncompressed, values, seconds):
+		add('read', ds, column, sliceno, compressed, uncompressed, values, seconds)
+		if rows:
+			_progress[0] += values
+		_progress[1] += uncompressed
+	return stats
+
+
+def track(reader, rows=False):
+	"""Include an open dsutil reader in progress()"""
+	with _live_lock:
+		_live[reader] = rows
+
+
+def progress():
+	"""(rows, bytes) read so far by this process"""
+	rows, nbytes = _progress
+	with _live_lock:
+		live = list(_live.items())
+	for reader, counts_rows in live:
+		# These are 0 once the reader is closed (and counted in _progress).
+		if counts_rows:
+			rows += reader.count
+		nbytes += reader.uncompressed_bytes
+	return rows, nbytes
+
+
+def reset_progress():
+	_progress[:] = [0, 0]
+	with _live_lock:
+		_live.clear()
+
+
+def written(ds, column, sliceno, w):
+	"""Record a (closed) dsutil writer"""
+	add('write', ds, column, sliceno, w.compressed_bytes, w.uncompressed_bytes, w.count, w.compress_time)
+
+
+def take():
+	"""Returns the stats collected so far and starts over"""
+	global _stats
+	res = _stats
+	_stats = {'read': {}, 'write': {}}
+	return res
+
+
+def merge(stats):
+	for kind, datasets in iteritems(stats):
+		for ds, columns in iteritems(datasets):
+			for column, slices in iteritems(columns):
+				for sliceno, counters in iteritems(slices):
+					add(kind, ds, column, sliceno, *counters)
+
+
+def totals(stats):
+	"""Sum over slices, as [(kind, dataset, column, counters)]"""
+	res = []
+	for kind in ('read', 'write'):
+		for ds, columns in sorted(iteritems(stats.get(kind, {}))):
+			for column, slices in sorted(iteritems(columns)):
+				counters = [sum(v) for v in zip(*slices.values())]
+				res.append((kind, ds, column, counters))
+	return res
+
+
+def fmt_size(num):
+	for unit in ('B', 'KB', 'MB', 'GB', 'TB'):
+		if num < 1024 or unit == 'TB':
+			break
+		num /= 1024
+	if unit == 'B':
+		return '%d B' % (num,)
+	return '%.1f %s' % (num, unit,)
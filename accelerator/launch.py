@@ -30,22 +30,77 @@ from traceback import format_tb, format_exception_only
 from time import sleep
 import json
 import ctypes
+import struct
+from multiprocessing import current_process
 
 from accelerator.job import CurrentJob, WORKDIRS
 from accelerator.compat import pickle, iteritems, setproctitle, QueueEmpty
 from accelerator.compat import getarglist, monotonic
-from accelerator.extras import job_params, ResultIterMagic
+from accelerator.extras import job_params, ResultIterMagic, _pickle_save_buffers, _part_name
 from accelerator.build import JobError
 from accelerator.lockfree_queue import LockFreeQueue
+from accelerator.sampling import sampler
 from accelerator import g
 from accelerator import blob
 from accelerator import statmsg
 from accelerator import dataset
 from accelerator import iowrapper
+from accelerator import iostats
+from accelerator import rusage
 
 
 g_allesgut = False
 _prof_fd = -1
+_profile = False
+_analysis_memory = None
+
+# How often to check memory use when analysis processes are waiting to
+# start because of the memory budget.
+MEMORY_POLL_INTERVAL = 0.5
+
+# The server gives a directory where running analysis processes (of all
+# jobs) have a file named by their pid, so the memory budget can count
+# them all.
+def _analysis_pid_fn(pid):
+	dirname = os.environ.get('BD_ANALYSIS_PIDS')
+	if dirname:
+		return os.path.join(dirname, str(pid))
+
+def _analysis_register(pid):
+	fn = _analysis_pid_fn(pid)
+	if fn:
+		try:
+			open(fn, 'w').close()
+		except (IOError, OSError):
+			pass
+
+def _analysis_unregister(pid):
+	fn = _analysis_pid_fn(pid)
+	if fn:
+		try:
+			os.unlink(fn)
+		except OSError:
+			pass
+
+def _server_analysis_memory():
+	"""Memory use (PSS) of all running analysis processes on the server,
+	or None if they can't be found"""
+	dirname = os.environ.get('BD_ANALYSIS_PIDS')
+	if not dirname:
+		return None
+	try:
+		pids = [int(name) for name in os.listdir(dirname)]
+	except (OSError, ValueError):
+		return None
+	used = 0
+	for pid in pids:
+		mem = rusage.memory(pid)
+		if mem is None:
+			# Gone without unregistering (killed).
+			_analysis_unregister(pid)
+		else:
+			used += mem
+	return used
 
 
 g_always = {'running',}
@@ -64,7 +119,10 @@ def writeall(fd, data):
 		data = data[os.write(fd, data):]
 
 
-def call_analysis(analysis_func, sliceno_, delayed_start, q, preserve_result, parent_pid, output_fds, **kw):
+def call_analysis(analysis_func, sliceno_, delayed_start, q, preserve_result, parent_pid, output_fds, tasks=None, **kw):
+	"""Runs analysis for sliceno_, or with tasks=(fd, task_list) for each
+	(sliceno, partno, part) in task_list whose index it reads from fd."""
+	sliceno = sliceno_
 	try:
 		q.make_writer()
 		# tell iowrapper our PID, so our output goes to the right status stack.
@@ -77,77 +135,124 @@ def call_analysis(analysis_func, sliceno_, delayed_start, q, preserve_result, pa
 		for fd in output_fds:
 			os.close(fd)
 		os.close(_prof_fd)
-		slicename = 'analysis(%d)' % (sliceno_,)
+		iostats.take() # forget what the launcher had read before the fork
+		if tasks:
+			slicename = 'analysis(worker %d)' % (sliceno_,)
+		else:
+			slicename = 'analysis(%d)' % (sliceno_,)
 		setproctitle(slicename)
 		if delayed_start:
 			os.close(delayed_start[1])
-			update = statmsg._start('waiting for concurrency limit (%d)' % (sliceno_,), parent_pid, True)
+			update = statmsg._start('waiting for concurrency or memory limit (%d)' % (sliceno_,), parent_pid, True)
 			if os.read(delayed_start[0], 1) != b'a':
 				raise Exception('bad delayed_start, giving up')
 			update(slicename)
 			os.close(delayed_start[0])
 		else:
-			statmsg._start(slicename, parent_pid, True)
-		kw['sliceno'] = g.sliceno = sliceno_
-		for dw in dataset._datasetwriters.values():
-			if dw._for_single_slice is None:
-				dw._set_slice(sliceno_)
-		res = analysis_func(**kw)
-		if preserve_result:
-			# Remove defaultdicts until we find one with a picklable default_factory.
-			# (This is what you end up doing manually anyway.)
-			def picklable(v):
-				try:
-					pickle.dumps(v, pickle.HIGHEST_PROTOCOL)
-					return True
-				except Exception:
-					return False
-			def fixup(d):
-				if isinstance(d, defaultdict) and not picklable(d.default_factory):
-					if not d:
-						return {}
-					v = next(iteritems(d))
-					if isinstance(v, defaultdict) and not picklable(v.default_factory):
-						return {k: fixup(v) for k, v in iteritems(d)}
-					else:
-						return dict(d)
-				else:
-					return d
-			def save(item, name):
-				blob.save(fixup(item), name, sliceno=sliceno_, temp=True)
-			if isinstance(res, tuple):
-				if sliceno_ == 0:
-					blob.save(len(res), "Analysis.tuple", temp=True)
-				for ix, item in enumerate(res):
-					save(item, "Analysis.%d." % (ix,))
-			else:
-				if sliceno_ == 0:
-					blob.save(False, "Analysis.tuple", temp=True)
-				save(res, "Analysis.")
-		from accelerator.extras import saved_files
-		dw_lens = {}
-		dw_minmax = {}
-		dw_compressions = {}
-		for name, dw in dataset._datasetwriters.items():
-			if dw._for_single_slice or sliceno_ == 0:
-				dw_compressions[name] = dw._compressions
-			if dw._for_single_slice in (None, sliceno_,):
-				dw.close()
-				dw_lens[name] = dw._lens
-				dw_minmax[name] = dw._minmax
-		c_fflush()
-		q.put((sliceno_, monotonic(), saved_files, dw_lens, dw_minmax, dw_compressions, None,))
+			update = statmsg._start(slicename, parent_pid, True)
+		_analysis_register(os.getpid())
+		iostats.reset_progress() # forget what the launcher had read
+		statmsg._start_progress()
+		if tasks:
+			tasks_fd, task_list = tasks
+			def todo():
+				while True:
+					# Each index is a single write of 4 bytes, so reads don't interleave.
+					ix = os.read(tasks_fd, 4)
+					if not ix:
+						return
+					yield task_list[struct.unpack('=I', ix)[0]]
+			todo = todo()
+		else:
+			todo = [(sliceno_, None, None)]
+		for sliceno, partno, part in todo:
+			if tasks:
+				update('analysis(%d) part %d' % (sliceno, partno,))
+			run_analysis(analysis_func, sliceno, partno, part, q, preserve_result, kw)
+		_analysis_unregister(os.getpid())
 		q.close()
 	except:
+		_analysis_unregister(os.getpid())
 		c_fflush()
-		msg = fmt_tb(1)
+		msg = fmt_tb(2) # skip call_analysis and run_analysis
 		print(msg)
-		q.put((sliceno_, monotonic(), {}, {}, {}, {}, msg,))
+		q.put((sliceno, monotonic(), {}, {}, {}, {}, {}, None, msg,))
 		q.close()
 		sleep(5) # give launcher time to report error (and kill us)
 		exitfunction()
 
-def fork_analysis(slices, concurrency, analysis_func, kw, preserve_result, output_fds, q):
+def run_analysis(analysis_func, sliceno_, partno, part, q, preserve_result, kw):
+	kw['sliceno'] = g.sliceno = sliceno_
+	if 'part' in kw:
+		kw['part'] = g.part = part
+	for dw in dataset._datasetwriters.values():
+		if dw._for_single_slice is None:
+			dw._set_slice(sliceno_)
+	if partno is None:
+		profile_name = 'analysis-%d' % (sliceno_,)
+	else:
+		profile_name = 'analysis-%d.%d' % (sliceno_, partno,)
+	with sampler(profile_name, _profile):
+		res = analysis_func(**kw)
+	if preserve_result:
+		# Remove defaultdicts until we find one with a picklable default_factory.
+		# (This is what you end up doing manually anyway.)
+		def picklable(v):
+			try:
+				pickle.dumps(v, pickle.HIGHEST_PROTOCOL)
+				return True
+			except Exception:
+				return False
+		def fixup(d):
+			if isinstance(d, defaultdict) and not picklable(d.default_factory):
+				if not d:
+					return {}
+				v = next(iteritems(d))
+				if isinstance(v, defaultdict) and not picklable(v.default_factory):
+					return {k: fixup(v) for k, v in iteritems(d)}
+				else:
+					return dict(d)
+			else:
+				return d
+		def save(item, name):
+			if partno is not None:
+				name = _part_name(name, partno)
+			_pickle_save_buffers(fixup(item), name, sliceno=sliceno_, temp=True)
+		if isinstance(res, tuple):
+			if sliceno_ == 0 and not partno:
+				blob.save(len(res), "Analysis.tuple", temp=True)
+			for ix, item in enumerate(res):
+				save(item, "Analysis.%d." % (ix,))
+		else:
+			if sliceno_ == 0 and not partno:
+				blob.save(False, "Analysis.tuple", temp=True)
+			save(res, "Analysis.")
+	from accelerator.extras import saved_files
+	dw_lens = {}
+	dw_minmax = {}
+	dw_compressions = {}
+	for name, dw in dataset._datasetwriters.items():
+		if dw._for_single_slice or sliceno_ == 0:
+			dw_compressions[name] = dw._compressions
+		if dw._for_single_slice in (None, sliceno_,):
+			dw.close()
+			dw_lens[name] = dw._lens
+			dw_minmax[name] = dw._minmax
+	c_fflush()
+	# usage is for the whole process, so later tasks replace it.
+	usage = (current_process().name, rusage.get(),)
+	q.put((sliceno_, monotonic(), saved_files, dw_lens, dw_minmax, dw_compressions, iostats.take(), usage, None,))
+
+def fork_analysis(slices, concurrency, analysis_func, kw, preserve_result, output_fds, q, stream=False, tasks=None, merge_parts=None, memory_budget=None):
+	"""Start analysis for all slices. Returns (per_slice times, temp_files,
+	analysis_res) when all have finished, or with stream=True
+	(AnalysisSlices, analysis_res) right away. (analysis_res then loads
+	each slice as soon as it is done, call .finish() when done with it.)
+	With tasks (from split_analysis) concurrency workers run those instead
+	of one process per slice, and merge_parts(a, b) (if set) combines the
+	results of the parts of a slice.
+	With memory_budget (bytes) slices are only started while the analysis
+	processes are expected to fit in it (but at least one always runs)."""
 	from multiprocessing import Process
 	import gc
 	children = []
@@ -159,80 +264,227 @@ def fork_analysis(slices, concurrency, analysis_func, kw, preserve_result, outpu
 		gc.freeze()
 	delayed_start = False
 	delayed_start_todo = 0
-	for i in range(slices):
-		if i == concurrency:
-			assert concurrency != 0
-			# The rest will wait on this queue
-			delayed_start = os.pipe()
-			delayed_start_todo = slices - i
-		p = Process(target=call_analysis, args=(analysis_func, i, delayed_start, q, preserve_result, pid, output_fds), kwargs=kw, name='analysis-%d' % (i,))
-		p.start()
-		children.append(p)
+	if memory_budget and rusage.memory(pid) is None:
+		# Can't measure memory use on this platform.
+		memory_budget = None
+	if tasks:
+		# Workers take the next task when they are done with one, so a big
+		# slice doesn't leave the other workers idle.
+		tasks_r, tasks_w = os.pipe()
+		for ix in range(len(tasks)):
+			os.write(tasks_w, struct.pack('=I', ix))
+		os.close(tasks_w)
+		parts = defaultdict(int)
+		for sliceno, _, _ in tasks:
+			parts[sliceno] += 1
+		parts = dict(parts)
+		for i in range(min(concurrency or slices, slices, len(tasks))):
+			p = Process(target=call_analysis, args=(analysis_func, i, False, q, preserve_result, pid, output_fds, (tasks_r, tasks)), kwargs=kw, name='analysis-worker-%d' % (i,))
+			p.start()
+			children.append(p)
+		os.close(tasks_r)
+	else:
+		parts = None
+		if memory_budget:
+			# Only the first slice starts right away, AnalysisSlices
+			# starts the rest when there is memory for them.
+			start_count = 1
+		else:
+			start_count = concurrency
+		for i in range(slices):
+			if i == start_count:
+				assert start_count != 0
+				# The rest will wait on this queue
+				delayed_start = os.pipe()
+				delayed_start_todo = slices - i
+			p = Process(target=call_analysis, args=(analysis_func, i, delayed_start, q, preserve_result, pid, output_fds), kwargs=kw, name='analysis-%d' % (i,))
+			p.start()
+			children.append(p)
 	for fd in output_fds:
 		os.close(fd)
 	if delayed_start:
 		os.close(delayed_start[0])
 	q.make_reader()
-	per_slice = []
-	temp_files = {}
-	no_children_no_messages = False
-	while len(per_slice) < slices:
+	running = AnalysisSlices(slices, children, delayed_start, delayed_start_todo, q, t, parts, concurrency, memory_budget)
+	if stream:
+		wait_for = running.wait_for
+	else:
+		per_slice, temp_files = running.finish()
+		wait_for = None
+	if preserve_result:
+		res_seq = ResultIterMagic(slices, reuse_msg="analysis_res is an iterator, don't re-use it", wait_for=wait_for, concurrency=concurrency or slices, parts=parts, merge_parts=merge_parts)
+	else:
+		res_seq = None
+	if stream:
+		return running, res_seq
+	else:
+		return per_slice, temp_files, res_seq
+
+class AnalysisSlices(object):
+	"""Collects the messages from the analysis processes as they finish."""
+
+	def __init__(self, slices, children, delayed_start, delayed_start_todo, q, t, parts=None, concurrency=None, memory_budget=None):
+		self.slices = slices
+		self.parts_left = dict(parts or {})
+		self.children = children
+		self.delayed_start = delayed_start
+		self.delayed_start_todo = delayed_start_todo
+		self.concurrency = concurrency or slices
+		self.memory_budget = memory_budget
+		# With parts (split_analysis) the children are workers that run
+		# until all tasks are done, so running doesn't change.
+		self.workers = parts is not None
+		self.running = len(children) - delayed_start_todo
+		self.peak_memory = 0 # the most (PSS) any slice has been seen using
+		self.any_finished = False
+		self.q = q
+		self.t = t
+		self.per_slice = {}
+		self.temp_files = {}
+		self.no_children_no_messages = False
+
+	def wait_for(self, sliceno):
+		while sliceno not in self.per_slice:
+			self._receive()
+
+	def finish(self):
+		"""Wait for all slices, returns (per_slice times, temp_files)"""
+		while len(self.per_slice) < self.slices:
+			self._receive()
+		g.update_top_status("Waiting for all slices to finish cleanup")
+		self.q.close()
+		if self.delayed_start:
+			os.close(self.delayed_start[1])
+		for p in self.children:
+			p.join()
+			_analysis_unregister(p.pid)
+		return [v - self.t for k, v in sorted(self.per_slice.items())], self.temp_files
+
+	def _receive(self):
 		still_alive = []
-		for p in children:
+		for p in self.children:
 			if p.is_alive():
 				still_alive.append(p)
 			else:
 				p.join()
+				_analysis_unregister(p.pid)
 				if p.exitcode:
 					raise Exception("%s terminated with exitcode %d" % (p.name, p.exitcode,))
-		children = still_alive
+		self.children = still_alive
 		# If a process dies badly we may never get a message here.
 		# (iowrapper tries to tell us though.)
 		# No need to handle that very quickly though, 10 seconds is fine.
 		# (Typically this is caused by running out of memory.)
+		if self.memory_budget and self.delayed_start_todo:
+			timeout = MEMORY_POLL_INTERVAL
+		else:
+			timeout = 10
 		try:
-			msg = q.get(timeout=10)
+			msg = self.q.get(timeout=timeout)
 			if not msg:
 				# Notification from iowrapper, so we wake up (quickly) even if
 				# the process died badly (e.g. from running out of memory).
-				continue
-			s_no, s_t, s_temp_files, s_dw_lens, s_dw_minmax, s_dw_compressions, s_tb = msg
+				return
+			s_no, s_t, s_temp_files, s_dw_lens, s_dw_minmax, s_dw_compressions, s_iostats, s_rusage, s_tb = msg
 		except QueueEmpty:
-			if not children:
+			if not self.children:
 				# No children left, so they must have all sent their messages.
 				# Still, just to be sure there isn't a race, wait one iteration more.
-				if no_children_no_messages:
+				if self.no_children_no_messages:
 					raise Exception("All analysis processes exited cleanly, but not all returned a result.")
 				else:
-					no_children_no_messages = True
-			continue
+					self.no_children_no_messages = True
+			self._start_delayed()
+			return
 		if s_tb:
 			data = [{'analysis(%d)' % (s_no,): s_tb}, None]
 			writeall(_prof_fd, json.dumps(data).encode('utf-8'))
 			exitfunction()
-		if delayed_start_todo:
-			# Another analysis is allowed to run now
-			os.write(delayed_start[1], b'a')
-			delayed_start_todo -= 1
-		per_slice.append((s_no, s_t))
-		temp_files.update(s_temp_files)
+		if not self.workers:
+			self.running -= 1
+		self.any_finished = True
+		self._start_delayed()
+		if s_no in self.parts_left:
+			# A split slice is done when all its parts are.
+			self.parts_left[s_no] -= 1
+			if not self.parts_left[s_no]:
+				self.per_slice[s_no] = s_t
+		else:
+			self.per_slice[s_no] = s_t
+		self.temp_files.update(s_temp_files)
 		for name, lens in s_dw_lens.items():
 			dataset._datasetwriters[name]._lens.update(lens)
 		for name, minmax in s_dw_minmax.items():
 			dataset._datasetwriters[name]._minmax.update(minmax)
 		for name, compressions in s_dw_compressions.items():
 			dataset._datasetwriters[name]._compressions.update(compressions)
-	g.update_top_status("Waiting for all slices to finish cleanup")
-	q.close()
-	if delayed_start:
-		os.close(delayed_start[1])
-	for p in children:
-		p.join()
-	if preserve_result:
-		res_seq = ResultIterMagic(slices, reuse_msg="analysis_res is an iterator, don't re-use it")
-	else:
-		res_seq = None
-	return [v - t for k, v in sorted(per_slice)], temp_files, res_seq
+		iostats.merge(s_iostats)
+		rusage.record(*s_rusage)
+
+	def _start_delayed(self):
+		"""Let waiting analysis processes run, as many as concurrency and
+		the memory budget allow"""
+		if not self.delayed_start_todo:
+			return
+		if self.memory_budget:
+			# The usage is sampled every MEMORY_POLL_INTERVAL while slices
+			# are waiting, so peak_memory is (about) the peak PSS of the
+			# slices so far. (maxrss would count shared pages in full.)
+			usage = [rusage.memory(p.pid) or 0 for p in self.children]
+			self.peak_memory = max([self.peak_memory] + usage)
+			# The budget is for the whole server, so other jobs (and
+			# subjobs) count too. A job always runs at least one slice
+			# though, or jobs could wait for each other forever.
+			used = _server_analysis_memory()
+			if used is None:
+				used = sum(usage)
+			# A slice is expected to need as much as the worst one so far.
+			estimate = self.peak_memory
+			if self.any_finished:
+				max_count = self.delayed_start_todo
+			else:
+				# Nothing has finished yet so we don't know how much a
+				# slice needs at most, start them one at a time.
+				max_count = 1
+		else:
+			max_count = self.delayed_start_todo
+		while max_count and self.running < self.concurrency:
+			if self.memory_budget and self.running and used + estimate > self.memory_budget:
+				break
+			# Another analysis is allowed to run now
+			os.write(self.delayed_start[1], b'a')
+			self.delayed_start_todo -= 1
+			self.running += 1
+			max_count -= 1
+			if self.memory_budget:
+				used += estimate
+
+# Only slices more than this many times the average size are split, so
+# a (nearly) balanced dataset runs with one process per slice as usual.
+SPLIT_FACTOR = 2
+
+def analysis_tasks(ds, slices, concurrency):
+	"""Split the slices of ds that are much bigger than the average in
+	parts of about 1/concurrency of all lines. Returns [(sliceno, partno,
+	slice of lines)] with the biggest parts first, or None if no slice
+	needs to be split."""
+	workers = min(concurrency or slices, slices)
+	total = sum(ds.lines)
+	size = max(-(-total // workers), 10000)
+	tasks = []
+	for sliceno, lines in enumerate(ds.lines):
+		if lines > total * SPLIT_FACTOR / slices:
+			count = max(-(-lines // size), 1)
+		else:
+			count = 1
+		for partno in range(count):
+			start = lines * partno // count
+			stop = lines * (partno + 1) // count if partno + 1 < count else None
+			tasks.append((sliceno, partno, slice(start, stop), (stop or lines) - start))
+	if len(tasks) == slices:
+		return None
+	tasks.sort(key=lambda t: (-t[3], t[0], t[1]))
+	return [t[:3] for t in tasks]
 
 def args_for(func):
 	kw = {}
@@ -261,7 +513,7 @@ def fmt_tb(skip_level):
 	return ''.join(msg)
 
 
-def execute_process(workdir, jobid, slices, concurrency, result_directory, common_directory, input_directory, index=None, workdirs=None, server_url=None, subjob_cookie=None, parent_pid=0):
+def execute_process(workdir, jobid, slices, concurrency, result_directory, common_directory, input_directory, index=None, workdirs=None, server_url=None, subjob_cookie=None, parent_pid=0, profile=False):
 	WORKDIRS.update(workdirs)
 
 	g.job = jobid
@@ -276,6 +528,7 @@ def execute_process(workdir, jobid, slices, concurrency, result_directory, commo
 	g.params = params = job_params()
 	method_ref = import_module(params.package+'.a_'+params.method)
 	g.sliceno = -1
+	g.part = None
 
 	g.job = CurrentJob(jobid, params, result_directory, input_directory)
 	g.slices = slices
@@ -290,6 +543,7 @@ def execute_process(workdir, jobid, slices, concurrency, result_directory, commo
 
 	g.server_url       = server_url
 	g.running          = 'launch'
+	iostats.enabled    = True
 	statmsg._start('%s %s' % (jobid, params.method,), parent_pid)
 
 	def dummy():
@@ -300,8 +554,34 @@ def execute_process(workdir, jobid, slices, concurrency, result_directory, commo
 	synthesis_func = getattr(method_ref, 'synthesis', dummy)
 
 	synthesis_needs_analysis = 'analysis_res' in getarglist(synthesis_func)
+	# Methods can set stream_analysis_res = True to have synthesis start
+	# while analysis is still running. analysis_res then gives each slice
+	# as soon as it is done, but nothing else from analysis (like datasets
+	# or other files) can be used in synthesis.
+	stream_analysis_res = synthesis_needs_analysis and getattr(method_ref, 'stream_analysis_res', False)
+	# Methods where analysis doesn't need to see a whole slice at once can
+	# set split_analysis = 'name of dataset'. Slices of that dataset which
+	# are much bigger than the others are then split in several parts,
+	# and analysis is called with part=slice(start, stop) for each, to pass
+	# on as .iterate(sliceno, ..., slice=part). The results from the parts
+	# of a slice are combined with merge_parts(a, b) if the method has that,
+	# otherwise merged like merge_auto does (but it is an error for two
+	# parts to have the same key in a plain dict, use a Counter) before
+	# synthesis sees them.
+	split_analysis = getattr(method_ref, 'split_analysis', None)
+	merge_parts = getattr(method_ref, 'merge_parts', None)
+	if split_analysis and analysis_func is not dummy:
+		if 'part' not in getarglist(analysis_func):
+			raise Exception("split_analysis is set, but analysis doesn't take a part argument")
+		split_ds = params.datasets[split_analysis]
+		if split_ds:
+			split_analysis = analysis_tasks(split_ds, slices, concurrency)
+		else:
+			split_analysis = None
 
 	fd2pid, names, masters, slaves = iowrapper.setup(slices, prepare_func is not dummy, analysis_func is not dummy)
+	if profile:
+		os.mkdir('PROFILE')
 	def switch_output():
 		fd = slaves.pop()
 		os.dup2(fd, 1)
@@ -340,7 +620,8 @@ def execute_process(workdir, jobid, slices, concurrency, result_directory, commo
 		g.subjob_cookie = subjob_cookie
 		setproctitle(g.running)
 		with statmsg.status(g.running):
-			g.prepare_res = method_ref.prepare(**args_for(method_ref.prepare))
+			with sampler('prepare', profile):
+				g.prepare_res = method_ref.prepare(**args_for(method_ref.prepare))
 			to_finish = [dw.name for dw in dataset._datasetwriters.values() if dw._started]
 			if to_finish:
 				with statmsg.status("Finishing datasets"):
@@ -351,16 +632,24 @@ def execute_process(workdir, jobid, slices, concurrency, result_directory, commo
 	switch_output()
 	setproctitle('launch')
 	from accelerator.extras import saved_files
+	analysis_running = None
+	if split_analysis and dataset._datasetwriters:
+		raise Exception("split_analysis can not be used with DatasetWriters")
 	if analysis_func is dummy:
 		prof['per_slice'] = []
 		prof['analysis'] = 0
+	elif stream_analysis_res:
+		analysis_t = monotonic()
+		g.running = 'analysis'
+		g.subjob_cookie = None # subjobs are not allowed from analysis
+		analysis_running, g.analysis_res = fork_analysis(slices, concurrency, analysis_func, args_for(analysis_func), True, slaves, q, stream=True, tasks=split_analysis, merge_parts=merge_parts, memory_budget=_analysis_memory)
 	else:
 		t = monotonic()
 		g.running = 'analysis'
 		g.subjob_cookie = None # subjobs are not allowed from analysis
 		with statmsg.status('Waiting for all slices to finish analysis') as update:
 			g.update_top_status = update
-			prof['per_slice'], files, g.analysis_res = fork_analysis(slices, concurrency, analysis_func, args_for(analysis_func), synthesis_needs_analysis, slaves, q)
+			prof['per_slice'], files, g.analysis_res = fork_analysis(slices, concurrency, analysis_func, args_for(analysis_func), synthesis_needs_analysis, slaves, q, tasks=split_analysis, merge_parts=merge_parts, memory_budget=_analysis_memory)
 			del g.update_top_status
 		prof['analysis'] = monotonic() - t
 		saved_files.update(files)
@@ -369,7 +658,16 @@ def execute_process(workdir, jobid, slices, concurrency, result_directory, commo
 	g.subjob_cookie = subjob_cookie
 	setproctitle(g.running)
 	with statmsg.status(g.running):
-		synthesis_res = synthesis_func(**args_for(synthesis_func))
+		with sampler('synthesis', profile):
+			synthesis_res = synthesis_func(**args_for(synthesis_func))
+		if analysis_running:
+			with statmsg.status('Waiting for all slices to finish analysis') as update:
+				g.update_top_status = update
+				prof['per_slice'], files = analysis_running.finish()
+				del g.update_top_status
+			# This overlaps with synthesis
+			prof['analysis'] = monotonic() - analysis_t
+			saved_files.update(files)
 		if synthesis_res is not None:
 			blob.save(synthesis_res, temp=False)
 		if dataset._datasetwriters:
@@ -382,15 +680,20 @@ def execute_process(workdir, jobid, slices, concurrency, result_directory, commo
 	t = monotonic() - t
 	prof['synthesis'] = t
 
+	prof['rusage'] = rusage.take()
+	prof['rusage']['launch'] = rusage.get()
+
 	from accelerator.subjobs import _record
-	return None, (prof, saved_files, _record)
+	return None, (prof, saved_files, _record, iostats.take())
 
 
-def run(workdir, jobid, slices, concurrency, result_directory, common_directory, input_directory, index=None, workdirs=None, server_url=None, subjob_cookie=None, parent_pid=0, prof_fd=-1, debuggable=False):
-	global g_allesgut, _prof_fd
+def run(workdir, jobid, slices, concurrency, result_directory, common_directory, input_directory, index=None, workdirs=None, server_url=None, subjob_cookie=None, parent_pid=0, prof_fd=-1, debuggable=False, profile=False, analysis_memory=None):
+	global g_allesgut, _prof_fd, _profile, _analysis_memory
 	_prof_fd = prof_fd
+	_profile = profile
+	_analysis_memory = analysis_memory
 	try:
-		data = execute_process(workdir, jobid, slices, concurrency, result_directory, common_directory, input_directory, index=index, workdirs=workdirs, server_url=server_url, subjob_cookie=subjob_cookie, parent_pid=parent_pid)
+		data = execute_process(workdir, jobid, slices, concurrency, result_directory, common_directory, input_directory, index=index, workdirs=workdirs, server_url=server_url, subjob_cookie=subjob_cookie, parent_pid=parent_pid, profile=profile)
 		g_allesgut = True
 	except Exception:
 		msg = fmt_tb(2)
@@ -38,6 +38,10 @@ from accelerator.setupfile import _sorted_set
 
 from accelerator import __version__ as ax_version
 
+# {python executable: {method: entry}} from runner.load_methods, so
+# unchanged methods don't have to be reloaded when the runners restart.
+_load_cache = {}
+
 class MethodLoadException(Exception):
 	def __init__(self, lst):
 		Exception.__init__(self, 'Failed to load ' + ', '.join(lst))
@@ -70,6 +74,7 @@ class Methods(object):
 		self.params = {}
 		self.descriptions = {}
 		self.typing = {}
+		new_load_cache = defaultdict(dict)
 		for version, data in iteritems(per_runner):
 			runner = self.runners.get(version)
 			if not runner:
@@ -82,12 +87,16 @@ class Methods(object):
 					raise Exception("Server is using accelerator %s but %s is currently installed, please restart server." % (ax_version, v,))
 				else:
 					print("WARNING: Server is using accelerator %s but runner %r is using accelerator %s." % (ax_version, version, v,))
-			w, f, h, p, d = runner.load_methods(package_list, data)
+			cache = _load_cache.get(runner.python, {})
+			w, f, h, p, d, c = runner.load_methods(package_list, data, cache)
+			new_load_cache[runner.python].update((k, c.get(k) or cache[k]) for k in h)
 			warnings.extend(w)
 			failed.extend(f)
 			self.hash.update(h)
 			self.params.update(p)
 			self.descriptions.update(d)
+		_load_cache.clear()
+		_load_cache.update(new_load_cache)
 		for key, params in iteritems(self.params):
 			self.typing[key] = options2typing(key, params.options)
 			params.defaults = params2defaults(params)
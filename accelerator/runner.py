@@ -21,6 +21,7 @@
 # This runs once per python version the server supports methods for.
 # On reload, it is killed and started again.
 # When launching a method, it forks and calls the method (without any exec).
+# The runtime and all methods are imported first, so jobs start out warm.
 # Also contains the function that starts these (new_runners) and the dict
 # of running ones {version: Runner}
 
@@ -79,8 +80,22 @@ def check_picklable(desc, value):
 		msg = str(e)
 	raise MsgException('Unpicklable %s: %s' % (desc, msg,))
 
-def load_methods(all_packages, data):
-	from accelerator.compat import str_types, iteritems
+def file_signature(filename):
+	st = os.stat(filename)
+	return (filename, st.st_mtime, st.st_size, st.st_ino,)
+
+def cache_valid(signatures):
+	try:
+		return all(file_signature(sig[0]) == sig for sig in signatures)
+	except OSError:
+		return False
+
+# cache is {method: entry} from earlier calls (by an earlier runner for
+# the same interpreter, the server keeps it). Methods where the module and
+# all files it depends on are unchanged are not imported again.
+# Returns entries for the methods that were (re)loaded as the last value.
+def load_methods(all_packages, data, cache={}):
+	from accelerator.compat import str_types, iteritems, pickle
 	from accelerator.extras import DotDict, OptionEnum, OptionEnumValue
 	from accelerator.extras import RequiredOption, OptionDefault
 	from accelerator import __version__ as ax_version
@@ -106,10 +121,23 @@ def load_methods(all_packages, data):
 			all_prefixes.add(get_mod(package)[2])
 		except Exception:
 			pass
+	res_cache = {}
+	env = (sys.executable, sys.version, ax_version, sorted(all_prefixes),)
 	for package, key in data:
 		modname = '%s.a_%s' % (package, key)
+		entry = cache.get(key)
+		if entry and entry['modname'] == modname and entry['env'] == env and cache_valid(entry['files']):
+			h, p, d, w = pickle.loads(entry['data'])
+			res_hashes[key] = h
+			res_params[key] = p
+			res_descriptions[key] = d
+			res_warnings.extend(w)
+			archives[key] = entry['archive']
+			continue
+		method_warnings = []
 		try:
 			mod, mod_filename, prefix = get_mod(modname)
+			files = [file_signature(mod_filename)]
 			depend_extra = []
 			for dep in getattr(mod, 'depend_extra', ()):
 				dep = mod2filename(dep)
@@ -139,17 +167,20 @@ def load_methods(all_packages, data):
 					if filename:
 						for cand_prefix in all_prefixes:
 							if filename.startswith(cand_prefix):
+								if filename not in likely_deps and os.path.exists(filename):
+									files.append(file_signature(filename))
 								likely_deps.add(filename)
 								dep_names[filename] = v.__name__
 								break
 			hash_extra = 0
 			for dep in depend_extra:
+				files.append(file_signature(dep))
 				with open(dep, 'rb') as fh:
 					data = fh.read()
 				hash_extra ^= int(hashlib.sha1(data).hexdigest(), 16)
 				tar_add(dep, data)
 			for dep in (likely_deps - set(depend_extra)):
-				res_warnings.append('%s.a_%s should probably depend_extra on %s' % (package, key, dep_names[dep],))
+				method_warnings.append('%s.a_%s should probably depend_extra on %s' % (package, key, dep_names[dep],))
 			res_hashes[key] = ("%040x" % (hash ^ hash_extra,),)
 			res_params[key] = params = DotDict()
 			# It would have been nice to be able to use ast.get_source_segment
@@ -292,12 +323,20 @@ def load_methods(all_packages, data):
 				if verifier == k:
 					res_hashes[key] += v
 				else:
-					res_warnings.append('%s.a_%s has equivalent_hashes, but missing verifier %s' % (package, key, verifier,))
+					method_warnings.append('%s.a_%s has equivalent_hashes, but missing verifier %s' % (package, key, verifier,))
 			tar_o.close()
 			tar_fh.seek(0)
 			archives[key] = tar_fh.read()
 			check_picklable('options/datasets/jobs', res_params[key])
 			check_picklable('description', res_descriptions[key])
+			res_warnings.extend(method_warnings)
+			res_cache[key] = dict(
+				modname=modname,
+				env=env,
+				files=files,
+				data=pickle.dumps((res_hashes[key], res_params[key], res_descriptions[key], method_warnings,), 2),
+				archive=archives[key],
+			)
 		except Exception as e:
 			if isinstance(e, MsgException):
 				print('%s: %s' % (modname, str(e),))
@@ -307,7 +346,34 @@ def load_methods(all_packages, data):
 			for d in res_hashes, res_params, res_descriptions:
 				d.pop(key, None)
 			continue
-	return res_warnings, res_failed, res_hashes, res_params, res_descriptions
+	return res_warnings, res_failed, res_hashes, res_params, res_descriptions, res_cache
+
+# Modules the job processes need, imported here so that every job forked
+# from the runner starts out with them already loaded.
+warm_modules = (
+	'accelerator.launch',
+	'accelerator.setupfile',
+	'accelerator.subjobs',
+	'multiprocessing',
+)
+
+def warm_up(data, loaded):
+	"""Import the runtime and all successfully loaded methods (the ones
+	that came from the cache in load_methods have not been imported yet).
+	This runner is replaced on every update_methods, so there is no need
+	to ever invalidate anything here."""
+	modnames = list(warm_modules)
+	modnames.extend('%s.a_%s' % (package, key) for package, key in data if key in loaded)
+	for modname in modnames:
+		try:
+			import_module(modname)
+		except Exception:
+			# It loaded fine before, if it's broken now the job will say so.
+			pass
+	if hasattr(gc, 'freeze'):
+		# Keep the gc from touching (and so un-sharing) all of this in the jobs.
+		gc.collect()
+		gc.freeze()
 
 def launch_start(data):
 	from accelerator.launch import run
@@ -468,8 +534,8 @@ class Runner(object):
 			raise Exception("Runner exited unexpectedly.")
 		return res
 
-	def load_methods(self, all_packages, data):
-		return self._do(b'm', (all_packages, data))
+	def load_methods(self, all_packages, data, cache):
+		return self._do(b'm', (all_packages, data, cache))
 
 	def launch_start(self, data):
 		return self._do(b's', data)
@@ -565,6 +631,7 @@ if __name__ == "__main__":
 		if op == b'm':
 			res = load_methods(*data)
 			respond(cookie, res)
+			warm_up(data[1], res[2])
 		elif op == b's':
 			res = launch_start(data)
 			respond(cookie, res)
@@ -0,0 +1,93 @@
+############################################################################
+#                                                                          #
+# Copyright (c) 2021 Carl Drougge                                          #
+#                                                                          #
+# Licensed under the Apache License, Version 2.0 (the "License");          #
+# you may not use this file except in compliance with the License.         #
+# You may obtain a copy of the License at                                  #
+#                                                                          #
+#  http://www.apache.org/licenses/LICENSE-2.0                              #
+#                                                                          #
+# Unless required by applicable law or agreed to in writing, software      #
+# distributed under the License is distributed on an "AS IS" BASIS,        #
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. #
+# See the License for the specific language governing permissions and      #
+# limitations under the License.                                           #
+#                                                                          #
+############################################################################
+
+# Resource usage for the processes of a job, saved as exectime.rusage
+# ({process name: usage}) in setup.json and post.json.
+
+from __future__ import print_function
+from __future__ import division
+
+import resource
+import sys
+
+FIELDS = ('maxrss', 'utime', 'stime', 'majflt', 'nvcsw', 'nivcsw',)
+
+_recorded = {}
+
+
+def get(who=resource.RUSAGE_SELF):
+	"""Usage for this process as a dict with FIELDS. maxrss (the peak
+	RSS) is in bytes and utime/stime are in seconds."""
+	ru = resource.getrusage(who)
+	maxrss = ru.ru_maxrss
+	if sys.platform != 'darwin':
+		maxrss *= 1024 # kilobytes everywhere else
+	return dict(
+		maxrss=maxrss,
+		utime=round(ru.ru_utime, 3),
+		stime=round(ru.ru_stime, 3),
+		majflt=ru.ru_majflt,
+		nvcsw=ru.ru_nvcsw,
+		nivcsw=ru.ru_nivcsw,
+	)
+
+
+def memory(pid):
+	"""Current memory use (PSS, so pages shared with other processes only
+	count partly) of process pid in bytes, or None if that is not available.
+	(It's only available on Linux.)"""
+	try:
+		with open('/proc/%d/smaps_rollup' % (pid,), 'rb') as fh:
+			for line in fh:
+				if line.startswith(b'Pss:'):
+					return int(line.split()[1]) * 1024
+	except (IOError, OSError, ValueError):
+		pass
+	return None
+
+
+def rss():
+	"""Current RSS of this process in bytes, or the peak RSS where the
+	current is not available."""
+	try:
+		with open('/proc/self/statm', 'rb') as fh:
+			return int(fh.read().split()[1]) * resource.getpagesize()
+	except (IOError, OSError, ValueError, IndexError):
+		return get()['maxrss']
+
+
+def record(name, usage):
+	"""Record usage (from get()) for a process in the current job. Only
+	works in the main job process (prepare and synthesis), so other
+	processes have to send their usage there."""
+	_recorded[name] = usage
+
+
+def sort_key(name):
+	"""launch, analysis processes in numeric order, then the rest"""
+	if name == 'launch':
+		return (0, 0, name)
+	if name.startswith('analysis-'):
+		return (1, int(name.rsplit('-', 1)[1]), name)
+	return (2, 0, name)
+
+
+def take():
+	res = dict(_recorded)
+	_recorded.clear()
+	return res
@@ -0,0 +1,163 @@
+############################################################################
+#                                                                          #
+# Copyright (c) 2021 Carl Drougge                                          #
+#                                                                          #
+# Licensed under the Apache License, Version 2.0 (the "License");          #
+# you may not use this file except in compliance with the License.         #
+# You may obtain a copy of the License at                                  #
+#                                                                          #
+#  http://www.apache.org/licenses/LICENSE-2.0                              #
+#                                                                          #
+# Unless required by applicable law or agreed to in writing, software      #
+# distributed under the License is distributed on an "AS IS" BASIS,        #
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. #
+# See the License for the specific language governing permissions and      #
+# limitations under the License.                                           #
+#                                                                          #
+############################################################################
+
+# A sampling profiler for jobs. A thread looks at the stack of the thread
+# that started it every interval seconds (wall clock, so time spent waiting
+# for I/O shows up too) and counts how many times each stack was seen.
+# Only the part of the stack inside the profiled code is kept.
+#
+# The result is saved in the "collapsed stacks" format used by flamegraph
+# tools, one "outermost;...;innermost count" line per stack, in
+# PROFILE/<name> in the job directory.
+
+from __future__ import print_function
+from __future__ import division
+
+import os
+import sys
+import threading
+from collections import defaultdict
+
+
+class Sampler(object):
+	def __init__(self, name, interval=0.01):
+		self.name = name
+		self.interval = interval
+		self.counts = defaultdict(int)
+		self._ident = None
+		self._skip = 0
+		self._stop = threading.Event()
+		self._thread = None
+
+	def start(self, outer=None):
+		"""Frames from outer and out are not included in the stacks."""
+		self._ident = threading.current_thread().ident
+		while outer is not None:
+			self._skip += 1
+			outer = outer.f_back
+		self._thread = threading.Thread(target=self._run, name='sampler')
+		self._thread.daemon = True
+		self._thread.start()
+
+	def _run(self):
+		labels = {}
+		def label(code):
+			res = labels.get(code)
+			if res is None:
+				res = labels[code] = '%s (%s:%d)' % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno,)
+			return res
+		while not self._stop.wait(self.interval):
+			frame = sys._current_frames().get(self._ident)
+			stack = []
+			while frame is not None:
+				stack.append(label(frame.f_code))
+				frame = frame.f_back
+			del frame
+			stack = stack[:len(stack) - self._skip]
+			if stack:
+				self.counts[';'.join(reversed(stack))] += 1
+
+	def stop(self):
+		"""Stop sampling and save the result."""
+		self._stop.set()
+		self._thread.join()
+		if not self.counts:
+			return
+		data = ''.join('%s %d\n' % item for item in sorted(self.counts.items()))
+		filename = os.path.join('PROFILE', self.name)
+		with open(filename + '.tmp', 'w') as fh:
+			fh.write(data)
+		os.rename(filename + '.tmp', filename)
+
+	def __enter__(self):
+		self.start(sys._getframe(1))
+		return self
+
+	def __exit__(self, e_type, e_value, e_tb):
+		self.stop()
+
+
+class _NoSampler(object):
+	def __enter__(self):
+		return self
+	def __exit__(self, e_type, e_value, e_tb):
+		pass
+
+
+def sampler(name, enabled):
+	"""Context manager that profiles the body to PROFILE/name if enabled."""
+	if enabled:
+		return Sampler(name)
+	else:
+		return _NoSampler()
+
+
+def load(path):
+	"""Load all profiles for a job (from the PROFILE directory in path)
+	as {name: {stack: count}}."""
+	res = {}
+	path = os.path.join(path, 'PROFILE')
+	for name in sorted(os.listdir(path)):
+		if name.endswith('.tmp'):
+			continue
+		counts = res[name] = {}
+		with open(os.path.join(path, name)) as fh:
+			for line in fh:
+				stack, count = line.rstrip('\n').rsplit(' ', 1)
+				counts[stack] = int(count)
+	return res
+
+
+def phase(name):
+	"""prepare, analysis or synthesis for a profile name"""
+	if name.startswith('analysis'):
+		return 'analysis'
+	return name
+
+
+def flamegraph(profiles, min_fraction=0.001):
+	"""Merge profiles (from load) with the phase as the outermost frame
+	and lay them out as a flamegraph. Returns (total samples, boxes) where
+	boxes are (depth, start, width, label, samples) with start and width
+	as fractions of the total. Boxes narrower than min_fraction are left
+	out (but still count in their parents)."""
+	tree = {}
+	total = 0
+	for name, counts in sorted(profiles.items()):
+		for stack, count in counts.items():
+			total += count
+			node = tree
+			for frame in [phase(name)] + stack.split(';'):
+				entry = node.get(frame)
+				if entry is None:
+					entry = node[frame] = [0, {}]
+				entry[0] += count
+				node = entry[1]
+	boxes = []
+	if not total:
+		return 0, boxes
+	order = {'prepare': 0, 'analysis': 1, 'synthesis': 2}
+	def walk(node, depth, start):
+		for frame, (count, children) in sorted(node.items(), key=lambda item: (order.get(item[0], 3), item[0])):
+			width = count / total
+			if width >= min_fraction:
+				boxes.append((depth, start, width, frame, count))
+				walk(children, depth + 1, start)
+			start += width
+	walk(tree, 0, 0.0)
+	return total, boxes
@@ -34,6 +34,9 @@ from multiprocessing import Process
 from string import ascii_letters
 import random
 import atexit
+import re
+import tempfile
+import shutil
 
 from accelerator.compat import unicode, ArgumentParser, monotonic
 
@@ -45,7 +48,7 @@ from accelerator.extras import json_encode, json_decode, DotDict
 from accelerator.build import JobError
 from accelerator.job import Job
 from accelerator.setupfile import load_setup
-from accelerator.statmsg import statmsg_sink, children, print_status_stacks, status_stacks_export
+from accelerator.statmsg import statmsg_sink, children, print_status_stacks, status_stacks_export, progress_export
 from accelerator import iowrapper, board, g, __version__ as ax_version
 
 
@@ -56,9 +59,9 @@ DEBUG_WRITE_JSON = False
 def gen_cookie(size=16):
 	return ''.join(random.choice(ascii_letters) for _ in range(size))
 
-# This contains cookie: {lock, last_error, last_time, workdir, concurrency_map}
+# This contains cookie: {lock, last_error, last_time, workdir, concurrency_map, profile_methods}
 # for all jobs, main jobs have cookie None.
-job_tracking = {None: DotDict(lock=JLock(), last_error=None, last_time=0, workdir=None, concurrency_map={})}
+job_tracking = {None: DotDict(lock=JLock(), last_error=None, last_time=0, workdir=None, concurrency_map={}, profile_methods=set())}
 
 
 # This needs .ctrl to work. It is set from main()
@@ -70,8 +73,10 @@ class XtdHandler(BaseWebHandler):
 	def log_message(self, format, *args):
 		return
 
-	def do_response(self, code, content_type, body):
+	def do_response(self, code, content_type, body, close=False):
 		hdrs = [('Accelerator-Version', ax_version)]
+		if close:
+			hdrs.append(('Connection', 'close'))
 		BaseWebHandler.do_response(self, code, content_type, body, hdrs)
 
 	def encode_body(self, body):
@@ -108,6 +113,7 @@ class XtdHandler(BaseWebHandler):
 				data.lock.release()
 			elif path == ['status', 'full']:
 				status.status_stacks, status.current = status_stacks_export()
+				status.progress = progress_export()
 			status.report_t = monotonic()
 			self.do_response(200, "text/json", status)
 			return
@@ -129,7 +135,26 @@ class XtdHandler(BaseWebHandler):
 			self.do_response(200, "text/json", ws)
 
 		elif path[0]=='workdir':
-			self.do_response(200, "text/json", self.ctrl.DataBase.db_by_workdir[path[1]])
+			self.do_response(200, "text/json", self.ctrl.workdir_listing(path[1]))
+
+		elif path[0]=='workdir_jobs':
+			names = [name for name in path[1:] if name] or sorted(self.ctrl.workspaces)
+			if set(names) - set(self.ctrl.workspaces):
+				self.do_response(404, 'text/plain', 'unknown workdir\n')
+				return
+			try:
+				res = self.ctrl.workdir_jobs(
+					names,
+					since=args.get('since') or None,
+					offset=int(args.get('offset') or 0),
+					limit=int(args['limit']) if args.get('limit') else None,
+					method=args.get('method', '').split(),
+					state=[s for s in args.get('state', '').split(',') if s],
+				)
+			except (ValueError, re.error) as e:
+				self.do_response(400, 'text/plain', 'bad arguments: %s\n' % (e,))
+				return
+			self.do_response(200, "text/json", res)
 
 		elif path==['config']:
 			self.do_response(200, "text/json", self.ctrl.config)
@@ -157,31 +182,20 @@ class XtdHandler(BaseWebHandler):
 
 		elif path[0] == 'method2job':
 			method, num = path[1:]
-			jobs = self.ctrl.DataBase.db_by_method.get(method, ())
-			start_ix = 0
-			start_from = args.get('start_from')
-			if start_from:
-				for start_ix, job in enumerate(jobs):
-					if job.id == start_from:
-						break
-				else:
-					start_ix = None
-			if start_ix is None:
-				res = {'error': '%s is not a current %s job' % (start_from, method,)}
-			else:
-				num = int(num)
-				if not jobs:
-					res = {'error': 'no current jobs with method %s available' % (method,)}
-				elif num + start_ix >= len(jobs):
-					res = {'error': 'tried to go %d jobs back from %s, but only %d earlier (current) jobs available' % (num, jobs[start_ix].id, len(jobs) - start_ix - 1,)}
-				else:
-					res = {'id': jobs[num + start_ix].id}
+			res = self.ctrl.method2job(method, int(num), args.get('start_from'))
+			self.do_response(200, 'text/json', res)
+
+		elif path[0] == 'jobs_with_source':
+			try:
+				options = json_decode(args.get('options') or '{}')
+			except ValueError:
+				self.do_response(400, 'text/plain', 'bad options\n')
+				return
+			res = self.ctrl.jobs_with_source(path[1], args.get('source', ''), options)
 			self.do_response(200, 'text/json', res)
 
 		elif path[0] == 'job_is_current':
-			job = Job(path[1])
-			job = self.ctrl.DataBase.db_by_workdir[job.workdir].get(job)
-			self.do_response(200, 'text/json', bool(job and job['current']))
+			self.do_response(200, 'text/json', self.ctrl.job_is_current(Job(path[1])))
 
 		elif path==['submit']:
 			if self.ctrl.broken:
@@ -219,12 +233,15 @@ class XtdHandler(BaseWebHandler):
 										passed_cookie = gen_cookie()
 									concurrency_map = dict(data.concurrency_map)
 									concurrency_map.update(setup.get('concurrency_map', ()))
+									profile_methods = set(data.profile_methods)
+									profile_methods.update(setup.get('profile_methods', ()))
 									job_tracking[passed_cookie] = DotDict(
 										lock=JLock(),
 										last_error=None,
 										last_time=0,
 										workdir=workdir,
 										concurrency_map=concurrency_map,
+										profile_methods=profile_methods,
 									)
 									try:
 										explicit_concurrency = setup.get('concurrency') or concurrency_map.get(setup.method)
@@ -236,7 +253,8 @@ class XtdHandler(BaseWebHandler):
 												if explicit_concurrency:
 													raise JobError(jobid, 'csvimport', {'server': 'csvimport can not run with reduced concurrency'})
 												concurrency = None
-										self.ctrl.run_job(jobid, subjob_cookie=passed_cookie, parent_pid=setup.get('parent_pid', 0), concurrency=concurrency)
+										profile = setup.get('profile') or bool(profile_methods & {setup.method, '-all-'})
+										self.ctrl.run_job(jobid, subjob_cookie=passed_cookie, parent_pid=setup.get('parent_pid', 0), concurrency=concurrency, profile=profile)
 										# update database since a new jobid was just created
 										job = self.ctrl.add_single_jobid(jobid)
 										with tlock:
@@ -272,7 +290,8 @@ class XtdHandler(BaseWebHandler):
 										job_res_json = json_encode(job_res)
 										break
 							if not respond_after: # not all jobs are done yet, give partial response
-								self.do_response(200, "text/json", job_res_json)
+								# and close, the connection is busy until we are done.
+								self.do_response(200, "text/json", job_res_json, close=True)
 							t.join() # wait until actually complete
 							del tlock
 							del t
@@ -310,6 +329,8 @@ class XtdHandler(BaseWebHandler):
 			return
 
 
+_analysis_pids_dir = None
+
 def exitfunction(*a):
 	if a != (DeadlyThread,): # if not called from a DeadlyThread
 		signal.signal(signal.SIGTERM, signal.SIG_IGN)
@@ -322,6 +343,8 @@ def exitfunction(*a):
 			os.killpg(child, signal.SIGKILL)
 		except Exception:
 			pass
+	if _analysis_pids_dir:
+		shutil.rmtree(_analysis_pids_dir, ignore_errors=True)
 	time.sleep(0.16) # give iowrapper a chance to output our last words
 	os.killpg(os.getpgid(0), signal.SIGKILL)
 	os._exit(1) # we really should be dead already
@@ -409,6 +432,13 @@ def main(argv, config):
 	buf_up(statmsg_wr, socket.SO_SNDBUF)
 	buf_up(statmsg_rd, socket.SO_RCVBUF)
 
+	# Running analysis processes register here (see launch.py), so the
+	# analysis memory budget can count all of them, not just the ones
+	# in the job that wants to start more.
+	global _analysis_pids_dir
+	_analysis_pids_dir = tempfile.mkdtemp(prefix='ax-analysis-')
+	os.environ['BD_ANALYSIS_PIDS'] = _analysis_pids_dir
+
 	t = DeadlyThread(target=statmsg_sink, args=(statmsg_rd,), name="statmsg sink")
 	t.daemon = True
 	t.start()
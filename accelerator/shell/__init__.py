@@ -134,6 +134,11 @@ def cmd_grep(argv):
 cmd_grep.help = '''search for a pattern in one or more datasets'''
 cmd_grep.is_debug = True
 
+def cmd_bench(argv):
+	from accelerator.shell.bench import main
+	return main(argv, cfg)
+cmd_bench.help = '''benchmark core data paths'''
+
 def cmd_ds(argv):
 	from accelerator.shell.ds import main
 	return main(argv, cfg)
@@ -262,6 +267,7 @@ cmd_version.help = '''show installed accelerator version'''
 
 COMMANDS = {
 	'abort': cmd_abort,
+	'bench': cmd_bench,
 	'board-server': cmd_board_server,
 	'curl': cmd_curl,
 	'ds': cmd_ds,
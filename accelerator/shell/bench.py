@@ -0,0 +1,214 @@
+############################################################################
+#                                                                          #
+# Copyright (c) 2021 Carl Drougge                                          #
+#                                                                          #
+# Licensed under the Apache License, Version 2.0 (the "License");          #
+# you may not use this file except in compliance with the License.         #
+# You may obtain a copy of the License at                                  #
+#                                                                          #
+#  http://www.apache.org/licenses/LICENSE-2.0                              #
+#                                                                          #
+# Unless required by applicable law or agreed to in writing, software      #
+# distributed under the License is distributed on an "AS IS" BASIS,        #
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. #
+# See the License for the specific language governing permissions and      #
+# limitations under the License.                                           #
+#                                                                          #
+############################################################################
+
+# Benchmarks for the core data paths, using the bench_* methods in
+# accelerator.test_methods and some standard methods.
+
+from __future__ import print_function
+from __future__ import division
+
+import sys
+import os
+import json
+import platform
+from datetime import datetime
+from multiprocessing import cpu_count
+from argparse import RawTextHelpFormatter
+
+from accelerator.compat import ArgumentParser, monotonic
+from accelerator.build import Automata, make_urd
+from accelerator.test_methods.a_bench_write import generators, options as write_options
+
+BENCHMARKS = ('write', 'iterate', 'dataset_type', 'dataset_sort', 'dataset_hashpart', 'csvexport', 'csvimport', 'launch',)
+LAUNCH_COUNT = 5
+
+
+def run_bench(urd, lines, types, repeat=1, benchmarks=BENCHMARKS, status=print):
+	"""Run benchmarks, returns a list of result dicts with name, variant,
+	lines, seconds (the best of repeat runs) and unit. launch has lines=None
+	and seconds for the median of several builds.
+	unit is "cpu-seconds" for write and iterate, which are timed in each
+	slice and summed, and "seconds" (elapsed time) for the others."""
+	best = {}
+	def add(name, variant, lines, seconds, wall=None, unit='seconds'):
+		key = (name, variant,)
+		if key not in best or best[key]['seconds'] > seconds:
+			best[key] = dict(name=name, variant=variant, lines=lines, seconds=seconds, unit=unit)
+			if wall is not None:
+				best[key]['wall'] = wall
+	def build(method, **kw):
+		t = monotonic()
+		job = urd.build(method, force_build=True, **kw)
+		return job, monotonic() - t
+	def standard(name, method, lines, **kw):
+		for _ in range(repeat):
+			job, wall = build(method, **kw)
+			add(name, '', lines, job.post.exectime.total, wall)
+		return job
+
+	if 'write' in benchmarks:
+		status('write')
+		for _ in range(repeat):
+			source, _ = build('bench_write', lines=lines, types=types)
+			for typ, seconds in source.load().items():
+				add('write', typ, lines, seconds, unit='cpu-seconds')
+	else:
+		source = urd.build('bench_write', lines=lines, types=types)
+	if 'iterate' in benchmarks:
+		status('iterate')
+		for _ in range(repeat):
+			job, _ = build('bench_iterate', source=source, types=types)
+			for (typ, variant), seconds in job.load().items():
+				add('iterate', '%s %s' % (typ, variant,), lines, seconds, unit='cpu-seconds')
+	text = source.dataset('text')
+	typed = None
+	if set(benchmarks) & {'dataset_type', 'dataset_sort', 'dataset_hashpart'}:
+		status('dataset_type')
+		column2type = {'int': 'int64_10', 'float': 'float64', 'date': 'date:%Y-%m-%d'}
+		if 'dataset_type' in benchmarks:
+			typed = standard('dataset_type', 'dataset_type', lines, source=text, column2type=column2type)
+		else:
+			typed = urd.build('dataset_type', source=text, column2type=column2type)
+	if 'dataset_sort' in benchmarks:
+		status('dataset_sort')
+		standard('dataset_sort', 'dataset_sort', lines, source=typed, sort_columns='int')
+	if 'dataset_hashpart' in benchmarks:
+		status('dataset_hashpart')
+		standard('dataset_hashpart', 'dataset_hashpart', lines, source=typed, hashlabel='int')
+	if set(benchmarks) & {'csvexport', 'csvimport'}:
+		status('csvexport')
+		if 'csvexport' in benchmarks:
+			csv = standard('csvexport', 'csvexport', lines, source=text, filename='bench.csv')
+		else:
+			csv = urd.build('csvexport', source=text, filename='bench.csv')
+	if 'csvimport' in benchmarks:
+		status('csvimport')
+		standard('csvimport', 'csvimport', lines, filename=csv.filename('bench.csv'))
+	if 'launch' in benchmarks:
+		status('launch')
+		for _ in range(repeat):
+			walls = sorted(build('bench_noop')[1] for _ in range(LAUNCH_COUNT))
+			add('launch', '', None, walls[LAUNCH_COUNT // 2])
+	res = sorted(best.values(), key=lambda r: (BENCHMARKS.index(r['name']), r['variant']))
+	for r in res:
+		r['lines_per_second'] = r['lines'] / r['seconds'] if r['lines'] and r['seconds'] else None
+	return res
+
+
+def machine_info(urd):
+	from accelerator import __version__ as ax_version
+	return dict(
+		accelerator=ax_version,
+		python=platform.python_version(),
+		implementation=platform.python_implementation(),
+		platform=platform.platform(),
+		machine=platform.machine(),
+		node=platform.node(),
+		cpu_count=cpu_count(),
+		slices=urd.info.slices,
+	)
+
+
+def show(results, compare=None):
+	old = {}
+	if compare:
+		# Version 1 results have no unit, and summed elapsed time for write
+		# and iterate, so those are not comparable.
+		old = {(r['name'], r['variant'], r.get('unit', 'seconds')): r['seconds'] for r in compare['results']}
+	rows = [('benchmark', 'lines/s', 'seconds', 'speedup' if compare else '')]
+	for r in results:
+		if r['lines_per_second']:
+			lps = '%.0f' % (r['lines_per_second'],)
+		else:
+			lps = '-'
+		speedup = ''
+		prev = old.get((r['name'], r['variant'], r['unit']))
+		if prev and r['seconds']:
+			speedup = '%.2fx' % (prev / r['seconds'],)
+		seconds = '%.3f%s' % (r['seconds'], '*' if r['unit'] == 'cpu-seconds' else ' ',)
+		rows.append(((r['name'] + ' ' + r['variant']).strip(), lps, seconds, speedup))
+	widths = [max(len(row[ix]) for row in rows) for ix in range(4)]
+	for row in rows:
+		print(('%-*s  %*s  %*s  %*s' % tuple(v for pair in zip(widths, row) for v in pair)).rstrip())
+	if any(r['unit'] == 'cpu-seconds' for r in results):
+		print()
+		print('* CPU-seconds summed over all slices, so lines/s is per CPU.')
+
+
+def main(argv, cfg):
+	all_types = sorted(generators)
+	parser = ArgumentParser(
+		prog=argv.pop(0),
+		usage="%(prog)s [options] [benchmark [benchmark [...]]]",
+		description="benchmark core data paths. needs accelerator.test_methods in\nmethod packages, and a running server.",
+		formatter_class=RawTextHelpFormatter,
+	)
+	parser.add_argument('-l', '--lines',   type=int, default=1000000, help="lines of data (in total), default 1000000", )
+	parser.add_argument('-t', '--types',   default=','.join(write_options['types']), help="comma separated types to write and iterate,\n\"all\" for all types. default " + ','.join(write_options['types']), )
+	parser.add_argument('-r', '--repeat',  type=int, default=1, help="run each benchmark this many times and keep the best", )
+	parser.add_argument('-o', '--output',  metavar='FILE', help="save results as json in FILE", )
+	parser.add_argument('-c', '--compare', metavar='FILE', help="compare with results saved with -o", )
+	parser.add_argument('benchmarks', nargs='*', metavar='benchmark', help="default all of " + ', '.join(BENCHMARKS), )
+	args = parser.parse_args(argv)
+
+	if args.types == 'all':
+		types = all_types
+	else:
+		types = args.types.split(',')
+	for typ in types:
+		if typ not in generators:
+			print('Unknown type %r, known types are %s' % (typ, ', '.join(all_types),), file=sys.stderr)
+			return 1
+	benchmarks = args.benchmarks or BENCHMARKS
+	for name in benchmarks:
+		if name not in BENCHMARKS:
+			print('Unknown benchmark %r, known benchmarks are %s' % (name, ', '.join(BENCHMARKS),), file=sys.stderr)
+			return 1
+	if args.repeat < 1 or args.lines < 1:
+		print('--lines and --repeat must be at least 1', file=sys.stderr)
+		return 1
+	compare = None
+	if args.compare:
+		with open(os.path.join(cfg.user_cwd, args.compare)) as fh:
+			compare = json.load(fh)
+
+	a = Automata(cfg.url)
+	a.wait()
+	a.update_methods()
+	if 'bench_write' not in a.methods_info():
+		print('The bench methods were not found, add accelerator.test_methods to method packages in your config file.', file=sys.stderr)
+		return 1
+	urd = make_urd(a)
+	def status(name):
+		print('running', name, file=sys.stderr)
+	starttime = datetime.now()
+	results = run_bench(urd, args.lines, types, args.repeat, benchmarks, status)
+	show(results, compare)
+	if args.output:
+		data = dict(
+			version=2,
+			starttime=str(starttime),
+			lines=args.lines,
+			repeat=args.repeat,
+			machine=machine_info(urd),
+			results=results,
+		)
+		with open(os.path.join(cfg.user_cwd, args.output), 'w') as fh:
+			json.dump(data, fh, indent=4, sort_keys=True)
+			fh.write('\n')
+	return 0
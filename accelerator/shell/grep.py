@@ -27,16 +27,103 @@ import re
 from multiprocessing import Process, JoinableQueue
 from itertools import chain, repeat
 import errno
+import heapq
 from os import write
 import json
 import datetime
 
 from accelerator.compat import ArgumentParser
-from accelerator.compat import unicode, izip, PY2
+from accelerator.compat import unicode, uni, izip, PY2
 from accelerator.colourwrapper import colour
+from accelerator.dataset import find_index
 from .parser import name2ds
 from accelerator import g
 
+try:
+	import re._parser as sre_parse
+except ImportError:
+	import sre_parse
+
+# Characters that can be in the str() of values of these types, so a
+# column of one of these types can only match if the required literal
+# of the pattern is made of these. (Plus "None" if the column has None.)
+_formatted_chars = {
+	'int64'    : '-0123456789',
+	'int32'    : '-0123456789',
+	'bits64'   : '0123456789',
+	'bits32'   : '0123456789',
+	'float64'  : '-+.0123456789efina',
+	'float32'  : '-+.0123456789efina',
+	'number'   : '-+.0123456789efina',
+	'complex64': '-+.0123456789efinaj()',
+	'complex32': '-+.0123456789efinaj()',
+	'bool'     : 'TrueFals',
+	'datetime' : '-:. 0123456789',
+	'date'     : '-0123456789',
+	'time'     : ':.0123456789',
+}
+
+def _parse_number(v):
+	try:
+		return int(v)
+	except ValueError:
+		return float(v)
+
+def _parse_datetime(v):
+	fmt = '%Y-%m-%d %H:%M:%S.%f' if '.' in v else '%Y-%m-%d %H:%M:%S'
+	return datetime.datetime.strptime(v, fmt)
+
+def _parse_time(v):
+	fmt = '%H:%M:%S.%f' if '.' in v else '%H:%M:%S'
+	return datetime.datetime.strptime(v, fmt).time()
+
+# How to turn the pattern into a value for --key
+_key_parsers = {
+	'int64'    : int,
+	'int32'    : int,
+	'bits64'   : int,
+	'bits32'   : int,
+	'float64'  : float,
+	'float32'  : float,
+	'number'   : _parse_number,
+	'complex64': complex,
+	'complex32': complex,
+	'bool'     : lambda v: {'True': True, 'False': False}[v],
+	'date'     : lambda v: datetime.datetime.strptime(v, '%Y-%m-%d').date(),
+	'datetime' : _parse_datetime,
+	'time'     : _parse_time,
+	'ascii'    : uni,
+	'unicode'  : uni,
+	'bytes'    : lambda v: v if PY2 else v.encode('utf-8', 'surrogateescape'),
+}
+
+def required_literal(pattern):
+	"""The longest string that every match of pattern must contain
+	(as utf-8), or None if there isn't one (that can be found cheaply)."""
+	try:
+		parsed = sre_parse.parse(pattern)
+	except Exception:
+		return None
+	state = getattr(parsed, 'state', None) or parsed.pattern
+	if state.flags & (re.IGNORECASE | re.LOCALE):
+		return None
+	best = current = []
+	for op, av in parsed:
+		if op == sre_parse.LITERAL:
+			current = current + [av]
+			if len(current) > len(best):
+				best = current
+		else:
+			current = []
+	if not best:
+		return None
+	if isinstance(pattern, bytes):
+		return bytes(bytearray(best))
+	try:
+		return ''.join(map(chr, best)).encode('utf-8', 'surrogateescape')
+	except UnicodeError:
+		return None
+
 def main(argv, cfg):
 	parser = ArgumentParser(
 		usage="%(prog)s [options] pattern ds [ds [...]] [column [column [...]]",
@@ -48,6 +135,7 @@ def main(argv, cfg):
 	parser.add_argument('-H', '--headers',      action='store_true', help="print column names before output (and on each change)", )
 	parser.add_argument('-O', '--ordered',      action='store_true', help="output in order (one slice at a time)", )
 	parser.add_argument('-g', '--grep',         action='append',     help="grep this column only, can be specified multiple times", metavar='COLUMN')
+	parser.add_argument('-k', '--key',                               help="lines where COLUMN is exactly pattern (not a regex), using a dataset_index job", metavar='COLUMN')
 	parser.add_argument('-s', '--slice',        action='append',     help="grep this slice only, can be specified multiple times",  type=int)
 	parser.add_argument('-D', '--show-dataset', action='store_true', help="show dataset on matching lines", )
 	parser.add_argument('-S', '--show-sliceno', action='store_true', help="show sliceno on matching lines", )
@@ -60,7 +148,11 @@ def main(argv, cfg):
 	parser.add_argument('columns', nargs='*', default=[])
 	args = parser.parse_intermixed_args(argv)
 
-	pat_s = re.compile(args.pattern, re.IGNORECASE if args.ignore_case else 0)
+	if args.key:
+		pat_s = needle = None
+	else:
+		pat_s = re.compile(args.pattern, re.IGNORECASE if args.ignore_case else 0)
+		needle = None if args.ignore_case else required_literal(args.pattern)
 	datasets = [name2ds(cfg, args.dataset)]
 	columns = []
 
@@ -106,6 +198,31 @@ def main(argv, cfg):
 		if bad:
 			return 1
 
+	indexes = {}
+	if args.key:
+		if args.ignore_case or args.grep:
+			print('ERROR: --key can not be combined with --ignore-case or --grep', file=sys.stderr)
+			return 1
+		for ds in datasets:
+			if args.key not in ds.columns:
+				print('ERROR: %s does not have column %r' % (ds, args.key,), file=sys.stderr)
+				return 1
+			typ = ds.columns[args.key].type
+			if typ not in _key_parsers:
+				print('ERROR: can not use --key on %s columns' % (typ,), file=sys.stderr)
+				return 1
+			try:
+				value = _key_parsers[typ](args.pattern)
+			except (ValueError, KeyError):
+				print('ERROR: %r is not a valid %s' % (args.pattern, typ,), file=sys.stderr)
+				return 1
+			index = find_index(cfg.url, ds, args.key)
+			if not index:
+				print('ERROR: no index for %s in %s, build dataset_index with source=%r and column=%r' % (args.key, ds, ds, args.key,), file=sys.stderr)
+				return 1
+			index, info = ds._index(args.key, index)
+			indexes[ds] = (value, index, info)
+
 	# never and always override env settings, auto (default) sets from env/tty
 	if args.colour == 'never':
 		colour.disable()
@@ -117,7 +234,7 @@ def main(argv, cfg):
 		highlight_matches = colour.enabled
 
 	# Don't highlight everything when just trying to cat
-	if args.pattern == '':
+	if args.pattern == '' or args.key:
 		highlight_matches = False
 
 	separator = args.separator
@@ -162,17 +279,23 @@ def main(argv, cfg):
 	def grep(ds, sliceno):
 		def no_conv(v):
 			return v
+		def decode_bytes(v):
+			if v is None:
+				return v
+			return v.decode('utf-8', 'replace' if PY2 else 'surrogateescape')
 		def mk_conv(col):
 			if ds.columns[col].type in ('bytes', 'unicode', 'ascii',):
 				if not ds.columns[col].none_support:
 					return no_conv
 			return unicode
-		chk = pat_s.search
-		def mk_iter(col):
+		chk = pat_s and pat_s.search
+		def mk_reader(col):
 			if ds.columns[col].type == 'ascii':
-				it = ds._column_iterator(sliceno, col, _type='unicode')
+				return ds._column_iterator(sliceno, col, _type='unicode')
 			else:
-				it = ds._column_iterator(sliceno, col)
+				return ds._column_iterator(sliceno, col)
+		def mk_iter(col):
+			it = mk_reader(col)
 			if ds.columns[col].type == 'bytes':
 				errors = 'replace' if PY2 else 'surrogateescape'
 				if ds.columns[col].none_support:
@@ -180,6 +303,15 @@ def main(argv, cfg):
 				else:
 					it = (v.decode('utf-8', errors) for v in it)
 			return it
+		def matching_lines(col):
+			conv = mk_conv(col)
+			t = ds.columns[col].type
+			reader = ds._column_iterator(sliceno, col, _type='unicode' if t == 'ascii' else None, needle=needle)
+			for v in reader:
+				if t == 'bytes' and v is not None:
+					v = v.decode('utf-8', 'replace' if PY2 else 'surrogateescape')
+				if chk(conv(v)):
+					yield reader.count - 1
 		def colour_item(item):
 			pos = 0
 			parts = []
@@ -231,6 +363,52 @@ def main(argv, cfg):
 				data.extend(show_items)
 				return separate(data, lens).encode('utf-8', errors)
 		used_columns = columns or sorted(ds.columns)
+		if args.key:
+			value, index, info = indexes[ds]
+			for _, lineno, d in ds._lookup(args.key, value, index, info, sliceno, used_columns):
+				items = [d[col] for col in used_columns]
+				for ix, col in enumerate(used_columns):
+					if ds.columns[col].type == 'bytes' and items[ix] is not None:
+						items[ix] = items[ix].decode('utf-8', 'replace' if PY2 else 'surrogateescape')
+				write(1, show() + b'\n')
+			return
+		# With a required literal, blob columns are first searched for it
+		# by the reader (without making objects for lines that don't have
+		# it), and only lines that matched are read in full.
+		if needle:
+			needle_columns = []
+			for col in sorted(grep_columns or used_columns):
+				dc = ds.columns[col]
+				if dc.type in ('bytes', 'unicode', 'ascii',):
+					needle_columns.append(col)
+				elif dc.type in _formatted_chars:
+					chars = _formatted_chars[dc.type]
+					if dc.none_support:
+						chars += 'None'
+					if needle.translate(None, chars.encode('ascii')):
+						continue # can not contain needle
+					break
+				else:
+					break
+			else:
+				# The matches from each column come in order, so merging
+				# them gives all matching lines in order (with duplicates).
+				want_lines = heapq.merge(*(matching_lines(col) for col in needle_columns))
+				readers = None
+				pos = 0
+				for lineno in want_lines:
+					if lineno < pos:
+						continue # already shown (matched in another column)
+					if readers is None:
+						readers = [mk_reader(col) for col in used_columns]
+						decoders = [decode_bytes if ds.columns[col].type == 'bytes' else no_conv for col in used_columns]
+					items = []
+					for reader, decode in izip(readers, decoders):
+						reader.skip(lineno - pos)
+						items.append(decode(next(reader)))
+					pos = lineno + 1
+					write(1, show() + b'\n')
+				return
 		if grep_columns and grep_columns != set(used_columns):
 			grep_iter = izip(*(mk_iter(col) for col in grep_columns))
 			conv_items = [mk_conv(col) for col in grep_columns]
@@ -93,6 +93,13 @@ urd: local {listen.urd}
 result directory: ./results
 input directory: {input}
 
+# Analysis processes are only started while the memory use of all
+# running analysis processes (in all jobs) is expected to fit in this
+# (Linux only). Each job always runs at least one slice, so with many
+# jobs at once it can still be exceeded. Slices that wait show up as
+# waiting in ax status. Accepts K, M, G or T suffixes.
+# analysis memory: 16G
+
 # If you want to run methods on different python interpreters you can
 # specify names for other interpreters here, and put that name after
 # the method in methods.conf.
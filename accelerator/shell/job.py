@@ -30,8 +30,43 @@ from accelerator.colourwrapper import colour
 from accelerator.setupfile import encode_setup
 from accelerator.compat import FileNotFoundError, url_quote
 from accelerator.unixhttp import call
+from accelerator.extras import quote
+from accelerator.iostats import totals, fmt_size
+from accelerator import rusage
 from .parser import name2job, JobNotFound
 
+def show_iostats(stats):
+	rows = [(
+		kind,
+		'%s %s' % (quote(ds), quote(column),),
+		fmt_size(compressed),
+		fmt_size(uncompressed),
+		'%d' % (values,),
+		'%.2fs' % (seconds,),
+	) for kind, ds, column, (compressed, uncompressed, values, seconds) in totals(stats)]
+	if not rows:
+		return
+	print()
+	print('io (compressed, uncompressed, values, seconds spent (de)compressing):')
+	widths = [max(len(row[ix]) for row in rows) for ix in range(6)]
+	for row in rows:
+		print('    %-*s  %-*s  %*s  %*s  %*s  %*s' % tuple(v for pair in zip(widths, row) for v in pair))
+
+def show_rusage(usage):
+	rows = [(
+		name,
+		fmt_size(u.maxrss),
+		'%.2fs' % (u.utime,),
+		'%.2fs' % (u.stime,),
+		'%d' % (u.majflt,),
+		'%d/%d' % (u.nvcsw, u.nivcsw,),
+	) for name, u in sorted(usage.items(), key=lambda item: rusage.sort_key(item[0]))]
+	print()
+	print('rusage (peak RSS, user, system, major faults, voluntary/involuntary context switches):')
+	widths = [max(len(row[ix]) for row in rows) for ix in range(6)]
+	for row in rows:
+		print('    %-*s  %*s  %*s  %*s  %*s  %*s' % tuple(v for pair in zip(widths, row) for v in pair))
+
 def show(url, job, show_output):
 	print(job.path)
 	print('=' * len(job.path))
@@ -40,7 +75,10 @@ def show(url, job, show_output):
 	setup.starttime = str(datetime.fromtimestamp(setup.starttime))
 	if 'endtime' in setup:
 		setup.endtime = str(datetime.fromtimestamp(setup.endtime))
+	usage = setup.get('exectime', {}).pop('rusage', None)
 	print(encode_setup(setup, as_str=True))
+	if usage:
+		show_rusage(usage)
 	if job.datasets:
 		print()
 		print('datasets:')
@@ -61,6 +99,8 @@ def show(url, job, show_output):
 		print('files:')
 		for fn in sorted(post.files):
 			print('   ', job.filename(fn))
+	if post and post.get('iostats'):
+		show_iostats(post.iostats)
 	if post and not call(url + '/job_is_current/' + url_quote(job)):
 		print(colour.blue('Job is not current'))
 	print()
@@ -92,19 +92,14 @@ def job_up(job, count):
 	return job
 
 def urd_call_w_tildes(cfg, path, tildes):
-	res = call(cfg.urd + '/' + path, server_name='urd', retries=0, quiet=True)
+	url = cfg.urd + '/' + path
 	if tildes:
 		up = sum(count for char, count in tildes if char == '^')
 		down = sum(count for char, count in tildes if char == '~')
-		tildes = down - up
-		if tildes:
-			key = res.user + '/' + res.build
-			timestamps = call(cfg.urd + '/' + key + '/since/0', server_name='urd', retries=0, quiet=True)
-			pos = timestamps.index(res.timestamp) + tildes
-			if pos < 0 or pos >= len(timestamps):
-				return None
-			res = call(cfg.urd + '/' + key + '/' + timestamps[pos], server_name='urd', retries=0, quiet=True)
-	return res
+		if down != up:
+			# urd moves that many entries from what path specifies
+			url += '?offset=%d' % (down - up,)
+	return call(url, server_name='urd', retries=0, quiet=True)
 
 def name2job(cfg, n):
 	n, tildes = split_tildes(n)
@@ -26,12 +26,15 @@ from accelerator.build import JobList
 from accelerator.job import Job
 from accelerator.shell.parser import split_tildes, urd_call_w_tildes
 from accelerator.error import UrdError
-from accelerator.compat import url_quote
+from accelerator.compat import url_quote, ArgumentParser
+from accelerator.unixhttp import call
 
 
 def main(argv, cfg):
 	prog = argv.pop(0)
 	user = environ.get('USER', 'NO-USER')
+	if argv and argv[0] == 'compact':
+		return compact(prog, argv[1:], cfg)
 	if '--help' in argv or '-h' in argv:
 		fh = sys.stdout if argv else sys.stderr
 		print('usage: %s path [path [...]]' % (prog,), file=fh)
@@ -43,6 +46,9 @@ def main(argv, cfg):
 		print('use "path/since/ts" or just "path/" to list timestamps', file=fh)
 		print('use "/" (or nothing) to list all lists', file=fh)
 		print(file=fh)
+		print('"%s compact list" rewrites the log for list with only the current entries.' % (prog,), file=fh)
+		print('(use "%s/compact" for a list called compact.)' % (user,), file=fh)
+		print(file=fh)
 		print('you can also use :urdlist:[entry] job specifiers. urdlist follows the same', file=fh)
 		print('path rules as above, entry is an optional argument to joblist.get() printing', file=fh)
 		print('just the resultant jobid.', file=fh)
@@ -113,6 +119,40 @@ def main(argv, cfg):
 			continue
 		print(fmt(res, entry))
 
+def compact(prog, argv, cfg):
+	from base64 import b64encode
+	parser = ArgumentParser(
+		prog=prog + ' compact',
+		description='rewrite the urd log for a list with only the current entries, so urd starts faster. '
+		'urd versions without compaction can not read the compacted log.',
+	)
+	parser.add_argument('--archive', action='store_true', help='keep the old log in an .archive file')
+	parser.add_argument('list', help='list or user/list, you can only compact your own lists')
+	args = parser.parse_args(argv)
+	if not cfg.urd:
+		print('No urd configured', file=sys.stderr)
+		return 1
+	if 'URD_AUTH' in environ:
+		auth = environ['URD_AUTH']
+	else:
+		auth = environ.get('USER', 'NO-USER') + ':'
+	path = args.list.strip('/').split('/')
+	if len(path) == 1:
+		path.insert(0, auth.split(':', 1)[0])
+	if len(path) != 2 or not all(path):
+		print('%r is not a list' % (args.list,), file=sys.stderr)
+		return 1
+	auth = b64encode(auth.encode('utf-8')).decode('ascii')
+	url = cfg.urd + '/compact/' + '/'.join(url_quote(el) for el in path)
+	if args.archive:
+		url += '?archive'
+	try:
+		res = call(url, data='', headers={'Authorization': 'Basic ' + auth}, server_name='urd', retries=0)
+	except UrdError as e:
+		print(e, file=sys.stderr)
+		return 1
+	print('Kept %d entries, dropped %d log lines.' % (res.count, res.dropped,))
+
 def fmt(res, entry):
 	if not res:
 		return ''
@@ -47,8 +47,10 @@ from multiprocessing import Process
 from threading import Thread
 import struct
 import locale
+import json
 
 from accelerator import OptionString, DotDict
+from accelerator import rusage
 from accelerator.dsutil import typed_reader
 from accelerator.compat import setproctitle, uni
 from . import csvimport
@@ -115,7 +117,8 @@ def reader_process(slices, filename, write_fds, labels_fd, success_fd, status_fd
 	success_fd = 2
 	res = cstuff.backend.reader(filename.encode("utf-8"), slices, options.skip_lines, options.skip_empty_lines, write_fds, labels_fd, status_fd, comment_char, lf_char)
 	if not res:
-		os.write(success_fd, b"\0")
+		# Success, followed by our resource usage for the launcher to record.
+		os.write(success_fd, b"\0" + json.dumps(rusage.get()).encode("ascii"))
 	os.close(success_fd)
 
 def char2int(name, empty_value, specials="empty"):
@@ -312,9 +315,10 @@ def synthesis(prepare_res, analysis_res):
 		reader_res = success_fh.read()
 	except OSError:
 		pass
-	if reader_res != b"\0":
+	if reader_res[:1] != b"\0":
 		reader_res = reader_res.decode("utf-8", "replace").strip("\r\n \t\0")
 		raise Exception(reader_res or "Reader process failed")
+	rusage.record("reader", json.loads(reader_res[1:].decode("ascii")))
 	success_fh.close()
 	os.unlink("reader.success")
 	good_counts = []
@@ -0,0 +1,146 @@
+############################################################################
+#                                                                          #
+# Copyright (c) 2021 Carl Drougge                                          #
+#                                                                          #
+# Licensed under the Apache License, Version 2.0 (the "License");          #
+# you may not use this file except in compliance with the License.         #
+# You may obtain a copy of the License at                                  #
+#                                                                          #
+#  http://www.apache.org/licenses/LICENSE-2.0                              #
+#                                                                          #
+# Unless required by applicable law or agreed to in writing, software      #
+# distributed under the License is distributed on an "AS IS" BASIS,        #
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. #
+# See the License for the specific language governing permissions and      #
+# limitations under the License.                                           #
+#                                                                          #
+############################################################################
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+description = r'''
+Index a dataset on one column, for Dataset.lookup and "ax grep --key".
+
+The lines in each slice are put in buckets by the hash of options.column,
+and each bucket is stored (compressed) with the line numbers and the
+values of options.column and options.columns (default none). A lookup
+only has to read and decompress one bucket per slice, and only one slice
+if the dataset is hashed on options.column. Other columns are read from
+the dataset, skipping to the matching lines.
+
+Including columns makes lookups of them faster, but it is a copy of them.
+
+At most about options.chunk_lines lines are held in memory at once, the
+rest of the buckets wait in temporary files.
+
+Each slice is stored in the file "index" (sliced) as
+    number of buckets (uint64)
+    offsets of the buckets in the file (uint64 * (number of buckets + 1))
+    buckets (zlib compressed pickles of [(lineno, value, ...)])
+with all numbers little endian. A line is in bucket
+hash // slices % number of buckets, where hash is the same hash that is
+used for hashlabels. (Dividing by slices first means all buckets get
+used even when the dataset is hashed on the column.)
+'''
+
+from struct import pack
+import zlib
+import pickle
+import os
+
+from accelerator.dsutil import typed_writer
+
+options = dict(
+	column       = str,
+	columns      = set(),
+	bucket_lines = 256, # on average
+	chunk_lines  = 1000000,
+)
+
+datasets = ('source',)
+
+def prepare():
+	assert options.column, 'Specify options.column'
+	assert options.column in datasets.source.columns, 'Column %r not in %s' % (options.column, datasets.source,)
+	typ = datasets.source.columns[options.column].type
+	assert typ not in ('json', 'pickle',), 'Can not index %s columns' % (typ,)
+	assert options.bucket_lines > 0, 'bucket_lines must be > 0'
+	assert options.chunk_lines > 0, 'chunk_lines must be > 0'
+	columns = set(options.columns)
+	missing = columns - set(datasets.source.columns)
+	assert not missing, 'Columns %r not in %s' % (sorted(missing), datasets.source,)
+	columns.discard(options.column)
+	return [options.column] + sorted(columns)
+
+def analysis(sliceno, slices, prepare_res, job):
+	columns = prepare_res
+	hash = typed_writer(datasets.source.columns[options.column].type).hash
+	lines = datasets.source.lines[sliceno]
+	nbuckets = max(lines // options.bucket_lines, 1)
+	# The buckets are split in chunks (ranges of buckets) of about
+	# chunk_lines lines. The lines of each chunk are first written to a
+	# temporary file (in batches), then each chunk is read back and made
+	# into buckets on its own. (With only one chunk nothing is written.)
+	nchunks = min(max(-(-lines // options.chunk_lines), 1), nbuckets)
+	bounds = [-(-chunkno * nbuckets // nchunks) for chunkno in range(nchunks + 1)]
+	batch_lines = max(options.chunk_lines // nchunks, 1)
+	tmp_names = ['index.%d.%d.tmp' % (sliceno, chunkno,) for chunkno in range(nchunks)]
+	pending = [[] for _ in range(nchunks)]
+	if len(columns) == 1:
+		it = ((v,) for v in datasets.source.iterate(sliceno, columns[0]))
+	else:
+		it = datasets.source.iterate(sliceno, columns)
+	tmp_files = {}
+	try:
+		for lineno, values in enumerate(it):
+			bucketno = hash(values[0]) // slices % nbuckets
+			chunkno = bucketno * nchunks // nbuckets
+			pending[chunkno].append((bucketno, lineno,) + values)
+			if nchunks > 1 and len(pending[chunkno]) >= batch_lines:
+				if chunkno not in tmp_files:
+					tmp_files[chunkno] = open(tmp_names[chunkno], 'wb')
+				pickle.dump(pending[chunkno], tmp_files[chunkno], 2)
+				pending[chunkno] = []
+		for fh in tmp_files.values():
+			fh.close()
+		offset = 8 * (nbuckets + 2)
+		offsets = [offset]
+		with job.open('index', 'wb', sliceno=sliceno, temp=False) as fh:
+			fh.write(b'\0' * offset) # filled in at the end
+			for chunkno in range(nchunks):
+				lo, hi = bounds[chunkno], bounds[chunkno + 1]
+				buckets = [[] for _ in range(lo, hi)]
+				def add(batch):
+					for line in batch:
+						buckets[line[0] - lo].append(line[1:])
+				if chunkno in tmp_files:
+					with open(tmp_names[chunkno], 'rb') as tmp_fh:
+						while True:
+							try:
+								add(pickle.load(tmp_fh))
+							except EOFError:
+								break
+					os.unlink(tmp_names[chunkno])
+				add(pending[chunkno])
+				pending[chunkno] = None
+				for bucket in buckets:
+					blob = zlib.compress(pickle.dumps(bucket, 2))
+					fh.write(blob)
+					offset += len(blob)
+					offsets.append(offset)
+			fh.seek(0)
+			fh.write(pack('<%dQ' % (nbuckets + 2,), nbuckets, *offsets))
+	finally:
+		for chunkno, fh in tmp_files.items():
+			fh.close()
+			if os.path.exists(tmp_names[chunkno]):
+				os.unlink(tmp_names[chunkno])
+
+def synthesis(prepare_res):
+	return dict(
+		source=datasets.source,
+		column=options.column,
+		columns=prepare_res,
+	)
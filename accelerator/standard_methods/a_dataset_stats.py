@@ -0,0 +1,196 @@
+############################################################################
+#                                                                          #
+# Copyright (c) 2021 Carl Drougge                                          #
+#                                                                          #
+# Licensed under the Apache License, Version 2.0 (the "License");          #
+# you may not use this file except in compliance with the License.         #
+# You may obtain a copy of the License at                                  #
+#                                                                          #
+#  http://www.apache.org/licenses/LICENSE-2.0                              #
+#                                                                          #
+# Unless required by applicable law or agreed to in writing, software      #
+# distributed under the License is distributed on an "AS IS" BASIS,        #
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. #
+# See the License for the specific language governing permissions and      #
+# limitations under the License.                                           #
+#                                                                          #
+############################################################################
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+description = r'''
+Statistics for the columns of a dataset, shown on the dataset page in
+the board.
+
+Per slice this gives the number of lines, the number of None values,
+min and max and an estimate of the number of distinct values. For the
+whole dataset it also gives an estimate of the number of distinct values
+and a histogram (with options.bins bins) for numeric and date/time
+columns. (Not for float columns with inf values, as the bins would be
+infinitely wide.)
+
+Distinct counts are exact up to about 10000 distinct values per slice,
+above that they are estimated with HyperLogLog (about 2% error).
+
+options.columns defaults to all columns in the source dataset.
+'''
+
+from datetime import date, datetime, time, timedelta
+from math import log, isinf, isnan
+from json import JSONEncoder
+import pickle
+
+from accelerator.dsutil import typed_writer
+
+options = dict(
+	columns      = set(),
+	bins         = 20,
+)
+
+datasets = ('source',)
+
+EXACT_LIMIT = 10000
+HLL_BITS = 12
+HLL_SIZE = 1 << HLL_BITS
+
+EPOCH = datetime(1970, 1, 1)
+_tonumber = {
+	'date'    : date.toordinal,
+	'datetime': lambda v: (v - EPOCH).total_seconds(),
+	'time'    : lambda v: v.hour * 3600 + v.minute * 60 + v.second + v.microsecond / 1000000,
+}
+_fromnumber = {
+	'date'    : lambda v: date.fromordinal(int(v)),
+	'datetime': lambda v: EPOCH + timedelta(seconds=v),
+	'time'    : lambda v: time(int(v // 3600), int(v // 60 % 60), int(v % 60), int(v * 1000000 % 1000000)),
+}
+histogram_types = {'float64', 'float32', 'number', 'int64', 'int32', 'bits64', 'bits32', 'date', 'datetime', 'time'}
+unordered_types = {'complex64', 'complex32', 'json', 'pickle'}
+
+jsonenc = JSONEncoder(
+	sort_keys=True,
+	ensure_ascii=False,
+	check_circular=False,
+	separators=(',', ':'),
+).encode
+
+def hasher(typ):
+	if typ == 'json':
+		h = typed_writer('unicode').hash
+		return lambda v: h(jsonenc(v))
+	elif typ == 'pickle':
+		h = typed_writer('bytes').hash
+		return lambda v: h(pickle.dumps(v, 2))
+	else:
+		return typed_writer(typ).hash
+
+def hll_estimate(registers):
+	zeros = registers.count(0)
+	alpha = 0.7213 / (1 + 1.079 / HLL_SIZE)
+	estimate = alpha * HLL_SIZE * HLL_SIZE / sum(2.0 ** -r for r in registers)
+	if estimate <= 2.5 * HLL_SIZE and zeros:
+		estimate = HLL_SIZE * log(HLL_SIZE / zeros)
+	return int(round(estimate))
+
+def prepare():
+	assert options.bins >= 1, 'bins must be at least 1'
+	columns = sorted(options.columns or datasets.source.columns)
+	ranges = {}
+	for n in columns:
+		col = datasets.source.columns[n]
+		if col.type in histogram_types and col.min is not None and col.max is not None:
+			tonumber = _tonumber.get(col.type, float)
+			lo, hi = tonumber(col.min), tonumber(col.max)
+			if not (isnan(lo) or isnan(hi) or isinf(lo) or isinf(hi)):
+				ranges[n] = (lo, hi)
+	return columns, ranges
+
+def analysis(sliceno, prepare_res):
+	columns, ranges = prepare_res
+	res = {}
+	for n in columns:
+		typ = datasets.source.columns[n].type
+		hash = hasher(typ)
+		ordered = typ not in unordered_types
+		is_float = typ in ('float64', 'float32', 'number')
+		registers = bytearray(HLL_SIZE)
+		exact = set()
+		nulls = 0
+		lo = hi = None
+		if n in ranges:
+			tonumber = _tonumber.get(typ)
+			r_lo, r_hi = ranges[n]
+			width = (r_hi - r_lo) / options.bins or 1
+			histogram = [0] * options.bins
+		else:
+			histogram = None
+		for v in datasets.source.iterate(sliceno, n):
+			if v is None:
+				nulls += 1
+				continue
+			h = hash(v)
+			if exact is not None:
+				exact.add(h)
+				if len(exact) > EXACT_LIMIT:
+					exact = None
+			ix = h & (HLL_SIZE - 1)
+			rank = 65 - HLL_BITS - (h >> HLL_BITS).bit_length()
+			if registers[ix] < rank:
+				registers[ix] = rank
+			if is_float and v != v:
+				continue # NaN has no place in min/max or the histogram
+			if ordered:
+				if lo is None:
+					lo = hi = v
+				elif v < lo:
+					lo = v
+				elif v > hi:
+					hi = v
+			if histogram is not None:
+				if is_float and isinf(v):
+					continue # inf has no place in the histogram either
+				if tonumber:
+					v = tonumber(v)
+				bin = int((v - r_lo) / width)
+				histogram[min(max(bin, 0), options.bins - 1)] += 1
+		res[n] = dict(nulls=nulls, min=lo, max=hi, exact=exact, registers=registers, histogram=histogram)
+	return res
+
+def synthesis(prepare_res, analysis_res):
+	columns, ranges = prepare_res
+	analysis_res = list(analysis_res)
+	res = {}
+	for n in columns:
+		col = datasets.source.columns[n]
+		parts = [part[n] for part in analysis_res]
+		registers = bytearray(HLL_SIZE)
+		for part in parts:
+			registers = bytearray(map(max, registers, part['registers']))
+		if all(part['exact'] is not None for part in parts):
+			distinct = len(set().union(*(part['exact'] for part in parts)))
+			distinct_exact = True
+		else:
+			distinct = hll_estimate(registers)
+			distinct_exact = False
+		if n in ranges:
+			lo, hi = ranges[n]
+			fromnumber = _fromnumber.get(col.type, lambda v: v)
+			edges = [fromnumber(lo + (hi - lo) * ix / options.bins) for ix in range(options.bins + 1)]
+			counts = [sum(c) for c in zip(*(part['histogram'] for part in parts))]
+			histogram = dict(edges=edges, counts=counts)
+		else:
+			histogram = None
+		res[n] = dict(
+			type=col.type,
+			lines=list(datasets.source.lines),
+			nulls=[part['nulls'] for part in parts],
+			min=[part['min'] for part in parts],
+			max=[part['max'] for part in parts],
+			distinct=[len(part['exact']) if part['exact'] is not None else hll_estimate(part['registers']) for part in parts],
+			distinct_total=distinct,
+			distinct_exact=distinct_exact,
+			histogram=histogram,
+		)
+	return res
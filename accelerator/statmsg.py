@@ -40,7 +40,7 @@ from contextlib import contextmanager
 from functools import partial
 from time import sleep
 from traceback import print_exc
-from threading import Lock
+from threading import Lock, Thread
 from weakref import WeakValueDictionary
 import socket
 import os
@@ -54,6 +54,9 @@ status_tree = {}
 status_all = WeakValueDictionary()
 status_stacks_lock = Lock()
 
+# How often analysis processes report their progress.
+PROGRESS_INTERVAL = 2.0
+
 
 # all currently (or recently) running launch.py PIDs
 class Children(set):
@@ -133,6 +136,20 @@ def _output(pid, msg):
 def _clear_output(pid):
 	_send('output', '', pid=pid)
 
+def _start_progress():
+	"""Report progress (rows and bytes read, RSS and CPU time) for this
+	process every PROGRESS_INTERVAL seconds, from a thread."""
+	from accelerator import iostats, rusage
+	def run():
+		while True:
+			rows, nbytes = iostats.progress()
+			times = os.times()
+			_send('progress', '%f\0%d\0%d\0%d\0%f' % (monotonic(), rows, nbytes, rusage.rss(), times[0] + times[1],))
+			sleep(PROGRESS_INTERVAL)
+	t = Thread(target=run, name='progress')
+	t.daemon = True
+	t.start()
+
 
 def status_stacks_export():
 	res = []
@@ -161,6 +178,21 @@ def status_stacks_export():
 		res.append((0, 0, 'ERROR', monotonic()))
 	return res, current
 
+def progress_export():
+	"""Latest progress from all processes that report it, as a list of
+	dicts with pid, job, name (e.g. "analysis(3)"), t, rows, bytes, rss,
+	cpu (seconds), and rows_per_second, bytes_per_second and cpu_percent
+	(since the previous report, None for the first one)."""
+	res = []
+	with status_stacks_lock:
+		for pid, d in iteritems(status_all):
+			if not d.progress or d.parent_pid not in status_all:
+				continue
+			job = status_all[d.parent_pid].stack[0][0].split(' ', 1)[0]
+			res.append(dict(d.progress, pid=pid, job=job, name=d.stack[0][0] if d.stack else ''))
+	res.sort(key=lambda p: (p['job'], p['pid']))
+	return res
+
 def print_status_stacks(stacks=None):
 	if stacks == None:
 		stacks, _ = status_stacks_export()
@@ -216,6 +248,21 @@ def statmsg_sink(sock):
 						status_all[pid].output = (msg, t,)
 					else:
 						status_all[pid].output = None
+				elif typ == 'progress':
+					d = status_all.get(pid)
+					if d:
+						t, rows, nbytes, rss, cpu = msg.split('\0')
+						p = dict(t=float(t), rows=int(rows), bytes=int(nbytes), rss=int(rss), cpu=float(cpu))
+						prev = d.progress
+						if prev and p['t'] > prev['t']:
+							duration = p['t'] - prev['t']
+							p['rows_per_second'] = (p['rows'] - prev['rows']) / duration
+							p['bytes_per_second'] = (p['bytes'] - prev['bytes']) / duration
+							p['cpu_percent'] = (p['cpu'] - prev['cpu']) * 100 / duration
+						else:
+							p['rows_per_second'] = p['bytes_per_second'] = p['cpu_percent'] = None
+						d.progress = p
+					del d
 				elif typ == 'start':
 					parent_pid, is_analysis, msg, t = msg.split('\0', 3)
 					parent_pid = int(parent_pid)
@@ -226,6 +273,7 @@ def statmsg_sink(sock):
 					d.stack      = [(msg, t, is_analysis or None)]
 					d.summary    = (t, msg, t,)
 					d.output     = None
+					d.progress   = None
 					if parent_pid in status_all:
 						if is_analysis:
 							msg, parent_t, _ = status_all[parent_pid].stack[0]
@@ -0,0 +1,71 @@
+############################################################################
+#                                                                          #
+# Copyright (c) 2021 Carl Drougge                                          #
+#                                                                          #
+# Licensed under the Apache License, Version 2.0 (the "License");          #
+# you may not use this file except in compliance with the License.         #
+# You may obtain a copy of the License at                                  #
+#                                                                          #
+#  http://www.apache.org/licenses/LICENSE-2.0                              #
+#                                                                          #
+# Unless required by applicable law or agreed to in writing, software      #
+# distributed under the License is distributed on an "AS IS" BASIS,        #
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. #
+# See the License for the specific language governing permissions and      #
+# limitations under the License.                                           #
+#                                                                          #
+############################################################################
+
+
+from __future__ import print_function
+from __future__ import division
+from __future__ import unicode_literals
+
+description = r'''
+Benchmark Dataset.iterate (used by ax bench).
+
+Iterates the datasets from a bench_write job in a few different ways and
+returns {(type, variant): seconds} with the CPU time summed over all slices.
+
+The variants are plain iteration, with filters, with translators and
+rehashing (except for types that can't be hashed).
+'''
+
+from collections import deque
+
+from accelerator.compat import process_time
+
+options = dict(
+	types=[],
+)
+
+jobs = ('source',)
+
+unhashable = {'json', 'pickle'}
+
+def drain(it):
+	deque(it, maxlen=0)
+
+def analysis(sliceno):
+	res = {}
+	for typ in options.types:
+		ds = jobs.source.dataset(typ)
+		variants = [
+			('plain', {}),
+			('filter', dict(filters={'v': lambda v: True})),
+			('translator', dict(translators={'v': lambda v: v})),
+		]
+		if typ not in unhashable:
+			variants.append(('rehash', dict(hashlabel='v', rehash=True)))
+		for variant, kw in variants:
+			t = process_time()
+			drain(ds.iterate(sliceno, 'v', **kw))
+			res[(typ, variant)] = process_time() - t
+	return res
+
+def synthesis(analysis_res):
+	res = {}
+	for part in analysis_res:
+		for key, seconds in part.items():
+			res[key] = res.get(key, 0) + seconds
+	return res
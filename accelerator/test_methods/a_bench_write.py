@@ -0,0 +1,104 @@
+############################################################################
+#                                                                          #
+# Copyright (c) 2021 Carl Drougge                                          #
+#                                                                          #
+# Licensed under the Apache License, Version 2.0 (the "License");          #
+# you may not use this file except in compliance with the License.         #
+# You may obtain a copy of the License at                                  #
+#                                                                          #
+#  http://www.apache.org/licenses/LICENSE-2.0                              #
+#                                                                          #
+# Unless required by applicable law or agreed to in writing, software      #
+# distributed under the License is distributed on an "AS IS" BASIS,        #
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. #
+# See the License for the specific language governing permissions and      #
+# limitations under the License.                                           #
+#                                                                          #
+############################################################################
+
+from __future__ import print_function
+from __future__ import division
+from __future__ import unicode_literals
+
+description = r'''
+Benchmark DatasetWriter.write (used by ax bench).
+
+Writes lines (in total) of synthetic data in one dataset per type (named
+as the type, with a single column "v"), and returns {type: seconds} with
+the CPU time spent writing summed over all slices. (Not including
+generating the data.)
+
+Also writes a "text" dataset with the columns "int", "float" and "date"
+as ascii, for benchmarking dataset_type, csvexport and csvimport.
+'''
+
+from random import Random
+from datetime import date, datetime, time, timedelta
+
+from accelerator.compat import process_time
+
+options = dict(
+	lines=1000000,
+	types=['int64', 'float64', 'number', 'bool', 'datetime', 'ascii', 'unicode', 'bytes', 'json'],
+	seed=42,
+)
+
+generators = {
+	'number'   : lambda r: r.randint(-2 ** 62, 2 ** 62),
+	'int64'    : lambda r: r.randint(-2 ** 62, 2 ** 62),
+	'int32'    : lambda r: r.randint(-2 ** 31 + 1, 2 ** 31 - 1),
+	'bits64'   : lambda r: r.getrandbits(64),
+	'bits32'   : lambda r: r.getrandbits(32),
+	'float64'  : lambda r: r.random() * 1e6,
+	'float32'  : lambda r: r.random() * 1e6,
+	'complex64': lambda r: complex(r.random(), r.random()),
+	'complex32': lambda r: complex(r.random(), r.random()),
+	'bool'     : lambda r: r.random() < 0.5,
+	'datetime' : lambda r: datetime(2000, 1, 1) + timedelta(seconds=r.randint(0, 10 ** 9), microseconds=r.randint(0, 999999)),
+	'date'     : lambda r: date(2000, 1, 1) + timedelta(days=r.randint(0, 10000)),
+	'time'     : lambda r: time(r.randint(0, 23), r.randint(0, 59), r.randint(0, 59), r.randint(0, 999999)),
+	'bytes'    : lambda r: ('%x' % (r.getrandbits(r.randint(1, 128)),)).encode('ascii'),
+	'ascii'    : lambda r: '%x' % (r.getrandbits(r.randint(1, 128)),),
+	'unicode'  : lambda r: '%x\xe5\u20ac' % (r.getrandbits(r.randint(1, 128)),),
+	'json'     : lambda r: {'a': r.randint(0, 1000), 'b': [r.random(), None]},
+	'pickle'   : lambda r: (r.randint(0, 1000), r.random(), 'x'),
+}
+
+def prepare(job):
+	for typ in options.types:
+		assert typ in generators, 'Unknown type %r' % (typ,)
+		job.datasetwriter(name=typ, columns={'v': typ})
+	job.datasetwriter(name='text', columns={'int': 'ascii', 'float': 'ascii', 'date': 'ascii'})
+
+def analysis(sliceno, slices, job):
+	lines = options.lines // slices
+	if sliceno < options.lines % slices:
+		lines += 1
+	res = {}
+	for typ in options.types:
+		rnd = Random('%d %s %d' % (options.seed, typ, sliceno,))
+		gen = generators[typ]
+		values = [gen(rnd) for _ in range(lines)]
+		dw = job.datasetwriter(name=typ)
+		write = dw.write
+		t = process_time()
+		for v in values:
+			write(v)
+		dw.close()
+		res[typ] = process_time() - t
+	rnd = Random('%d text %d' % (options.seed, sliceno,))
+	write = job.datasetwriter(name='text').write
+	for _ in range(lines):
+		write(
+			int='%d' % (rnd.randint(-2 ** 40, 2 ** 40),),
+			float='%.6f' % (rnd.random() * 1e6,),
+			date=str(date(2000, 1, 1) + timedelta(days=rnd.randint(0, 10000))),
+		)
+	return res
+
+def synthesis(analysis_res):
+	res = {}
+	for part in analysis_res:
+		for typ, seconds in part.items():
+			res[typ] = res.get(typ, 0) + seconds
+	return res
@@ -0,0 +1,87 @@
+############################################################################
+#                                                                          #
+# Copyright (c) 2026 Carl Drougge                                          #
+#                                                                          #
+# Licensed under the Apache License, Version 2.0 (the "License");          #
+# you may not use this file except in compliance with the License.         #
+# You may obtain a copy of the License at                                  #
+#                                                                          #
+#  http://www.apache.org/licenses/LICENSE-2.0                              #
+#                                                                          #
+# Unless required by applicable law or agreed to in writing, software      #
+# distributed under the License is distributed on an "AS IS" BASIS,        #
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. #
+# See the License for the specific language governing permissions and      #
+# limitations under the License.                                           #
+#                                                                          #
+############################################################################
+
+from __future__ import print_function
+from __future__ import division
+from __future__ import unicode_literals
+
+description = r'''
+Test that analysis slices wait for memory with a (very small) analysis
+memory budget. They should all still run, but one at a time.
+
+With options.other_job a process that looks like a big analysis process
+in another job is started first, and the budget is what that uses. The
+slices here would fit in that on their own, but they have to share it.
+'''
+
+import os
+import signal
+from time import sleep
+
+from accelerator import launch, rusage
+from accelerator.compat import monotonic
+
+options = dict(
+	other_job=False,
+)
+
+def prepare():
+	if rusage.memory(os.getpid()) is None:
+		return None
+	if not options.other_job:
+		# As if "analysis memory" in the config was one byte. (This is
+		# read when analysis is started, which is after prepare.)
+		launch._analysis_memory = 1
+		return True
+	assert os.environ.get('BD_ANALYSIS_PIDS'), 'The server should give a directory for analysis pids'
+	r, w = os.pipe()
+	pid = os.fork()
+	if not pid:
+		os.close(r)
+		data = b'x' * (256 * 1024 * 1024)
+		os.write(w, b'a')
+		sleep(600)
+		os._exit(len(data) and 0)
+	os.close(w)
+	assert os.read(r, 1) == b'a'
+	os.close(r)
+	launch._analysis_register(pid)
+	launch._analysis_memory = rusage.memory(pid)
+	return pid
+
+def analysis(sliceno):
+	start = monotonic()
+	data = [sliceno] * 1000000
+	sleep(0.2)
+	return sum(data), start, monotonic()
+
+def synthesis(prepare_res, analysis_res, slices):
+	res = list(analysis_res)
+	if options.other_job and prepare_res:
+		launch._analysis_unregister(prepare_res)
+		os.kill(prepare_res, signal.SIGKILL)
+		os.waitpid(prepare_res, 0)
+	assert [v[0] for v in res] == [sliceno * 1000000 for sliceno in range(slices)], res
+	if not prepare_res:
+		print("Can't measure memory use here, so no memory budget.")
+		return
+	# Slice 0 starts first, then the others one at a time.
+	times = sorted(v[1:] for v in res)
+	assert times[0] == res[0][1:], res
+	for (_, prev_end), (start, _) in zip(times, times[1:]):
+		assert start >= prev_end, "Slices ran at the same time with no memory to spare: %r" % (res,)
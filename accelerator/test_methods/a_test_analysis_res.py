@@ -0,0 +1,55 @@
+############################################################################
+#                                                                          #
+# Copyright (c) 2021 Carl Drougge                                          #
+#                                                                          #
+# Licensed under the Apache License, Version 2.0 (the "License");          #
+# you may not use this file except in compliance with the License.         #
+# You may obtain a copy of the License at                                  #
+#                                                                          #
+#  http://www.apache.org/licenses/LICENSE-2.0                              #
+#                                                                          #
+# Unless required by applicable law or agreed to in writing, software      #
+# distributed under the License is distributed on an "AS IS" BASIS,        #
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. #
+# See the License for the specific language governing permissions and      #
+# limitations under the License.                                           #
+#                                                                          #
+############################################################################
+
+from __future__ import print_function
+from __future__ import division
+from __future__ import unicode_literals
+
+description = r'''
+Test that analysis_res works with buffers (which are saved separately) and
+with stream_analysis_res (synthesis gets slices while others still run).
+'''
+
+from time import time, sleep
+
+try:
+	from pickle import PickleBuffer
+except ImportError:
+	# Older python, no out-of-band buffers.
+	PickleBuffer = bytearray
+
+stream_analysis_res = True
+
+def analysis(sliceno, slices):
+	if sliceno == slices - 1:
+		sleep(1)
+	data = bytearray(str(sliceno).encode('ascii') * 100000)
+	return PickleBuffer(data), {sliceno: len(data)}, time()
+
+def synthesis(analysis_res, slices):
+	first_loaded = None
+	lens = {}
+	for sliceno, (data, d, done_t) in enumerate(analysis_res):
+		if first_loaded is None:
+			first_loaded = time()
+		data = memoryview(data)
+		assert data.tobytes() == str(sliceno).encode('ascii') * 100000
+		assert not data.readonly
+		lens.update(d)
+	assert sorted(lens) == list(range(slices))
+	assert first_loaded < done_t, "slice 0 wasn't available until slice %d was done" % (sliceno,)
@@ -0,0 +1,125 @@
+############################################################################
+#                                                                          #
+# Copyright (c) 2021 Carl Drougge                                          #
+#                                                                          #
+# Licensed under the Apache License, Version 2.0 (the "License");          #
+# you may not use this file except in compliance with the License.         #
+# You may obtain a copy of the License at                                  #
+#                                                                          #
+#  http://www.apache.org/licenses/LICENSE-2.0                              #
+#                                                                          #
+# Unless required by applicable law or agreed to in writing, software      #
+# distributed under the License is distributed on an "AS IS" BASIS,        #
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. #
+# See the License for the specific language governing permissions and      #
+# limitations under the License.                                           #
+#                                                                          #
+############################################################################
+
+from __future__ import print_function
+from __future__ import division
+from __future__ import unicode_literals
+
+description = r'''
+Test dataset_index, Dataset.lookup and "ax grep --key".
+'''
+
+options = dict(
+	command_prefix=['ax', '--config', '/some/path/here'],
+)
+
+from subprocess import check_output
+from struct import unpack
+import json
+import zlib
+import pickle
+
+from accelerator import subjobs
+from accelerator.error import DatasetUsageError
+
+def synthesis(job, slices):
+	dw = job.datasetwriter(name='hashed', hashlabel='key')
+	dw.add('key', 'unicode')
+	dw.add('n', 'int64')
+	dw.add('b', 'bytes')
+	write = dw.get_split_write()
+	for ix in range(3000):
+		write('k%d' % (ix % 97,), ix, b'\xff%d' % (ix,))
+	hashed = dw.finish()
+	dw = job.datasetwriter(name='unhashed')
+	dw.add('key', 'unicode')
+	dw.add('n', 'int64', none_support=True)
+	for sliceno in range(slices):
+		dw.set_slice(sliceno)
+		for ix in range(1000):
+			dw.write('k%d' % (ix,), None if ix % 10 == 3 else ix % 7)
+	unhashed = dw.finish()
+
+	def brute(ds, column, value, columns):
+		res = []
+		for sliceno in range(slices):
+			for line in ds.iterate(sliceno, columns):
+				if dict(zip(columns, line))[column] == value:
+					res.append(line)
+		return res
+
+	# small buckets so there is more than one, and small chunks so
+	# they go through temporary files.
+	key_index = subjobs.build('dataset_index', source=hashed, column='key', bucket_lines=10, chunk_lines=100)
+	# only the key is stored by default, the rest is read from the dataset
+	assert key_index.load()['columns'] == ['key']
+	for value in ('k0', 'k17', 'k96'):
+		want = brute(hashed, 'key', value, ['b', 'key', 'n'])
+		assert len(want) in (30, 31), want
+		assert hashed.lookup('key', value) == want
+		assert hashed.lookup('key', value, index=key_index) == want
+		assert hashed.lookup('key', value, columns='n') == [line[2] for line in want]
+		assert hashed.lookup('key', value, columns=['n']) == [(line[2],) for line in want]
+	assert hashed.lookup('key', 'k97') == []
+
+	# unique values in a dataset hashed on them should use (almost) all
+	# buckets in every slice, not only those that match the slice.
+	dw = job.datasetwriter(name='unique', hashlabel='n')
+	dw.add('n', 'int64')
+	write = dw.get_split_write()
+	for ix in range(3000):
+		write(ix)
+	unique = dw.finish()
+	unique_index = subjobs.build('dataset_index', source=unique, column='n', bucket_lines=5)
+	for sliceno in range(slices):
+		with unique_index.open('index', 'rb', sliceno=sliceno) as fh:
+			nbuckets, = unpack('<Q', fh.read(8))
+			offsets = unpack('<%dQ' % (nbuckets + 1,), fh.read(8 * (nbuckets + 1)))
+		empty = len(zlib.compress(pickle.dumps([], 2)))
+		used = sum(b - a > empty for a, b in zip(offsets, offsets[1:]))
+		assert used > nbuckets * 0.9, 'Only %d of %d buckets used in slice %d' % (used, nbuckets, sliceno,)
+	for value in (0, 1, 2, 1500, 2999):
+		assert unique.lookup('n', value) == [(value,)]
+
+	n_index = subjobs.build('dataset_index', source=unhashed, column='n', columns={'key'})
+	for value in (0, 6, None):
+		want = brute(unhashed, 'n', value, ['key', 'n'])
+		assert want
+		assert unhashed.lookup('n', value) == want
+	try:
+		unhashed.lookup('key', 'k3', index=n_index)
+		raise Exception('Using an index for the wrong column worked')
+	except DatasetUsageError:
+		pass
+	try:
+		unhashed.lookup('n', 3, columns=['key', 'nonexistent'])
+		raise Exception('Looking up a column that is not in the dataset worked')
+	except DatasetUsageError:
+		pass
+
+	def grep(*a):
+		cmd = options.command_prefix + ['grep', '--ordered', '--format=json'] + list(a)
+		return [json.loads(line) for line in check_output(cmd).decode('utf-8', 'surrogatepass').split('\n')[:-1]]
+	got = grep('-S', '-L', '--key', 'key', 'k17', hashed)
+	want = [
+		{'sliceno': sliceno, 'lineno': lineno, 'data': {'b': d['b'].decode('utf-8', 'surrogateescape'), 'key': d['key'], 'n': d['n']}}
+		for sliceno, lineno, d in hashed._lookup('key', 'k17', *hashed._index('key'), columns=['b', 'n'])
+	]
+	assert len(want) == 31 and got == want, got
+	got = grep('--key', 'n', '6', unhashed, 'key')
+	assert got == [{'key': key} for key in unhashed.lookup('n', 6, columns='key')], got
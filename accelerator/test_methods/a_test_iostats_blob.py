@@ -0,0 +1,53 @@
+############################################################################
+#                                                                          #
+# Copyright (c) 2026 Carl Drougge                                          #
+#                                                                          #
+# Licensed under the Apache License, Version 2.0 (the "License");          #
+# you may not use this file except in compliance with the License.         #
+# You may obtain a copy of the License at                                  #
+#                                                                          #
+#  http://www.apache.org/licenses/LICENSE-2.0                              #
+#                                                                          #
+# Unless required by applicable law or agreed to in writing, software      #
+# distributed under the License is distributed on an "AS IS" BASIS,        #
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. #
+# See the License for the specific language governing permissions and      #
+# limitations under the License.                                           #
+#                                                                          #
+############################################################################
+
+from __future__ import print_function
+from __future__ import division
+from __future__ import unicode_literals
+
+description = r'''
+Write a bytes column with values longer than the read buffer (and many
+that straddle buffer boundaries), and return the uncompressed size of
+each slice, so the iostats of a job reading it can be checked.
+'''
+
+from accelerator.dataset import DatasetWriter
+
+def values(sliceno):
+	yield b'a' * (300000 + sliceno)
+	for ix in range(500):
+		yield (b'%d' % (ix,)) * (300 + sliceno)
+	yield b'b' * 200000
+	for ix in range(100):
+		yield b'c' * (ix + 1)
+
+def prepare():
+	dw = DatasetWriter()
+	dw.add('blob', 'bytes')
+	return dw
+
+def analysis(sliceno, prepare_res):
+	size = 0
+	for v in values(sliceno):
+		prepare_res.write(v)
+		# one byte length, or 255 and four bytes length
+		size += len(v) + (1 if len(v) < 255 else 5)
+	return size
+
+def synthesis(analysis_res):
+	return list(analysis_res)
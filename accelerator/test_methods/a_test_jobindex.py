@@ -0,0 +1,136 @@
+############################################################################
+#                                                                          #
+# Copyright (c) 2021 Carl Drougge                                          #
+#                                                                          #
+# Licensed under the Apache License, Version 2.0 (the "License");          #
+# you may not use this file except in compliance with the License.         #
+# You may obtain a copy of the License at                                  #
+#                                                                          #
+#  http://www.apache.org/licenses/LICENSE-2.0                              #
+#                                                                          #
+# Unless required by applicable law or agreed to in writing, software      #
+# distributed under the License is distributed on an "AS IS" BASIS,        #
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. #
+# See the License for the specific language governing permissions and      #
+# limitations under the License.                                           #
+#                                                                          #
+############################################################################
+
+from __future__ import print_function
+from __future__ import division
+from __future__ import unicode_literals
+
+description = r'''
+Test the persistent job index (.jobindex in each workdir).
+
+Checks that the server has an index entry for jobs.source, and that an
+index is reused after reloading, that entries are only valid for the
+mtime they were stored with and that truncated or corrupt index files
+are recovered from.
+'''
+
+import os
+
+from accelerator.workspace import JobIndex, _job_mtime
+from accelerator.compat import pickle
+
+jobs = ('source',)
+
+def synthesis(job):
+	# The server indexes jobs as they finish.
+	source = jobs.source
+	index = JobIndex(os.path.dirname(source.path))
+	index.load()
+	mtime = os.stat(source.path).st_mtime
+	assert index.mtime(source) == mtime, "%s not in the index (or wrong mtime)" % (source,)
+	setup, subjobs = index.get(source, mtime)
+	assert setup.method == source.method and setup.jobid == source, setup
+	assert index.get(source, mtime + 1) is None
+
+	path = job.filename('wd')
+	os.mkdir(path)
+	fn = os.path.join(path, '.jobindex')
+	def load():
+		index = JobIndex(path)
+		index.load()
+		return index
+	params = {'wd-%d' % (ix,): ({'n': ix}, []) for ix in range(5)}
+
+	index = load()
+	assert index.entries == {} and index.need_rewrite
+	for jobid, p in params.items():
+		index.add(jobid, 1.0, p)
+	index.add('wd-nomtime', None, ({}, []))
+	index.flush()
+	assert not index.need_rewrite
+
+	# Reused after reloading, unless the mtime has changed.
+	index = load()
+	assert not index.need_rewrite
+	assert index.records == 5
+	for jobid, p in params.items():
+		assert index.get(jobid, 1.0) == p
+		assert index.get(jobid, 2.0) is None
+		assert index.get(jobid, None) is None
+	assert index.get('wd-nomtime', None) is None
+
+	# A new entry for a job is appended, and the newest one is used.
+	size = os.path.getsize(fn)
+	index.add('wd-1', 2.0, ({'n': 'new'}, []))
+	index.flush()
+	assert os.path.getsize(fn) > size, "Not appended"
+	index = load()
+	assert index.records == 6
+	assert index.get('wd-1', 1.0) is None
+	assert index.get('wd-1', 2.0) == ({'n': 'new'}, [])
+
+	# Only live jobs are kept, the garbage is eventually rewritten away.
+	index.flush(set(params) - {'wd-0'})
+	index = load()
+	assert index.get('wd-0', 1.0) == params['wd-0'], "Dropped entry should stay on disk until rewrite"
+	for _ in range(1010):
+		index.add('wd-2', 3.0, params['wd-2'])
+	index.flush(set(params) - {'wd-0'})
+	index = load()
+	assert index.records == 4 and 'wd-0' not in index.entries, index.records
+	assert index.get('wd-2', 3.0) == params['wd-2']
+
+	# Truncated: keep what can be read, rewrite on the next flush.
+	with open(fn, 'rb') as fh:
+		data = fh.read()
+	with open(fn, 'wb') as fh:
+		fh.write(data[:-3])
+	index = load()
+	assert index.need_rewrite
+	assert len(index.entries) == 3, index.entries
+	index.flush()
+	index = load()
+	assert not index.need_rewrite and len(index.entries) == 3
+
+	# Corrupt or from another version: start over.
+	for garbage in (b'not a pickle', pickle.dumps(('accelerator jobindex', -1, 0), 2) + data[len(pickle.dumps(JobIndex._header, 2)):], b''):
+		with open(fn, 'wb') as fh:
+			fh.write(garbage)
+		index = load()
+		assert index.entries == {} and index.need_rewrite, garbage
+		index.add('wd-0', 1.0, params['wd-0'])
+		index.flush()
+		index = load()
+		assert index.entries == {'wd-0': (1.0, params['wd-0'])} and not index.need_rewrite
+
+	# The directory mtime is what invalidates entries: post.json appearing
+	# or going away changes it.
+	jobdir = os.path.join(path, 'wd-10')
+	os.mkdir(jobdir)
+	os.utime(jobdir, (1000, 1000))
+	assert _job_mtime((jobdir, None)) == (1000, False)
+	with open(os.path.join(jobdir, 'post.json'), 'w') as fh:
+		fh.write('{}')
+	mtime, finished = _job_mtime((jobdir, 1000))
+	assert finished and mtime != 1000
+	os.unlink(os.path.join(jobdir, 'post.json'))
+	os.utime(jobdir, (mtime, mtime))
+	# An unchanged mtime means it's still the job the index knows about.
+	assert _job_mtime((jobdir, mtime)) == (mtime, True)
+	assert _job_mtime((jobdir, None)) == (mtime, False)
+	assert _job_mtime((os.path.join(path, 'wd-11'), None)) is None
@@ -0,0 +1,97 @@
+############################################################################
+#                                                                          #
+# Copyright (c) 2021 Carl Drougge                                          #
+#                                                                          #
+# Licensed under the Apache License, Version 2.0 (the "License");          #
+# you may not use this file except in compliance with the License.         #
+# You may obtain a copy of the License at                                  #
+#                                                                          #
+#  http://www.apache.org/licenses/LICENSE-2.0                              #
+#                                                                          #
+# Unless required by applicable law or agreed to in writing, software      #
+# distributed under the License is distributed on an "AS IS" BASIS,        #
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. #
+# See the License for the specific language governing permissions and      #
+# limitations under the License.                                           #
+#                                                                          #
+############################################################################
+
+from __future__ import print_function
+from __future__ import division
+from __future__ import unicode_literals
+
+description = r'''
+Verify that the why_build candidate search (DataBase.match_closest) gives
+the same candidates, in the same order, as the old exhaustive search with
+match_complex over itertools.combinations. Uses random sets of jobs with
+few option values, so there are plenty of ties.
+'''
+
+from collections import OrderedDict
+from itertools import combinations
+from random import Random
+
+from accelerator.database import DataBase, Job
+from accelerator.dependency import _find_candidates
+
+options = {'rounds': 20000}
+
+def old_find_candidates(db, method, optset):
+	def inner():
+		for uid, job in db.match_exact([(method, 0, optset,)]):
+			yield job.id, ()
+			return # no depjobs is enough - stop
+		for remset in combinations(optset, remcount):
+			for uid, job in db.match_complex([(method, 0, optset - set(remset),)]):
+				yield job.id, remset
+	res = OrderedDict()
+	remcount = 0
+	while not res:
+		remcount += 1
+		for jobid, remset in inner():
+			remset = tuple(s.split()[1] for s in remset)
+			res[jobid] = remset
+		if remcount == len(optset):
+			break
+	return res
+
+def mkdb(jobs):
+	db = DataBase.__new__(DataBase)
+	db.db_by_method = {'m': [Job('dev-%d' % (ix,), 'm', optset, '', -ix, 0) for ix, optset in enumerate(jobs)]}
+	return db
+
+def mkoptset(**kw):
+	return set('m options-%s %r' % item for item in kw.items())
+
+def check(jobs, optset):
+	db = mkdb(jobs)
+	got = list(_find_candidates(db, 'm', optset).items())
+	want = list(old_find_candidates(db, 'm', optset).items())
+	assert got == want, 'jobs %r optset %r: got %r, wanted %r' % (jobs, optset, got, want,)
+	return got
+
+def synthesis():
+	# A few simple cases with known answers. (check verifies the order.)
+	want = mkoptset(a=1, b=1)
+	assert sorted(check([mkoptset(a=1, b=2), mkoptset(a=2, b=1)], want)) == [('dev-0', ('options-b',)), ('dev-1', ('options-a',))]
+	assert sorted(check([mkoptset(a=2, b=2), mkoptset(a=1, b=2), mkoptset(a=2, b=1)], want)) == [('dev-1', ('options-b',)), ('dev-2', ('options-a',))]
+	assert check([mkoptset(a=1, b=1)], want) == [('dev-0', ())]
+	assert check([mkoptset(a=2, b=2), mkoptset(a=1, b=2), mkoptset(a=1, b=2)], want) == [('dev-1', ('options-b',))]
+	assert check([], want) == []
+	# Jobs with an option that isn't in optset (say, one that was later
+	# removed from the method) match by removing any single option.
+	assert [jobid for jobid, _ in check([mkoptset(a=1, b=1, c=1), mkoptset(a=1, b=2)], want)] == ['dev-0']
+
+	rnd = Random(42)
+	for _ in range(options.rounds):
+		names = 'abcdef'[:rnd.randint(1, 6)]
+		values = rnd.randint(1, 3)
+		def random_optset(extra):
+			optset = mkoptset(**{name: rnd.randint(1, values) for name in names if rnd.random() > 0.05})
+			if rnd.random() < extra:
+				optset.add('m options-x %d' % (rnd.randint(1, 2),))
+			return optset
+		jobs = [random_optset(0.1) for _ in range(rnd.randint(0, 12))]
+		optset = random_optset(0)
+		if optset:
+			check(jobs, optset)
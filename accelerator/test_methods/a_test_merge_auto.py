@@ -0,0 +1,69 @@
+############################################################################
+#                                                                          #
+# Copyright (c) 2021 Carl Drougge                                          #
+#                                                                          #
+# Licensed under the Apache License, Version 2.0 (the "License");          #
+# you may not use this file except in compliance with the License.         #
+# You may obtain a copy of the License at                                  #
+#                                                                          #
+#  http://www.apache.org/licenses/LICENSE-2.0                              #
+#                                                                          #
+# Unless required by applicable law or agreed to in writing, software      #
+# distributed under the License is distributed on an "AS IS" BASIS,        #
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. #
+# See the License for the specific language governing permissions and      #
+# limitations under the License.                                           #
+#                                                                          #
+############################################################################
+
+from __future__ import print_function
+from __future__ import division
+from __future__ import unicode_literals
+
+description = r'''
+Test that merge_auto gives the same result when merging in parallel,
+and that the merging really happened in parallel.
+'''
+
+import os
+
+def data(sliceno):
+	return (
+		{k: {sliceno: k, 'last': sliceno} for k in range(sliceno, 1000, 3)},
+		{k % 7: {sliceno, k} for k in range(sliceno * 10)},
+		sliceno,
+		[sliceno] * sliceno,
+	)
+
+def analysis(sliceno):
+	return data(sliceno)
+
+def synthesis(analysis_res, slices, job):
+	expect = [{}, {}, 0, []]
+	for sliceno in range(slices):
+		nested, sets, num, lst = data(sliceno)
+		for k, v in nested.items():
+			expect[0].setdefault(k, {}).update(v)
+		for k, v in sets.items():
+			expect[1].setdefault(k, set()).update(v)
+		expect[2] += num
+		expect[3].extend(lst)
+	# Fail instead of falling back to merging serially, and record
+	# which processes did the pairwise merges.
+	merge_parallel = analysis_res._merge_parallel
+	def checked_merge_parallel():
+		res = merge_parallel()
+		assert res is not None, "Parallel merge failed"
+		return res
+	analysis_res._merge_parallel = checked_merge_parallel
+	merge_auto_single = analysis_res._merge_auto_single
+	def recording_merge_auto_single(it, ix):
+		with open(job.filename('merged_by.%d' % (os.getpid(),)), 'w'):
+			pass
+		return merge_auto_single(it, ix)
+	analysis_res._merge_auto_single = recording_merge_auto_single
+	got = list(analysis_res.merge_auto(parallel=True))
+	assert got == expect, got
+	merged_by = [fn for fn in os.listdir(job.path) if fn.startswith('merged_by.')]
+	assert 'merged_by.%d' % (os.getpid(),) in merged_by, merged_by
+	assert len(merged_by) > 1, "No merges in other processes (%r)" % (merged_by,)
@@ -0,0 +1,60 @@
+############################################################################
+#                                                                          #
+# Copyright (c) 2021 Carl Drougge                                          #
+#                                                                          #
+# Licensed under the Apache License, Version 2.0 (the "License");          #
+# you may not use this file except in compliance with the License.         #
+# You may obtain a copy of the License at                                  #
+#                                                                          #
+#  http://www.apache.org/licenses/LICENSE-2.0                              #
+#                                                                          #
+# Unless required by applicable law or agreed to in writing, software      #
+# distributed under the License is distributed on an "AS IS" BASIS,        #
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. #
+# See the License for the specific language governing permissions and      #
+# limitations under the License.                                           #
+#                                                                          #
+############################################################################
+
+from __future__ import print_function
+from __future__ import division
+from __future__ import unicode_literals
+
+description = r'''
+Verify that analysis processes report their progress (rows read etc) to
+the server while they run.
+'''
+
+from itertools import islice
+from time import sleep
+import os
+
+from accelerator.unixhttp import call
+from accelerator.statmsg import PROGRESS_INTERVAL
+from accelerator import g
+
+options = dict(
+	rows=100,
+)
+
+datasets = ('source',)
+
+def analysis(sliceno, job):
+	assert datasets.source.lines[sliceno] > options.rows, "Need more than %d lines per slice" % (options.rows,)
+	it = datasets.source.iterate(sliceno)
+	for _ in islice(it, options.rows):
+		pass
+	pid = os.getpid()
+	got = None
+	for _ in range(int(PROGRESS_INTERVAL * 5 / 0.1)):
+		for p in call(g.server_url + '/status/full')['progress']:
+			if p['pid'] == pid:
+				got = p
+		if got and got['rows'] == options.rows:
+			break
+		sleep(0.1)
+	assert got, "No progress reported for analysis(%d)" % (sliceno,)
+	assert got['rows'] == options.rows, "analysis(%d) reported %d rows read, expected %d" % (sliceno, got['rows'], options.rows,)
+	assert got['job'] == job, "analysis(%d) reported progress for %r, expected %r" % (sliceno, got['job'], job,)
+	assert got['name'] == 'analysis(%d)' % (sliceno,), got['name']
+	assert got['bytes'] > 0 and got['rss'] > 0, got
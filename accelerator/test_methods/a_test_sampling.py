@@ -0,0 +1,46 @@
+############################################################################
+#                                                                          #
+# Copyright (c) 2021 Carl Drougge                                          #
+#                                                                          #
+# Licensed under the Apache License, Version 2.0 (the "License");          #
+# you may not use this file except in compliance with the License.         #
+# You may obtain a copy of the License at                                  #
+#                                                                          #
+#  http://www.apache.org/licenses/LICENSE-2.0                              #
+#                                                                          #
+# Unless required by applicable law or agreed to in writing, software      #
+# distributed under the License is distributed on an "AS IS" BASIS,        #
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. #
+# See the License for the specific language governing permissions and      #
+# limitations under the License.                                           #
+#                                                                          #
+############################################################################
+
+from __future__ import print_function
+from __future__ import division
+from __future__ import unicode_literals
+
+description = r'''
+Spend some time in each step, so build_tests can check that the profile
+(from building with profile=True) shows that.
+'''
+
+from time import sleep
+
+def sleepy_prepare():
+	sleep(0.2)
+
+def sleepy_analysis():
+	sleep(0.2)
+
+def sleepy_synthesis():
+	sleep(0.2)
+
+def prepare():
+	sleepy_prepare()
+
+def analysis(sliceno):
+	sleepy_analysis()
+
+def synthesis():
+	sleepy_synthesis()
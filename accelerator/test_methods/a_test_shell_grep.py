@@ -33,6 +33,7 @@ from subprocess import check_output
 import datetime
 import os
 import json
+import re
 
 from accelerator.compat import PY2, PY3, izip_longest
 from accelerator.dsutil import _convfuncs
@@ -439,6 +440,42 @@ def synthesis(job, slices):
 		{'dataset': d, 'sliceno': 0, 'lineno': 0, 'data': want_json[0]},
 		{'dataset': d, 'sliceno': 1, 'lineno': 0, 'data': want_json[1]},
 	])
+	# patterns with a literal part are first searched for in blob columns
+	# by the reader, check that gives the same lines (and line numbers).
+	dw = job.datasetwriter(name='needle', allow_missing_slices=True)
+	dw.add('a', 'ascii', none_support=True)
+	dw.add('i', 'int64')
+	dw.add('u', 'unicode')
+	dw.set_slice(0)
+	lines = [('line %d' % (ix,), ix, 'r\xe4d %d' % (ix * 7,)) for ix in range(1000)]
+	lines.insert(500, (None, -1, 'None'))
+	for line in lines:
+		dw.write(*line)
+	needle = dw.finish()
+	for args in (['line 99\\b'], ['None'], ['99'], ['-g', 'u', '\xe4d 7[0-3]'], ['-g', 'a', '-g', 'u', 'd 7+$'], ['e (1|2)0']):
+		pat = re.compile(args[-1])
+		grep_cols = args[1:-1:2] or ['a', 'i', 'u']
+		want = [
+			{'lineno': lineno, 'data': dict(zip(['a', 'i', 'u'], line))}
+			for lineno, line in enumerate(lines)
+			if any(pat.search('%s' % (v,)) for col, v in zip(['a', 'i', 'u'], line) if col in grep_cols)
+		]
+		assert want, args
+		grep_json(['-L'] + args + [needle], want)
+	# lines between matches are skipped in the readers, check that works.
+	for col in ('a', 'i', 'u'):
+		want = list(needle.iterate(0, col))
+		for count in (0, 1, 499, 500, 501, 1000, 1001):
+			reader = needle._column_iterator(0, col)
+			reader.skip(count)
+			assert list(reader) == want[count:], (col, count)
+	# a hashfilter gives a True/False for every value, so it can't skip any.
+	try:
+		needle._column_iterator(0, 'a', needle=b'line 99', hashfilter=(0, 3))
+		raise Exception('needle together with hashfilter should fail')
+	except ValueError:
+		pass
+
 	all_types = {n for n in _convfuncs if not n.startswith('parsed:')}
 	if PY2:
 		all_types.remove('pickle')
@@ -0,0 +1,67 @@
+############################################################################
+#                                                                          #
+# Copyright (c) 2021 Carl Drougge                                          #
+#                                                                          #
+# Licensed under the Apache License, Version 2.0 (the "License");          #
+# you may not use this file except in compliance with the License.         #
+# You may obtain a copy of the License at                                  #
+#                                                                          #
+#  http://www.apache.org/licenses/LICENSE-2.0                              #
+#                                                                          #
+# Unless required by applicable law or agreed to in writing, software      #
+# distributed under the License is distributed on an "AS IS" BASIS,        #
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. #
+# See the License for the specific language governing permissions and      #
+# limitations under the License.                                           #
+#                                                                          #
+############################################################################
+
+from __future__ import print_function
+from __future__ import division
+from __future__ import unicode_literals
+
+description = r'''
+Test split_analysis. Without a source this makes a dataset with one big
+slice, with that as source it checks that the big slice was split and
+that the parts were merged correctly.
+'''
+
+from collections import Counter
+
+datasets = ('source',)
+
+split_analysis = 'source'
+
+def analysis(sliceno, part):
+	if not datasets.source:
+		return
+	c = Counter(datasets.source.iterate(sliceno, 'v', slice=part))
+	return c, [part.start], set(datasets.source.iterate(sliceno, 'ix', slice=part))
+
+def synthesis(job, slices, analysis_res):
+	if not datasets.source:
+		dw = job.datasetwriter(columns={'ix': 'int32', 'v': 'int32'})
+		for sliceno in range(slices):
+			dw.set_slice(sliceno)
+			lines = 50000 if sliceno == 1 else 10
+			for ix in range(lines):
+				dw.write(ix, ix % 7)
+		dw.finish()
+		return
+	assert slices > 2, "This test needs at least three slices"
+	for sliceno, (c, starts, ixes) in enumerate(analysis_res):
+		assert c == Counter(datasets.source.iterate(sliceno, 'v')), sliceno
+		assert ixes == set(datasets.source.iterate(sliceno, 'ix')), sliceno
+		if sliceno == 1:
+			assert len(starts) > 1, "slice 1 wasn't split"
+		else:
+			assert starts == [0], sliceno
+	# Parts of a slice share keys, so a plain dict must not overwrite.
+	from accelerator.extras import _merge_auto
+	assert _merge_auto(iter([{'a': 1}, {'b': 2}]), 0, parts=True) == {'a': 1, 'b': 2}
+	try:
+		_merge_auto(iter([{'a': 1}, {'a': 2}]), 0, parts=True)
+		overwrote = True
+	except Exception:
+		overwrote = False
+	assert not overwrote, "_merge_auto overwrote a count from a part"
@@ -0,0 +1,69 @@
+############################################################################
+#                                                                          #
+# Copyright (c) 2021 Carl Drougge                                          #
+#                                                                          #
+# Licensed under the Apache License, Version 2.0 (the "License");          #
+# you may not use this file except in compliance with the License.         #
+# You may obtain a copy of the License at                                  #
+#                                                                          #
+#  http://www.apache.org/licenses/LICENSE-2.0                              #
+#                                                                          #
+# Unless required by applicable law or agreed to in writing, software      #
+# distributed under the License is distributed on an "AS IS" BASIS,        #
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. #
+# See the License for the specific language governing permissions and      #
+# limitations under the License.                                           #
+#                                                                          #
+############################################################################
+
+from __future__ import print_function
+from __future__ import division
+from __future__ import unicode_literals
+
+description = r'''
+Test split_analysis with merge_parts and a plain dict of counts (which
+merge_auto can't merge). source should be the dataset test_split_analysis
+makes, where only slice 1 is big enough to be split.
+With options.merge_auto analysis_res.merge_auto(parallel=True) is used,
+so the parts are combined in the parallel merge.
+'''
+
+from collections import Counter
+
+options = {'merge_auto': False}
+
+datasets = ('source',)
+
+split_analysis = 'source'
+
+def analysis(sliceno, part):
+	counts = {}
+	for v in datasets.source.iterate(sliceno, 'v', slice=part):
+		key = (sliceno, v)
+		counts[key] = counts.get(key, 0) + 1
+	return counts, {sliceno: part.start or 0}
+
+def merge_parts(a, b):
+	counts, starts = a
+	for k, v in b[0].items():
+		counts[k] = counts.get(k, 0) + v
+	# The last start is > 0 when the slice was split.
+	return counts, {k: max(v, b[1][k]) for k, v in starts.items()}
+
+def synthesis(slices, analysis_res):
+	def want(sliceno):
+		return {(sliceno, v): count for v, count in Counter(datasets.source.iterate(sliceno, 'v')).items()}
+	if options.merge_auto:
+		counts, starts = analysis_res.merge_auto(parallel=True)
+		all_counts = {}
+		for sliceno in range(slices):
+			all_counts.update(want(sliceno))
+		assert counts == all_counts
+	else:
+		starts = {}
+		for sliceno, (counts, slice_starts) in enumerate(analysis_res):
+			assert counts == want(sliceno), sliceno
+			starts.update(slice_starts)
+	assert starts[1] > 0, "slice 1 wasn't split"
+	assert set(starts) == set(range(slices))
+	assert not any(starts[sliceno] for sliceno in range(slices) if sliceno != 1)
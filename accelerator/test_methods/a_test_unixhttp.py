@@ -0,0 +1,154 @@
+############################################################################
+#                                                                          #
+# Copyright (c) 2021 Carl Drougge                                          #
+#                                                                          #
+# Licensed under the Apache License, Version 2.0 (the "License");          #
+# you may not use this file except in compliance with the License.         #
+# You may obtain a copy of the License at                                  #
+#                                                                          #
+#  http://www.apache.org/licenses/LICENSE-2.0                              #
+#                                                                          #
+# Unless required by applicable law or agreed to in writing, software      #
+# distributed under the License is distributed on an "AS IS" BASIS,        #
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. #
+# See the License for the specific language governing permissions and      #
+# limitations under the License.                                           #
+#                                                                          #
+############################################################################
+
+from __future__ import print_function
+from __future__ import division
+from __future__ import unicode_literals
+
+description = r'''
+Test the connection pooling in unixhttp.urlopen: connections are reused,
+a connection the server dropped is retried for GET but not for POST, and
+requests that should go through a proxy are passed on to urllib.
+'''
+
+from threading import Thread, Lock
+import socket
+import os
+
+from accelerator.compat import URLError
+from accelerator import unixhttp
+
+
+class Server:
+	"""Minimal HTTP/1.1 server that records what it gets. Requests with
+	numbers in drop get the connection closed instead of an answer, and
+	ones in close_after get the connection closed after the answer
+	(without telling the client)."""
+
+	def __init__(self):
+		self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		self.sock.bind(('127.0.0.1', 0))
+		self.sock.listen(5)
+		self.port = self.sock.getsockname()[1]
+		self.lock = Lock()
+		self.connections = 0
+		self.requests = [] # (connection number, method, target)
+		self.drop = set()
+		self.close_after = set()
+		t = Thread(target=self.accept_loop)
+		t.daemon = True
+		t.start()
+
+	def accept_loop(self):
+		while True:
+			conn, _ = self.sock.accept()
+			with self.lock:
+				self.connections += 1
+				connno = self.connections
+			t = Thread(target=self.handle, args=(conn, connno,))
+			t.daemon = True
+			t.start()
+
+	def handle(self, conn, connno):
+		fh = conn.makefile('rb')
+		try:
+			while True:
+				line = fh.readline()
+				if not line:
+					return
+				method, target, _ = line.decode('ascii').split(' ', 2)
+				headers = {}
+				while True:
+					line = fh.readline().decode('ascii').strip()
+					if not line:
+						break
+					k, v = line.split(':', 1)
+					headers[k.strip().lower()] = v.strip()
+				fh.read(int(headers.get('content-length', 0)))
+				with self.lock:
+					self.requests.append((connno, method, target,))
+					reqno = len(self.requests)
+				if reqno in self.drop:
+					return
+				body = ('%s %s' % (method, target,)).encode('ascii')
+				close = reqno in self.close_after or headers.get('connection') == 'close'
+				conn.sendall(b'HTTP/1.1 200 OK\r\nContent-Length: %d\r\n%s\r\n%s' % (
+					len(body), b'Connection: close\r\n' if close and reqno not in self.close_after else b'', body,
+				))
+				if close:
+					return
+		finally:
+			fh.close()
+			conn.close()
+
+
+def synthesis():
+	server = Server()
+	url = 'http://127.0.0.1:%d/' % (server.port,)
+	for name in ('http_proxy', 'HTTP_PROXY', 'no_proxy', 'NO_PROXY',):
+		os.environ.pop(name, None)
+
+	def get(path, data=None):
+		r = unixhttp.urlopen(url + path, data)
+		assert r.getcode() == 200, r.getcode()
+		return r.read().decode('ascii')
+
+	def check(want):
+		got = server.requests[len(server.requests) - len(want):]
+		assert got == want, '%r != %r' % (got, want,)
+
+	# Pooling: all of these should use the same connection.
+	for path in ('a', 'b', 'c',):
+		assert get(path) == 'GET /' + path
+	assert get('d', b'data') == 'POST /d'
+	check([(1, 'GET', '/a'), (1, 'GET', '/b'), (1, 'GET', '/c'), (1, 'POST', '/d')])
+
+	# Closed after the answer, which is noticed before the next request.
+	server.close_after.add(len(server.requests) + 1)
+	get('e')
+	get('f')
+	check([(1, 'GET', '/e'), (2, 'GET', '/f')])
+
+	# Dropped while handling a GET, retried on a new connection.
+	server.drop.add(len(server.requests) + 1)
+	assert get('g') == 'GET /g'
+	check([(2, 'GET', '/g'), (3, 'GET', '/g')])
+
+	# Dropped while handling a POST, which must not be sent again.
+	server.drop.add(len(server.requests) + 1)
+	try:
+		get('h', b'data')
+		raise Exception('POST on a dropped connection did not fail')
+	except URLError:
+		pass
+	check([(3, 'POST', '/h')])
+	assert get('i') == 'GET /i'
+	check([(3, 'POST', '/h'), (4, 'GET', '/i')])
+
+	# With a proxy set the request goes to the proxy (which happens to be
+	# the same server), with the whole URL as target.
+	os.environ['http_proxy'] = url
+	try:
+		assert get('j') == 'GET %sj' % (url,)
+		# Unless the host is in no_proxy.
+		os.environ['no_proxy'] = '127.0.0.1'
+		assert get('k') == 'GET /k'
+	finally:
+		os.environ.pop('http_proxy', None)
+		os.environ.pop('no_proxy', None)
+	check([(5, 'GET', url + 'j'), (4, 'GET', '/k')])
@@ -0,0 +1,115 @@
+############################################################################
+#                                                                          #
+# Copyright (c) 2026 Carl Drougge                                          #
+#                                                                          #
+# Licensed under the Apache License, Version 2.0 (the "License");          #
+# you may not use this file except in compliance with the License.         #
+# You may obtain a copy of the License at                                  #
+#                                                                          #
+#  http://www.apache.org/licenses/LICENSE-2.0                              #
+#                                                                          #
+# Unless required by applicable law or agreed to in writing, software      #
+# distributed under the License is distributed on an "AS IS" BASIS,        #
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. #
+# See the License for the specific language governing permissions and      #
+# limitations under the License.                                           #
+#                                                                          #
+############################################################################
+
+from __future__ import print_function
+from __future__ import division
+from __future__ import unicode_literals
+
+description = r'''
+Test compacting urd logs.
+
+Uses an urd database in the job directory, and checks that compacting
+a list and restarting gives the same lists, latest entries and deps,
+and that a compaction that would change another list is refused.
+'''
+
+import bottle
+
+from accelerator.extras import DotDict
+from accelerator import urd
+
+
+def synthesis(job):
+	# DB reports errors through the response, like in the real server.
+	bottle.response.bind()
+	path = job.filename('urd.db')
+
+	def add(db, key, ts, caption, deps=(), update=False):
+		user, build = key.split('/')
+		data = DotDict(
+			timestamp=ts,
+			user=user,
+			build=build,
+			joblist=[['test_urd_compact', job]],
+			caption=caption,
+			deps={depkey: dict(db.get(depkey, depts)) for depkey, depts in deps},
+			flags=['update'] if update else [],
+		)
+		for d in data.deps.values():
+			for k in ('user', 'build', 'deps'):
+				del d[k]
+		return db.add(data)
+
+	def state(db):
+		keys = sorted(db.keys())
+		return {key: [db.get(key, ts) for ts in db.since(key, '0')] for key in keys}, {key: db.latest(key) for key in keys}
+
+	db = urd.DB(path, False)
+	for ts in ('1', '2', '3'):
+		add(db, 'u/a', ts, 'a' + ts)
+	add(db, 'u/b', '1', 'b1', [('u/a', '1')])
+	add(db, 'u/b', '2', 'b2', [('u/a', '2'), ('u/b', '1')])
+	add(db, 'u/c', '1', 'c1', [('u/b', '2')])
+	# Makes b2 and c1 ghosts
+	add(db, 'u/a', '2', 'a2 again', update=True)
+	add(db, 'u/b', '2', 'b2 again', [('u/a', '2'), ('u/b', '1')], update=True)
+	add(db, 'u/a', '3', 'a3 again', update=True)
+	db.truncate('u/a', '3')
+	add(db, 'u/a', '3', 'a3 once more')
+	assert db.latest('u/c') is None
+	before = state(db)
+	res = db.compact('u/a', archive=True)
+	assert res == {'count': 3, 'dropped': 4}, res
+	assert db.compact('u/b') == {'count': 2, 'dropped': 1}
+	assert state(db) == before
+	with open(job.filename('urd.db/u/a.urd'), 'rb') as fh:
+		lines = fh.read().decode('utf-8').splitlines()
+	assert len(lines) == 3
+	assert all(line.startswith('4|') and '|compacted|' in line for line in lines), lines
+	with open(job.filename('urd.db/u/a.archive'), 'rb') as fh:
+		assert len(fh.read().splitlines()) == 7
+	# "restart"
+	db = urd.DB(path, False)
+	assert state(db) == before
+	assert db.get('u/b', '2').deps['u/a']['caption'] == 'a2 again'
+
+	# b3 depends on a version of a3 that is updated away and then back,
+	# so b3 stays a ghost. Replaying a compacted a would bring it back.
+	add(db, 'u/b', '3', 'b3', [('u/a', '3')])
+	add(db, 'u/a', '3', 'a3 changed', update=True)
+	add(db, 'u/a', '3', 'a3 once more', update=True)
+	assert db.get('u/b', '3') is None
+	before = state(db)
+	res = db.compact('u/a')
+	assert bottle.response.status_code == 409, res
+	assert 'error' in res, res
+	assert state(db) == before
+	db = urd.DB(path, False)
+	assert state(db) == before
+	# Compacting b is fine, and then a is too as the ghost is gone.
+	bottle.response.bind()
+	assert db.compact('u/b') == {'count': 2, 'dropped': 1}
+	assert db.compact('u/a') == {'count': 3, 'dropped': 2}
+	assert bottle.response.status_code == 200
+	add(db, 'u/a', '4', 'a4')
+	before = state(db)
+	db = urd.DB(path, False)
+	assert state(db) == before
+	assert db.latest('u/a').caption == 'a4'
+	res = db.compact('u/nonexistent')
+	assert bottle.response.status_code == 404, res
@@ -0,0 +1,170 @@
+############################################################################
+#                                                                          #
+# Copyright (c) 2021 Carl Drougge                                          #
+#                                                                          #
+# Licensed under the Apache License, Version 2.0 (the "License");          #
+# you may not use this file except in compliance with the License.         #
+# You may obtain a copy of the License at                                  #
+#                                                                          #
+#  http://www.apache.org/licenses/LICENSE-2.0                              #
+#                                                                          #
+# Unless required by applicable law or agreed to in writing, software      #
+# distributed under the License is distributed on an "AS IS" BASIS,        #
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. #
+# See the License for the specific language governing permissions and      #
+# limitations under the License.                                           #
+#                                                                          #
+############################################################################
+
+from __future__ import print_function
+from __future__ import division
+from __future__ import unicode_literals
+
+description = r'''
+Test urd snapshots.
+
+Uses urd databases in the job directory, and checks that restarting from
+a snapshot plus the log written after it gives the same lists, entries,
+deps and ghosts as replaying the logs without a snapshot, and that stale
+or corrupt snapshots are not used.
+'''
+
+import bottle
+import json
+import os
+import shutil
+import time
+
+from accelerator.extras import DotDict
+from accelerator import urd
+
+
+class DB(urd.DB):
+	"""Remembers if the snapshot was used."""
+	def _load_snapshot(self, files):
+		self.snapshot_positions = urd.DB._load_snapshot(self, files)
+		return self.snapshot_positions
+
+
+def synthesis(job):
+	# DB reports errors through the response, like in the real server.
+	bottle.response.bind()
+	path = job.filename('urd.db')
+	snapshot_fn = os.path.join(path, 'snapshot')
+
+	def add(db, key, ts, caption, deps=(), update=False):
+		user, build = key.split('/')
+		data = DotDict(
+			timestamp=ts,
+			user=user,
+			build=build,
+			joblist=[['test_urd_snapshot', job]],
+			caption=caption,
+			deps={depkey: dict(db.get(depkey, depts)) for depkey, depts in deps},
+			flags=['update'] if update else [],
+		)
+		for d in data.deps.values():
+			for k in ('user', 'build', 'deps'):
+				del d[k]
+		return db.add(data)
+
+	def state(db):
+		keys = sorted(db.keys())
+		return (
+			{key: [db.get(key, ts) for ts in db.since(key, '0')] for key in keys},
+			{key: db.latest(key) for key in keys},
+			{key: dict(ghosts) for key, ghosts in db.ghost_db.items() if ghosts},
+		)
+
+	def snapshot(db):
+		with urd.lock:
+			db._snapshot()
+		while db._snapshot_running:
+			time.sleep(0.01)
+		assert os.path.exists(snapshot_fn)
+
+	def replayed_state():
+		# The same logs, without a snapshot.
+		copy = job.filename('urd.copy')
+		shutil.rmtree(copy, ignore_errors=True)
+		shutil.copytree(path, copy)
+		if os.path.exists(os.path.join(copy, 'snapshot')):
+			os.unlink(os.path.join(copy, 'snapshot'))
+		db = DB(copy, False)
+		assert not db.snapshot_positions
+		return state(db)
+
+	def restart(want_snapshot_used):
+		db = DB(path, False)
+		assert bool(db.snapshot_positions) == want_snapshot_used, db.snapshot_positions
+		got = state(db)
+		assert got == before, 'after restart:\n%r\n!=\n%r' % (got, before,)
+		assert got == replayed_state()
+		return db
+
+	db = DB(path, False)
+	for ts in ('1', '2', '3'):
+		add(db, 'u/a', ts, 'a' + ts)
+	add(db, 'u/b', '1', 'b1', [('u/a', '1')])
+	add(db, 'u/b', '2', 'b2', [('u/a', '2'), ('u/b', '1')])
+	add(db, 'u/c', '1', 'c1', [('u/b', '2')])
+	# Makes b2 and c1 ghosts
+	add(db, 'u/a', '2', 'a2 again', update=True)
+	db.truncate('u/a', '3')
+	snapshot(db)
+	before = state(db)
+	assert before[2], "No ghosts to test with"
+	db = restart(True)
+
+	# Now a log tail after the snapshot, with more ghosts and truncates.
+	add(db, 'u/a', '3', 'a3 new')
+	add(db, 'u/b', '3', 'b3', [('u/a', '3')])
+	add(db, 'u/b', '2', 'b2 again', [('u/a', '2'), ('u/b', '1')], update=True)
+	add(db, 'u/a', '3', 'a3 changed', update=True) # b3 is a ghost
+	add(db, 'u/d', '1', 'd1', [('u/b', '1')])
+	db.truncate('u/b', '2')
+	before = state(db)
+	db = restart(True)
+	# And a snapshot of that, with a new tail
+	snapshot(db)
+	add(db, 'u/a', '4', 'a4')
+	before = state(db)
+	db = restart(True)
+
+	with open(snapshot_fn, 'rb') as fh:
+		good_snapshot = fh.read()
+	def restart_with_snapshot(data, want_snapshot_used=False):
+		with open(snapshot_fn, 'wb') as fh:
+			fh.write(data)
+		return restart(want_snapshot_used)
+
+	# Corrupt snapshots
+	restart_with_snapshot(good_snapshot[:len(good_snapshot) // 2])
+	restart_with_snapshot(b'')
+	snap = json.loads(good_snapshot.decode('utf-8'))
+	snap['version'] = -1
+	restart_with_snapshot(json.dumps(snap).encode('utf-8'))
+	# A position that isn't at the end of a line.
+	snap = json.loads(good_snapshot.decode('utf-8'))
+	snap['positions']['u/a'][0] -= 1
+	restart_with_snapshot(json.dumps(snap).encode('utf-8'))
+	# A log that isn't there any more.
+	snap = json.loads(good_snapshot.decode('utf-8'))
+	snap['positions']['u/nonexistent'] = [10, 1, 1]
+	restart_with_snapshot(json.dumps(snap).encode('utf-8'))
+	restart_with_snapshot(good_snapshot, True)
+	os.unlink(snapshot_fn)
+	db = restart(False)
+
+	# Stale: the log has been replaced (compacted) since the snapshot.
+	snapshot(db)
+	with open(snapshot_fn, 'rb') as fh:
+		old_snapshot = fh.read()
+	bottle.response.bind()
+	res = db.compact('u/a')
+	assert bottle.response.status_code == 200, res
+	while db._snapshot_running:
+		time.sleep(0.01)
+	before = state(db)
+	db = restart(True) # the snapshot made after compacting
+	restart_with_snapshot(old_snapshot)
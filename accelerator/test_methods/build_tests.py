@@ -23,10 +23,19 @@ from __future__ import unicode_literals
 
 from accelerator.dataset import Dataset
 from accelerator.build import JobError
-from accelerator.compat import monotonic
+from accelerator.job import Job
+from accelerator.compat import monotonic, urlencode
+from accelerator.unixhttp import call
+from accelerator import sampling
 
 from datetime import date, datetime, timedelta
 from sys import exit
+from os.path import join, dirname
+from os import unlink
+from importlib import import_module
+from shutil import copytree, ignore_patterns, rmtree
+from time import sleep
+import json
 
 def main(urd):
 	assert urd.info.slices >= 3, "The tests don't work with less than 3 slices (you have %d)." % (urd.info.slices,)
@@ -102,6 +111,9 @@ def main(urd):
 	dep_jl = list(urd.peek("tests_urd", 1000000000).deps.values())[0].joblist
 	assert dep_jl == [job]
 	assert urd.peek("tests_urd", ('2017-06-27 17:00:00', 42)).timestamp == '2017-06-27T17:00:00+42'
+	many = urd.peek_many([("tests_urd", '<2'), ("tests_urd", 3), ("tests_urd", 1000000000), ("tests_urd", 'latest')])
+	assert [u.timestamp for u in many] == ['1', '0', '1000000000', '2019-12+3'], many
+	assert many[2].deps == urd.peek("tests_urd", 1000000000).deps
 	while ordered_ts:
 		urd.truncate("tests_urd", ordered_ts.pop())
 		assert urd.since("tests_urd", 0) == ordered_ts, ordered_ts
@@ -112,6 +124,127 @@ def main(urd):
 		urd.finish("tests_urd")
 	assert urd.since("tests_urd", 0) == [str(ts).replace(' ', 'T') for ts in want]
 	urd.truncate("tests_urd", 0)
+	# Truncating a dependency makes entries that depend on it ghosts,
+	# they must not be left in the client side cache.
+	urd.truncate("tests_urd_dep", 0)
+	urd.begin("tests_urd", 1)
+	urd.build("test_build_kws")
+	urd.finish("tests_urd")
+	urd.begin("tests_urd_dep", 1)
+	urd.get("tests_urd", 1)
+	urd.build("test_build_kws")
+	urd.finish("tests_urd_dep")
+	assert urd.peek("tests_urd_dep", 1).deps
+	urd.truncate("tests_urd", 0)
+	assert not urd.peek("tests_urd_dep", 1), "Cached entry survived its dependency being truncated"
+	assert not urd.peek_many([("tests_urd_dep", 1)])[0]
+	urd.truncate("tests_urd_dep", 0)
+
+	print()
+	print("Testing urd compaction")
+	urd.build("test_urd_compact")
+
+	print()
+	print("Testing urd snapshots")
+	urd.build("test_urd_snapshot")
+
+	print()
+	print("Testing the workdir_jobs server endpoint")
+	url = urd._a.url + '/workdir_jobs/' + job.workdir + '?'
+	def workdir_jobs(**kw):
+		return call(url + urlencode(kw))
+	def jobids(res):
+		return [jobid for jobid, _, _ in res['jobs']]
+	everything = workdir_jobs()
+	assert everything['total'] == len(everything['jobs']) >= 5, everything
+	assert jobids(everything) == sorted(jobids(everything), key=lambda jobid: int(jobid.rsplit('-', 1)[1]), reverse=True), everything
+	pages = [workdir_jobs(offset=offset, limit=2) for offset in range(0, everything['total'], 2)]
+	assert sum((jobids(page) for page in pages), []) == jobids(everything), pages
+	assert all(page['total'] == everything['total'] for page in pages), pages
+	res = workdir_jobs(method='^test_build_kws$')
+	assert res['total'] >= 4 and all(info['method'] == 'test_build_kws' for _, info, _ in res['jobs']), res
+	res = workdir_jobs(state='old,unfinished')
+	assert all(state in ('old', 'unfinished') for _, _, state in res['jobs']), res
+	generation = everything['generation']
+	res = workdir_jobs(since=generation)
+	assert res['jobs'] == [] and res['dropped'] == [] and 'total' not in res, res
+	new = urd.build("test_build_kws", a='workdir_jobs ' + generation)
+	res = workdir_jobs(since=generation)
+	assert res['jobs'] == [[new, res['jobs'][0][1], 'current']] and res['dropped'] == [], res
+	assert res['latest'][job.workdir][0] == new, res
+	res = workdir_jobs(since=generation, method='^csvimport$')
+	assert res['jobs'] == [] and res['dropped'] == [new], res
+	assert workdir_jobs(since=res['generation'])['jobs'] == []
+	server_id, num = generation.split(':')
+	assert workdir_jobs(since='%s:%d' % (server_id, int(num) + 1000000)).get('reset'), "No reset for generation from the future"
+	assert workdir_jobs(since='x' + generation).get('reset'), "No reset for generation from another server"
+
+	print()
+	print("Testing that jobs finished and removed by others are noticed")
+	def is_current(jobid):
+		return call(urd._a.url + '/job_is_current/' + jobid)
+	def wait_for(what, jobid, want):
+		deadline = monotonic() + 30
+		while is_current(jobid) != want:
+			assert monotonic() < deadline, "%s %s not noticed by the server" % (what, jobid,)
+			sleep(0.2)
+	parent = urd.build("test_subjobs_nesting", level=3)
+	child, = map(Job, parent.post.subjobs)
+	highest = max(int(jobid.rsplit('-', 1)[1]) for jobid in jobids(workdir_jobs()))
+	new_child = '%s-%d' % (job.workdir, highest + 100,)
+	new_parent = '%s-%d' % (job.workdir, highest + 101,)
+	# Like another server would: directory first, post.json last.
+	for src, dst, subjobs in ((child, new_child, {},), (parent, new_parent, {new_child: 0},),):
+		dst_path = join(dirname(src.path), dst)
+		copytree(src.path, dst_path, ignore=ignore_patterns('post.json'))
+		with open(join(dst_path, 'setup.json')) as fh:
+			setup = json.load(fh)
+		setup['jobid'] = dst
+		with open(join(dst_path, 'setup.json'), 'w') as fh:
+			json.dump(setup, fh)
+		with open(src.filename('post.json')) as fh:
+			post = json.load(fh)
+		post['subjobs'] = subjobs
+		with open(join(dst_path, 'post.json'), 'w') as fh:
+			json.dump(post, fh)
+	wait_for("Finished job", new_parent, True)
+	assert is_current(new_child)
+	assert urd.build("test_subjobs_nesting", level=3) == new_parent
+	generation = workdir_jobs()['generation']
+	rmtree(join(dirname(child.path), new_child))
+	# The parent is no longer current when its subjob is gone.
+	wait_for("Removed job", new_parent, False)
+	res = workdir_jobs(since=generation)
+	assert res['dropped'] == [new_child] and res['jobs'] == [[new_parent, res['jobs'][0][1], 'old']], res
+	assert urd.build("test_subjobs_nesting", level=3) == parent
+	rmtree(join(dirname(parent.path), new_parent))
+	deadline = monotonic() + 30
+	while new_parent not in workdir_jobs(since=generation)['dropped']:
+		assert monotonic() < deadline, "Removed job %s not noticed by the server" % (new_parent,)
+		sleep(0.2)
+
+	print()
+	print("Testing that edited methods are reloaded")
+	from accelerator.shell import cfg
+	autodiscover = sorted(package for package, auto in cfg.method_directories.items() if auto)
+	if autodiscover:
+		method_fn = join(dirname(import_module(autodiscover[0]).__file__), 'a_test_tmp_reload.py')
+		# Module level state, which every job should see fresh.
+		# (Different lengths, or python could use a stale .pyc.)
+		template = 'options = {%r: 0}\ncalls = []\ndef synthesis():\n\tcalls.append(1)\n\treturn dict(options), len(calls)\n'
+		try:
+			for name in ('a', 'bb',):
+				with open(method_fn, 'w') as fh:
+					fh.write(template % (name,))
+				urd._a.update_methods()
+				for value in (1, 2,):
+					res = urd.build('test_tmp_reload', options={name: value}).load()
+					assert res == ({name: value}, 1), res
+		finally:
+			unlink(method_fn)
+			urd._a.update_methods()
+	else:
+		print("(Skipped, there is no auto-discover package to put a method in.)")
 
 	for how in ("exiting", "dying",):
 		print()
@@ -132,10 +265,87 @@ def main(urd):
 		else:
 			print("test_analysis_died took %.1f seconds to die, so death detection works" % (time_to_die,))
 
+	print()
+	print("Testing analysis_res with buffers, streaming, parallel merging and split slices")
+	urd.build("test_analysis_res")
+	urd.build("test_merge_auto")
+	split_source = urd.build("test_split_analysis")
+	urd.build("test_split_analysis", source=split_source)
+	urd.build("test_split_analysis_merge_parts", source=split_source)
+	urd.build("test_split_analysis_merge_parts", source=split_source, merge_auto=True)
+
+	print()
+	print("Testing that analysis waits for memory")
+	urd.build("test_analysis_memory")
+	urd.build("test_analysis_memory", other_job=True)
+
+	print()
+	print("Testing the sampling profiler")
+	job = urd.build("test_sampling", profile=True)
+	profiles = sampling.load(job.path)
+	assert set(profiles) == {'prepare', 'synthesis'} | {'analysis-%d' % (sliceno,) for sliceno in range(urd.info.slices)}, profiles
+	for name, counts in profiles.items():
+		want = 'sleepy_' + sampling.phase(name)
+		assert any(want in stack for stack in counts), "%s not seen in profile %s" % (want, name,)
+
+	print()
+	print("Testing ax bench (with very little data)")
+	from accelerator.shell.bench import run_bench, BENCHMARKS
+	results = run_bench(urd, 3000, ['int64', 'unicode', 'json'], status=lambda name: None)
+	assert {r['name'] for r in results} == set(BENCHMARKS), results
+	assert all(r['seconds'] > 0 for r in results), results
+	assert all(r['unit'] == ('cpu-seconds' if r['name'] in ('write', 'iterate') else 'seconds') for r in results), results
+	assert {r['variant'] for r in results if r['name'] == 'iterate'} == {'int64 plain', 'int64 filter', 'int64 translator', 'int64 rehash', 'unicode plain', 'unicode filter', 'unicode translator', 'unicode rehash', 'json plain', 'json filter', 'json translator'}, results
+
+	print()
+	print("Testing progress reports from analysis")
+	source = urd.build("bench_write", lines=urd.info.slices * 1000, types=["int64", "unicode"])
+	urd.build("test_progress", source=source.dataset("int64"))
+	urd.build("test_progress", source=source.dataset("unicode"))
+
+	print()
+	print("Testing dataset_stats")
+	ds = source.dataset("int64")
+	stats_job = urd.build("dataset_stats", source=ds, bins=10)
+	stats = stats_job.load()['v']
+	assert sum(stats['lines']) == urd.info.slices * 1000, stats
+	assert stats['nulls'] == [0] * urd.info.slices, stats
+	assert stats['distinct_exact'] and stats['distinct_total'] == urd.info.slices * 1000, stats
+	assert sum(stats['histogram']['counts']) == urd.info.slices * 1000, stats
+	assert min(stats['min']) == ds.columns['v'].min and max(stats['max']) == ds.columns['v'].max, stats
+	# The server finds these (for the board) without reading every job.
+	def jobs_with_source(ds, **options):
+		args = dict(source=ds, options=json.dumps(options))
+		return call(urd._a.url + '/jobs_with_source/dataset_stats?' + urlencode(args))
+	newer_stats_job = urd.build("dataset_stats", source=ds, bins=11)
+	assert jobs_with_source(ds) == [newer_stats_job, stats_job]
+	assert jobs_with_source(ds, bins=10) == [stats_job]
+	assert jobs_with_source(Dataset(source, "unicode")) == []
+	ds = urd.build("bench_write", lines=2000, types=["date", "json"]).dataset("date")
+	stats = urd.build("dataset_stats", source=ds).load()['v']
+	assert sum(stats['histogram']['counts']) == 2000, stats
+	assert stats['histogram']['edges'][0] == ds.columns['v'].min, stats
+	assert stats['histogram']['edges'][-1] == ds.columns['v'].max, stats
+	assert sum(stats['distinct']) >= stats['distinct_total'] > 1000, stats
+	ds = urd.build("bench_write", lines=2000, types=["date", "json"]).dataset("json")
+	stats = urd.build("dataset_stats", source=ds).load()['v']
+	assert stats['histogram'] is None and stats['min'] == [None] * urd.info.slices, stats
+
 	print()
 	print("Testing dataset creation, export, import")
 	source = urd.build("test_datasetwriter")
-	urd.build("test_datasetwriter_verify", source=source)
+	verify = urd.build("test_datasetwriter_verify", source=source)
+	for job, kind in ((source, 'write'), (verify, 'read')):
+		for sliceno in range(urd.info.slices):
+			compressed, uncompressed, values, seconds = job.post.iostats[kind][source]['a'][str(sliceno)]
+			assert values == 2 and compressed > 0 and uncompressed > 0, "Bad %s iostats for %s slice %d in %s" % (kind, source, sliceno, job,)
+	blobs = urd.build("test_iostats_blob")
+	sizes = blobs.load()
+	checksum = urd.build("dataset_checksum", source=blobs)
+	for job, kind in ((blobs, 'write'), (checksum, 'read')):
+		for sliceno in range(urd.info.slices):
+			compressed, uncompressed, values, seconds = job.post.iostats[kind][blobs]['blob'][str(sliceno)]
+			assert values == 602 and uncompressed == sizes[sliceno], "Bad %s iostats for %s slice %d in %s (%d bytes, expected %d)" % (kind, blobs, sliceno, job, uncompressed, sizes[sliceno],)
 	source = urd.build("test_datasetwriter_copy", source=source)
 	urd.build("test_datasetwriter_verify", source=source)
 	urd.build("test_datasetwriter_parent")
@@ -151,6 +361,10 @@ def main(urd):
 	reimp_csv = urd.build("csvimport", filename=csv.filename(csvname), separator="\t")
 	reimp_csv_uncompressed = urd.build("csvimport", filename=csv_uncompressed.filename(csvname_uncompressed), separator="\t")
 	reimp_csv_quoted = urd.build("csvimport", filename=csv_quoted.filename(csvname), quotes=True)
+	usage = reimp_csv.post.exectime.rusage
+	want = {'launch', 'reader'} | {'analysis-%d' % (sliceno,) for sliceno in range(urd.info.slices)}
+	assert set(usage) == want, "Bad rusage processes in %s: %r" % (reimp_csv, sorted(usage),)
+	assert all(u.maxrss > 0 for u in usage.values()), usage
 	urd.build("test_compare_datasets", a=reimp_csv, b=reimp_csv_uncompressed)
 	urd.build("test_compare_datasets", a=reimp_csv, b=reimp_csv_quoted)
 
@@ -168,7 +382,17 @@ def main(urd):
 	urd.build("test_dataset_merge")
 	urd.build("test_dataset_filter_columns")
 	urd.build("test_dataset_empty_colname")
-	urd.build("test_dataset_nan")
+	nan_job = urd.build("test_dataset_nan")
+	stats = urd.build("dataset_stats", source=Dataset(nan_job, "c"), bins=4).load()
+	assert stats['float32']['histogram'] is None and max(v for v in stats['float32']['max'] if v is not None) == float('inf'), stats
+	assert sum(stats['number']['histogram']['counts']) == 2, stats
+	assert sum(stats['float64']['histogram']['counts']) == 2, stats
+	try:
+		urd.build("dataset_stats", source=Dataset(nan_job, "c"), bins=0)
+		print("dataset_stats accepted bins=0")
+		exit(1)
+	except JobError:
+		pass
 	urd.build('test_dataset_parsing_writer')
 
 	print()
@@ -252,6 +476,9 @@ def main(urd):
 	urd.build("test_json")
 	urd.build("test_jobwithfile")
 	urd.build("test_jobchain")
+	urd.build("test_unixhttp")
+	urd.build("test_match_closest")
+	urd.build("test_jobindex", source=urd.build("test_build_kws"))
 
 	print()
 	print("Test shell commands")
@@ -305,6 +532,7 @@ def main(urd):
 	urd.build('test_shell_ds', command_prefix=command_prefix, want=want)
 	urd.truncate("tests_urd", 0)
 	urd.build('test_shell_grep', command_prefix=command_prefix)
+	urd.build('test_dataset_index', command_prefix=command_prefix)
 
 	summary = urd.build("test_summary", joblist=urd.joblist)
 	summary.link_result('summary.html')
@@ -21,21 +21,28 @@ from __future__ import print_function
 from __future__ import division
 
 from accelerator.compat import PY3, unquote_plus
-from accelerator.compat import urlopen, Request, URLError, HTTPError
+from accelerator.compat import URLError, HTTPError, Request
 from accelerator.extras import json_encode, json_decode
 from accelerator.error import ServerError, UrdError, UrdPermissionError, UrdConflictError
 from accelerator import g, __version__ as ax_version
 
 if PY3:
 	from urllib.request import install_opener, build_opener, AbstractHTTPHandler
-	from http.client import HTTPConnection
+	from urllib.request import ProxyHandler, getproxies, proxy_bypass
+	from http.client import HTTPConnection, HTTPSConnection, HTTPException
 else:
 	from urllib2 import install_opener, build_opener, AbstractHTTPHandler
-	from httplib import HTTPConnection
+	from urllib2 import ProxyHandler
+	from urllib import getproxies, proxy_bypass
+	from httplib import HTTPConnection, HTTPSConnection, HTTPException
 
+from collections import defaultdict
+from threading import Lock
+from select import select
 import sys
 import time
 import socket
+import os
 
 class UnixHTTPConnection(HTTPConnection):
 	def __init__(self, host, *a, **kw):
@@ -56,6 +63,144 @@ class UnixHTTPHandler(AbstractHTTPHandler):
 install_opener(build_opener(UnixHTTPHandler))
 
 
+class ConnectionPool:
+	"""Idle keep-alive connections per server, so each call doesn't have
+	to make a new connection. Connections are only used by one thread at a
+	time, and are not shared with forked children."""
+
+	max_idle = 8
+
+	def __init__(self):
+		self.pid = os.getpid()
+		self.lock = Lock()
+		self.idle = defaultdict(list)
+
+	def get(self, key):
+		if self.pid != os.getpid():
+			# Forked, the connections belong to the parent.
+			self.__init__()
+		while True:
+			with self.lock:
+				if not self.idle[key]:
+					return None
+				conn = self.idle[key].pop()
+			if not _is_stale(conn):
+				return conn
+			conn.close()
+
+	def put(self, key, conn):
+		with self.lock:
+			if self.pid == os.getpid() and len(self.idle[key]) < self.max_idle:
+				self.idle[key].append(conn)
+				return
+		conn.close()
+
+def _is_stale(conn):
+	# An idle connection is only readable if the server has closed it
+	# (or sent something unexpected), either way it can't be used.
+	try:
+		return conn.sock is None or bool(select([conn.sock], [], [], 0)[0])
+	except (socket.error, ValueError):
+		return True
+
+_pool = ConnectionPool()
+_connection_classes = {
+	'http': HTTPConnection,
+	'https': HTTPSConnection,
+	'unixhttp': UnixHTTPConnection,
+}
+
+class Response:
+	def __init__(self, status, headers, body):
+		self.status = status
+		self.body = body
+		self._headers = {k.lower(): v for k, v in headers}
+
+	def getcode(self):
+		return self.status
+
+	def getheader(self, name):
+		return self._headers.get(name.lower())
+
+	def read(self):
+		return self.body
+
+	def close(self):
+		pass
+
+def _proxy_for(scheme, netloc):
+	"""The proxy to use according to the usual environment variables,
+	or None."""
+	if scheme == 'unixhttp':
+		return None
+	proxy = getproxies().get(scheme)
+	if proxy and not proxy_bypass(netloc):
+		return proxy
+
+def _urlopen_proxied(url, data, headers, scheme, proxy):
+	# urllib knows how to talk to proxies, so let it.
+	opener = build_opener(ProxyHandler({scheme: proxy}))
+	try:
+		r = opener.open(Request(url, data=data, headers=headers))
+	except HTTPError as e:
+		r = e
+	try:
+		return Response(r.getcode(), r.info().items(), r.read())
+	finally:
+		r.close()
+
+def urlopen(url, data=None, headers={}):
+	"""Like urllib urlopen, but using (and returning to) the connection
+	pool, and always returning a Response (even for errors).
+	Requests that should go through a proxy (according to the usual
+	environment variables) are passed on to urllib instead."""
+	scheme, rest = url.split('://', 1)
+	if scheme not in _connection_classes:
+		raise URLError('unknown url type: %s' % (scheme,))
+	netloc, path = (rest.split('/', 1) + [''])[:2]
+	proxy = _proxy_for(scheme, netloc)
+	if proxy:
+		return _urlopen_proxied(url, data, headers, scheme, proxy)
+	path = '/' + path
+	headers = dict(headers)
+	if data is None:
+		method = 'GET'
+	else:
+		method = 'POST'
+		headers.setdefault('Content-Type', 'application/x-www-form-urlencoded')
+	key = (scheme, netloc)
+	while True:
+		conn = _pool.get(key)
+		reused = conn is not None
+		if not reused:
+			conn = _connection_classes[scheme](netloc)
+		try:
+			conn.request(method, path, body=data, headers=headers)
+		except (socket.error, HTTPException) as e:
+			conn.close()
+			if reused:
+				# Closed by the server while idle, so it never saw the
+				# request. Try another connection.
+				continue
+			raise URLError(e)
+		try:
+			resp = conn.getresponse()
+			body = resp.read()
+		except (socket.error, HTTPException) as e:
+			conn.close()
+			if reused and method == 'GET':
+				# Probably closed by the server while idle. Only GETs are
+				# retried here, a POST may already have been acted upon,
+				# so that is left to the retry policy in call().
+				continue
+			raise URLError(e)
+		if resp.will_close:
+			conn.close()
+		else:
+			_pool.put(key, conn)
+		return Response(resp.status, resp.getheaders(), body)
+
+
 import bottle
 
 # The standard bottle WaitressServer can't handle unix sockets and doesn't set threads.
@@ -74,23 +219,21 @@ def call(url, data=None, fmt=json_decode, headers={}, server_name='server', retr
 	if data is not None and not isinstance(data, bytes):
 		data = json_encode(data)
 	err = None
-	req = Request(url, data=data, headers=headers)
 	for attempt in range(1, retries + 2):
 		resp = None
 		try:
-			r = urlopen(req)
+			r = urlopen(url, data=data, headers=headers)
 			try:
 				resp = r.read()
 				if server_name == 'server' and g.running in ('build', 'shell',):
-					s_version = r.headers['Accelerator-Version'] or '<unknown (old)>'
+					s_version = r.getheader('Accelerator-Version') or '<unknown (old)>'
 					if s_version != ax_version:
 						# Nothing is supposed to catch this, so just print and die.
 						print('Server is running version %s but we are running version %s' % (s_version, ax_version,), file=sys.stderr)
 						exit(1)
 				if PY3:
 					resp = resp.decode('utf-8')
-				# It is inconsistent if we get HTTPError or not.
-				# It seems we do when using TCP sockets, but not when using unix sockets.
+				# Our urlopen doesn't raise HTTPError, so do it here.
 				if r.getcode() >= 400:
 					raise HTTPError(url, r.getcode(), resp, {}, None)
 				return fmt(resp)
@@ -24,17 +24,18 @@ from __future__ import division
 
 from glob import glob
 from collections import defaultdict
+from bisect import bisect_left, bisect_right
 from bottle import route, request, auth_basic, abort
 import bottle
-from threading import Lock
+from threading import Lock, Thread
 import json
 import re
 from datetime import datetime
-import operator
 import os.path
 from io import TextIOWrapper
 import sys
 import os
+import io
 import signal
 
 from accelerator.compat import iteritems, itervalues, unicode, ArgumentParser
@@ -43,7 +44,16 @@ from accelerator.extras import DotDict, PY3
 from accelerator.unixhttp import WaitressServer
 
 LOGFILEVERSION = '3'
+# Lines flagged as compacted (see DB.compact) are written with this
+# version instead, so an older urd refuses them with a version error.
+# This is a one-way change for the compacted logs, the others stay at 3.
+COMPACTED_LOGFILEVERSION = '4'
+SNAPSHOTVERSION = 1
+SNAPSHOT_INTERVAL = 10000 # log lines between snapshots
 
+# Writers take this lock, readers use DB._views which is never modified,
+# only replaced. (The lists in the views are shared with the writer, but
+# only appended to, see DB._unshare.)
 lock = Lock()
 
 def locked(func):
@@ -94,6 +104,11 @@ class TimeStamp(str):
 		obj = str.__new__(cls, strval)
 		obj._ts = ts
 		obj._integer = integer
+		# Sorts the same way as the TimeStamp, but much faster.
+		if ts is None:
+			obj._sortkey = (0, '', integer,)
+		else:
+			obj._sortkey = (1, ts, -1 if integer is None else integer,)
 		return obj
 
 	__hash__ = str.__hash__
@@ -140,39 +155,232 @@ class TimeStamp(str):
 		return not self <= other
 
 
+class TimestampIndex(object):
+	"""The timestamps in one urd list, sorted (for bisecting)."""
+
+	def __init__(self, timestamps=()):
+		self.timestamps = sorted(timestamps, key=lambda ts: ts._sortkey)
+		self.keys = [ts._sortkey for ts in self.timestamps]
+
+	def view(self):
+		"""What the index looks like now, for readers"""
+		return TimestampIndexView(self.timestamps, self.keys, len(self.keys))
+
+	def appends(self, ts):
+		"""Will add(ts) only append?"""
+		return not self.keys or ts._sortkey > self.keys[-1]
+
+	def add(self, ts):
+		pos = bisect_left(self.keys, ts._sortkey)
+		if pos == len(self.keys) or self.keys[pos] != ts._sortkey:
+			self.keys.insert(pos, ts._sortkey)
+			self.timestamps.insert(pos, ts)
+
+	def remove(self, ts):
+		pos = bisect_left(self.keys, ts._sortkey)
+		if pos < len(self.keys) and self.keys[pos] == ts._sortkey:
+			del self.keys[pos]
+			del self.timestamps[pos]
+
+	def copy(self):
+		res = TimestampIndex()
+		res.timestamps = list(self.timestamps)
+		res.keys = list(self.keys)
+		return res
+
+	def truncated(self, ts):
+		"""A new index without ts and everything after it"""
+		pos = bisect_left(self.keys, ts._sortkey)
+		res = TimestampIndex()
+		res.timestamps = self.timestamps[:pos]
+		res.keys = self.keys[:pos]
+		return res
+
+
+class TimestampIndexView(object):
+	"""The first n timestamps in the lists of a TimestampIndex. The writer
+	may append to the lists, but that doesn't change what a view sees."""
+
+	def __init__(self, timestamps=(), keys=(), n=0):
+		self._timestamps = timestamps
+		self._keys = keys
+		self._n = n
+
+	def __len__(self):
+		return self._n
+
+	def __getitem__(self, pos):
+		if pos < 0:
+			pos += self._n
+		if not 0 <= pos < self._n:
+			raise IndexError(pos)
+		return self._timestamps[pos]
+
+	def __contains__(self, ts):
+		pos = bisect_left(self._keys, ts._sortkey, 0, self._n)
+		return pos < self._n and self._keys[pos] == ts._sortkey
+
+	@property
+	def timestamps(self):
+		return self._timestamps[:self._n]
+
+	def position(self, ts):
+		return bisect_left(self._keys, ts._sortkey, 0, self._n)
+
+	def after(self, ts):
+		return self._timestamps[bisect_right(self._keys, ts._sortkey, 0, self._n):self._n]
+
+	def below(self, key, inclusive=False):
+		"""The highest timestamp < (or <=) key, or None"""
+		if inclusive:
+			pos = bisect_right(self._keys, key, 0, self._n)
+		else:
+			pos = bisect_left(self._keys, key, 0, self._n)
+		if pos:
+			return self._timestamps[pos - 1]
+
+	def above(self, key, inclusive=False):
+		"""The lowest timestamp > (or >=) key, or None"""
+		if inclusive:
+			pos = bisect_left(self._keys, key, 0, self._n)
+		else:
+			pos = bisect_right(self._keys, key, 0, self._n)
+		if pos < self._n:
+			return self._timestamps[pos]
+
+
 class DB:
-	def __init__(self, path, verbose=True):
+	def __init__(self, path, verbose=True, readonly=False):
+		# readonly is only for checking a compaction, see compact()
 		self._initialised = False
 		self.path = path
 		self.db = defaultdict(dict)
 		self.ghost_db = defaultdict(lambda: defaultdict(list))
+		self.index = defaultdict(TimestampIndex)
+		# (key, timestamp) -> {(key, timestamp)} of the entries in db that depend on it
+		self.rdeps = defaultdict(set)
+		# key -> (db, index view) as of the last completed write, for readers.
+		self._views = {}
+		self._dirty = set()
+		# keys where the db dict and index lists are in a view
+		self._shared = set()
+		self._snapshot_fn = os.path.join(path, 'snapshot')
+		self._lines_since_snapshot = 0
+		self._snapshot_running = False
+		self._linecounts = {}
 		if os.path.isdir(path):
+			self._finish_compaction()
 			files = glob(os.path.join(path, '*/*.urd'))
 			self._parsed = {}
 			stat = {}
+			# Load the snapshot (if any) and only replay what was logged after it.
+			positions = self._load_snapshot(files)
 			for fn in files:
-				with open(fn) as fh:
-					ix = 0
+				key = fn[len(path) + 1:-len('.urd')]
+				pos, ix = positions.get(key, (0, 0,))
+				with open(fn, 'rb') as fh:
+					fh.seek(pos)
 					for line in fh:
-						self._parse(line)
+						self._parse(line.decode('utf-8'))
 						ix += 1
-					stat[fn[len(path) + 1:-len('.urd')]] = ix
+				stat[key] = ix
+			self._linecounts.update(stat)
+			replayed = len(self._parsed)
 			self._playback_parsed()
 			if verbose:
 				print("urd-list                          lines     ghosts     active")
 				for key, val in sorted(stat.items()):
 					print("%-30s  %7d    %7d    %7d" % (key, val, len(self.ghost_db[key]), len(self.db[key]),))
 				print()
+				if positions:
+					print("Loaded snapshot, replayed %d log lines." % (replayed,))
 		else:
 			print("Creating directory \"%s\"." % (path,))
 			os.makedirs(path)
+			replayed = 0
 		self._lasttime = None
 		self._initialised = True
+		self._dirty.update(self.db)
+		self._publish()
+		if replayed > SNAPSHOT_INTERVAL // 10 and not readonly:
+			with lock:
+				self._snapshot()
+
+	def _load_snapshot(self, files):
+		"""Load db and ghost_db from the snapshot and return
+		{key: (position, linecount)} for the logs it covers.
+		Returns {} (and loads nothing) if there is no usable snapshot."""
+		try:
+			with open(self._snapshot_fn, 'rb') as fh:
+				snapshot = json.loads(fh.read().decode('utf-8'))
+			if snapshot['version'] != SNAPSHOTVERSION:
+				return {}
+			keys = {fn[len(self.path) + 1:-len('.urd')]: fn for fn in files}
+			for key, (pos, _, ino) in iteritems(snapshot['positions']):
+				# The log must still be the same file, at least as long as
+				# when the snapshot was made.
+				fn = keys[key]
+				if os.stat(fn).st_ino != ino:
+					return {}
+				if pos:
+					with open(fn, 'rb') as fh:
+						fh.seek(pos - 1)
+						if fh.read(1) != b'\n':
+							return {}
+		except Exception:
+			return {}
+		def mkdata(d):
+			d = DotDict(d)
+			d.timestamp = TimeStamp(d.timestamp)
+			return d
+		for key, lst in iteritems(snapshot['db']):
+			self.db[key] = {data.timestamp: data for data in map(mkdata, lst)}
+			self.index[key] = TimestampIndex(self.db[key])
+			for data in itervalues(self.db[key]):
+				self._link(key, data)
+		for key, lst in iteritems(snapshot['ghost_db']):
+			db = self.ghost_db[key]
+			for ts, datas in lst:
+				db[TimeStamp(ts)] = [mkdata(d) for d in datas]
+		return {key: (pos, linecount,) for key, (pos, linecount, _) in iteritems(snapshot['positions'])}
+
+	def _snapshot(self):
+		"""Save db and ghost_db with the log positions they correspond to.
+		Must be called with the lock held. The copy is made here, the
+		(slow) writing happens in a separate thread."""
+		if self._snapshot_running:
+			return
+		self._snapshot_running = True
+		self._lines_since_snapshot = 0
+		positions = {}
+		for fn in glob(os.path.join(self.path, '*/*.urd')):
+			st = os.stat(fn)
+			key = fn[len(self.path) + 1:-len('.urd')]
+			positions[key] = [st.st_size, self._linecounts.get(key, 0), st.st_ino]
+		snapshot = dict(
+			version=SNAPSHOTVERSION,
+			positions=positions,
+			db={key: list(itervalues(db)) for key, db in iteritems(self.db) if db},
+			ghost_db={key: [(ts, list(datas)) for ts, datas in iteritems(db)] for key, db in iteritems(self.ghost_db) if db},
+		)
+		def write():
+			tmp_fn = self._snapshot_fn + '.tmp'
+			try:
+				with open(tmp_fn, 'wb') as fh:
+					fh.write(json.dumps(snapshot).encode('utf-8'))
+				os.rename(tmp_fn, self._snapshot_fn)
+			except Exception as e:
+				print("Failed to write urd snapshot: %s" % (e,), file=sys.stderr)
+			finally:
+				self._snapshot_running = False
+		t = Thread(target=write, name='urd snapshot')
+		t.daemon = True
+		t.start()
 
 	def _parse(self, line):
 		line = line.rstrip('\n').split('|')
 		logfileversion, writets = line[:2]
-		assert logfileversion == '3'
+		assert logfileversion in (LOGFILEVERSION, COMPACTED_LOGFILEVERSION,), 'Unknown log version %r' % (logfileversion,)
 		assert writets not in self._parsed
 		self._parsed[writets] = line[2:]
 
@@ -199,11 +407,11 @@ class DB:
 			flags=flags,
 			caption=line[5],
 		)
-		self.add(data)
+		self._add(data)
 
 	def _parse_truncate(self, line):
 		timestamp, key = line
-		self.truncate(key, timestamp)
+		self._truncate(key, timestamp)
 
 	def _validate_data(self, data, with_deps=True):
 		if with_deps:
@@ -221,7 +429,7 @@ class DB:
 		assert isinstance(data.caption, unicode)
 		data.timestamp = TimeStamp(data.timestamp)
 
-	def _serialise(self, action, data):
+	def _serialise(self, action, data, writets=None):
 		if action == 'add':
 			self._validate_data(data)
 			json_deps = json.dumps(data.deps)
@@ -237,11 +445,16 @@ class DB:
 		else:
 			assert "can't happen"
 		data.timestamp = TimeStamp(data.timestamp)
-		while True: # paranoia
-			now = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S.%f")
-			if now != self._lasttime: break
-		self._lasttime = now
-		s = '|'.join([LOGFILEVERSION, now, action, data.timestamp, key,] + logdata)
+		if writets is None:
+			while True: # paranoia
+				writets = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S.%f")
+				if writets != self._lasttime: break
+			self._lasttime = writets
+		if action == 'add' and 'compacted' in data.flags:
+			version = COMPACTED_LOGFILEVERSION
+		else:
+			version = LOGFILEVERSION
+		s = '|'.join([version, writets, action, data.timestamp, key,] + logdata)
 		return s
 
 	def _is_ghost(self, data):
@@ -257,15 +470,22 @@ class DB:
 
 	@locked
 	def add(self, data):
+		return self._add(data)
+
+	# Replay uses _add and _truncate directly, as it does not need the lock
+	# (and it can't take it when checking a compaction).
+
+	def _add(self, data):
 		key = '%s/%s' % (data.user, data.build)
 		flags = data.pop('flags', [])
-		assert flags in ([], ['update']), 'Unknown flags: %r' % (flags,)
+		# compacted is only valid in the log, see compact()
+		assert flags in ([], ['update']) or (flags == ['compacted'] and not self._initialised), 'Unknown flags: %r' % (flags,)
 		new = False
 		changed = False
 		ghosted = 0
 		data.timestamp = TimeStamp(data.timestamp)
 		assert data.timestamp != '0', "Timestamp 0 is special, you can't add it."
-		is_ghost = self._is_ghost(data)
+		is_ghost = flags != ['compacted'] and self._is_ghost(data)
 		if is_ghost:
 			db = self.ghost_db[key]
 			if data.timestamp in db:
@@ -291,37 +511,63 @@ class DB:
 			if is_ghost:
 				db[data.timestamp].append(data)
 			else:
+				if changed or not self.index[key].appends(data.timestamp):
+					db = self._unshare(key)
 				if changed:
 					ghost_data = db[data.timestamp]
 					self.ghost_db[key][data.timestamp].append(ghost_data)
+					self._unlink(key, ghost_data)
 				db[data.timestamp] = data
+				self.index[key].add(data.timestamp)
+				self._link(key, data)
+				self._dirty.add(key)
 				if changed:
-					ghosted = self._update_ghosts()
+					ghosted = self._update_ghosts([(key, data.timestamp)])
+				self._publish()
+			self._maybe_snapshot()
 		res = dict(new=new, changed=changed, is_ghost=is_ghost)
 		if changed:
 			res['deps'] = ghosted
 		return res
 
-	def _update_ghosts(self):
-		def inner():
-			count = 0
-			for key, db in iteritems(self.db):
-				for ts, data in sorted(db.items()):
-					if self._is_ghost(data):
-						count += 1
-						del db[ts]
-						self.ghost_db[key][ts].append(data)
-			return count
-		res = 0
-		while True:
-			count = inner()
-			if not count:
-				break
-			res += count
-		return res
+	def _link(self, key, data):
+		for depkey, dep in iteritems(data.deps):
+			self.rdeps[(depkey, TimeStamp(dep['timestamp']))].add((key, data.timestamp))
+
+	def _unlink(self, key, data):
+		for depkey, dep in iteritems(data.deps):
+			depref = (depkey, TimeStamp(dep['timestamp']))
+			dependents = self.rdeps.get(depref)
+			if dependents:
+				dependents.discard((key, data.timestamp))
+				if not dependents:
+					del self.rdeps[depref]
+
+	def _update_ghosts(self, changed):
+		# changed is [(key, timestamp)] that have been replaced or removed
+		# in db. Only entries that (transitively) depend on those can have
+		# become ghosts.
+		count = 0
+		todo = list(changed)
+		while todo:
+			for key, ts in sorted(self.rdeps.get(todo.pop(), ())):
+				data = self.db[key].get(ts)
+				if data is not None and self._is_ghost(data):
+					count += 1
+					self._unshare(key)
+					del self.db[key][ts]
+					self.index[key].remove(ts)
+					self._dirty.add(key)
+					self.ghost_db[key][ts].append(data)
+					self._unlink(key, data)
+					todo.append((key, ts))
+		return count
 
 	@locked
 	def truncate(self, key, timestamp):
+		return self._truncate(key, timestamp)
+
+	def _truncate(self, key, timestamp):
 		old = self.db[key]
 		new = {}
 		ghost = {}
@@ -333,15 +579,144 @@ class DB:
 				ghost[ts] = data
 		self.log('truncate', DotDict(key=key, timestamp=timestamp))
 		self.db[key] = new
+		self.index[key] = self.index[key].truncated(timestamp)
+		self._shared.discard(key)
+		self._dirty.add(key)
 		ghost_db = self.ghost_db[key]
 		for ts, data in iteritems(ghost):
 			ghost_db[ts].append(data)
-		if ghost:
-			deps = self._update_ghosts()
-		else:
-			deps = 0
+			self._unlink(key, data)
+		deps = self._update_ghosts([(key, ts) for ts in ghost])
+		self._publish()
+		self._maybe_snapshot()
 		return {'count': len(ghost), 'deps': deps}
 
+	@locked
+	def compact(self, key, archive=False):
+		"""Rewrite the log for key with a single line for each current entry.
+		Entries can depend on versions of entries in other lists (or the
+		same list) that have since been updated without changing what the
+		dependency refers to, so just keeping some of the old lines does
+		not replay to the same state. Instead the new lines are flagged as
+		compacted, which means they are trusted on replay without checking
+		the dependencies. They reuse the oldest write timestamps of the
+		log, so they replay before anything written to it later.
+		Ghosts in other lists can still depend on old versions in this
+		log, so the whole db is replayed with the new log before it is
+		used, and nothing is changed if that gives a different state.
+		If archive is set the old log is appended to a .archive file.
+		The ghosts for key are forgotten, as they would be on restart.
+		Compacted logs can not be read by urd versions before this."""
+		fn = os.path.join(self.path, key + '.urd')
+		if key not in self.db or not os.path.exists(fn):
+			bottle.response.status = 404
+			return {'error': 'no such list'}
+		with open(fn, 'rb') as fh:
+			writets = sorted(line.split(b'|', 2)[1].decode('ascii') for line in fh)
+		lines = []
+		for ts, (_, data) in zip(writets, sorted(iteritems(self.db[key]))):
+			data = DotDict(data, flags=['compacted'])
+			lines.append(self._serialise('add', data, ts) + '\n')
+		# There is always at least one line per current entry.
+		assert len(lines) == len(self.db[key])
+		with open(fn + '.compacted', 'wb') as fh:
+			fh.write(''.join(lines).encode('utf-8'))
+			fh.flush()
+			os.fsync(fh.fileno())
+		if not self._replays_the_same(key, fn + '.compacted'):
+			os.unlink(fn + '.compacted')
+			bottle.response.status = 409
+			return {'error': 'compacting would change other lists'}
+		if archive:
+			with open(fn, 'rb') as fh:
+				old = fh.read()
+			with open(fn[:-len('.urd')] + '.archive', 'ab') as fh:
+				fh.write(old)
+				fh.flush()
+				os.fsync(fh.fileno())
+		# The compacted log is written, now commit to using it. If we crash
+		# before the marker is in place the old log is still used,
+		# otherwise the new one is (at the latest on restart).
+		marker_fn = os.path.join(self.path, 'compacting')
+		with open(marker_fn + '.tmp', 'wb') as fh:
+			fh.write(json.dumps([fn]).encode('utf-8'))
+			fh.flush()
+			os.fsync(fh.fileno())
+		os.rename(marker_fn + '.tmp', marker_fn)
+		self._finish_compaction()
+		self._linecounts[key] = len(lines)
+		self.ghost_db.pop(key, None)
+		# The snapshot refers to the old file, so make a new one as soon as possible.
+		self._lines_since_snapshot = SNAPSHOT_INTERVAL
+		self._maybe_snapshot()
+		return {'count': len(lines), 'dropped': len(writets) - len(lines)}
+
+	def _replays_the_same(self, key, compacted_fn):
+		"""Replay all logs, with compacted_fn instead of the log for key,
+		and check that it gives the current db."""
+		from tempfile import mkdtemp
+		from shutil import rmtree
+		tmp = mkdtemp(prefix='urd-compact.')
+		try:
+			for fn in glob(os.path.join(self.path, '*/*.urd')):
+				k = fn[len(self.path) + 1:-len('.urd')]
+				user, build = k.split('/')
+				if not os.path.isdir(os.path.join(tmp, user)):
+					os.mkdir(os.path.join(tmp, user))
+				os.symlink(os.path.abspath(compacted_fn if k == key else fn), os.path.join(tmp, k + '.urd'))
+			check = DB(tmp, verbose=False, readonly=True)
+			keys = set(k for k, db in iteritems(self.db) if db)
+			if keys != set(k for k, db in iteritems(check.db) if db):
+				return False
+			return all(self.db[k] == check.db[k] for k in keys)
+		finally:
+			rmtree(tmp)
+
+	def _finish_compaction(self):
+		"""Put the compacted logs in place, if a compaction was committed
+		but not finished. Otherwise remove any compacted logs that weren't."""
+		marker_fn = os.path.join(self.path, 'compacting')
+		if os.path.exists(marker_fn):
+			with open(marker_fn, 'rb') as fh:
+				files = json.loads(fh.read().decode('utf-8'))
+			for fn in files:
+				if os.path.exists(fn + '.compacted'):
+					os.rename(fn + '.compacted', fn)
+			os.unlink(marker_fn)
+		for fn in glob(os.path.join(self.path, '*/*.urd.compacted')):
+			os.unlink(fn)
+
+	def _publish(self):
+		"""Make changes to db and index visible to readers. Called (with
+		the lock held) when a write is complete. The views share db and
+		the index lists with the writer, but only see what was there when
+		they were published, so readers never see a half-done write and
+		never need the lock. Anything other than appending a new latest
+		entry has to _unshare first."""
+		if not self._initialised or not self._dirty:
+			return
+		views = dict(self._views)
+		for key in self._dirty:
+			views[key] = (self.db[key], self.index[key].view(),)
+			self._shared.add(key)
+		self._views = views
+		self._dirty = set()
+
+	def _unshare(self, key):
+		"""Copy db and index for key if they are in a view, so they can
+		be changed in other ways than appending. Returns the db dict."""
+		if key in self._shared:
+			self.db[key] = dict(self.db[key])
+			self.index[key] = self.index[key].copy()
+			self._shared.discard(key)
+		return self.db[key]
+
+	def _maybe_snapshot(self):
+		# Called (with the lock held) after the state is updated, so the
+		# snapshot never includes a log line without its effect.
+		if self._initialised and self._lines_since_snapshot >= SNAPSHOT_INTERVAL:
+			self._snapshot()
+
 	def log(self, action, data):
 		if self._initialised:
 			if action == 'truncate':
@@ -354,7 +729,10 @@ class DB:
 			if not os.path.isdir(path):
 				os.makedirs(path)
 			fn = os.path.join(path, build + '.urd')
-			with open(fn, 'a') as fh:
+			key = user + '/' + build
+			self._linecounts[key] = self._linecounts.get(key, 0) + 1
+			self._lines_since_snapshot += 1
+			with io.open(fn, 'a', encoding='utf-8') as fh:
 				start_pos = fh.tell()
 				try:
 					fh.write(self._serialise(action, data) + '\n')
@@ -384,39 +762,74 @@ class DB:
 						# This is a fatal error.
 						os.killpg(os.getpgid(0), signal.SIGTERM)
 
-	@locked
-	def get(self, key, timestamp):
-		db = self.db[key]
-		return db.get(TimeStamp(timestamp))
+	def _view(self, key):
+		return self._views.get(key) or ({}, TimestampIndexView(),)
 
-	@locked
-	def since(self, key, timestamp):
+	def _step(self, view, data, offset):
+		"""The entry offset steps after (or before, if negative) data."""
+		if not offset or data is None:
+			return data
+		db, index = view
+		pos = index.position(data.timestamp) + offset
+		if 0 <= pos < len(index):
+			return db[index[pos]]
+
+	def get(self, key, timestamp, offset=0):
+		view = db, index = self._view(key)
 		timestamp = TimeStamp(timestamp)
-		return sorted(k for k in self.db[key] if k > timestamp)
+		if timestamp not in index:
+			return None # (db may have newer entries than the view)
+		return self._step(view, db.get(timestamp), offset)
 
-	@locked
-	def limited_endpoint(self, key, timestamp, cmpfunc, minmaxfunc):
-		db = self.db[key]
-		try:
-			k = minmaxfunc(k for k in db if cmpfunc(k, timestamp))
-		except ValueError: # empty sequence
-			return None
-		return db[k]
+	def since(self, key, timestamp):
+		_, index = self._view(key)
+		return index.after(TimeStamp(timestamp))
 
-	@locked
-	def latest(self, key):
-		db = self.db[key]
-		if db:
-			return db[max(db)]
+	def limited_endpoint(self, key, timestamp, op, offset=0):
+		"""The data for the highest timestamp < or <= timestamp, or the
+		lowest > or >= timestamp. <=~ is <= but also matching anything
+		starting with timestamp, so 2014-04-10 <=~ 2014-04 is True.
+		"""
+		view = db, index = self._view(key)
+		timestamp = TimeStamp(timestamp)
+		if op == '<':
+			k = index.below(timestamp._sortkey)
+		elif op == '<=':
+			k = index.below(timestamp._sortkey, True)
+		elif op == '<=~':
+			k = index.below(timestamp._sortkey, True)
+			if '+' in timestamp:
+				# rare enough to not bother being clever
+				cand = [ts for ts in index.timestamps if ts.startswith(timestamp)]
+			else:
+				# everything starting with timestamp sorts right after it
+				cand = [index.below((1, timestamp + '\uffff',))]
+			cand = [ts for ts in cand if ts and ts.startswith(timestamp)]
+			if cand:
+				cand = max(cand, key=lambda ts: ts._sortkey)
+				if not k or k._sortkey < cand._sortkey:
+					k = cand
+		elif op == '>':
+			k = index.above(timestamp._sortkey)
+		elif op == '>=':
+			k = index.above(timestamp._sortkey, True)
+		else:
+			raise ValueError(op)
+		if k is not None:
+			return self._step(view, db[k], offset)
 
-	@locked
-	def first(self, key):
-		db = self.db[key]
-		if db:
-			return db[min(db)]
+	def latest(self, key, offset=0):
+		view = db, index = self._view(key)
+		if index:
+			return self._step(view, db[index[-1]], offset)
+
+	def first(self, key, offset=0):
+		view = db, index = self._view(key)
+		if index:
+			return self._step(view, db[index[0]], offset)
 
 	def keys(self):
-		return filter(self.db.get, self.db)
+		return [key for key, (_, index) in iteritems(self._views) if index]
 
 
 def auth(user, passphrase):
@@ -437,44 +850,63 @@ def since(user, build, timestamp):
 		res = [(ts, (db.get(key, ts) or {}).get('caption', ''),) for ts in res]
 	return res
 
+def offset404(offset):
+	try:
+		return int(offset or 0)
+	except ValueError:
+		raise bottle.HTTPError(404, 'Bad offset %r' % (offset,))
+
+# All of these take ?offset=N to get the entry N steps later (or earlier
+# if negative) than the one specified.
+
 @route('/<user>/<build>/latest')
 def latest(user, build):
-	return db.latest(user + '/' + build)
+	return db.latest(user + '/' + build, offset404(request.query.offset))
 
 @route('/<user>/<build>/first')
 def first(user, build):
-	return db.first(user + '/' + build)
+	return db.first(user + '/' + build, offset404(request.query.offset))
 
 @route('/<user>/<build>/<timestamp>')
 def single(user, build, timestamp):
-	key = user + '/' + build
+	return lookup(user + '/' + build, timestamp, offset404(request.query.offset))
+
+def lookup(key, timestamp, offset):
+	if timestamp == 'latest':
+		return db.latest(key, offset)
+	if timestamp == 'first':
+		return db.first(key, offset)
 	if len(timestamp) > 1 and timestamp[0] in '<>':
-		if timestamp[0] == '<':
-			minmaxfunc = max
-			if timestamp[1] == '=':
-				if '-' in timestamp:
-					# we want 2014-04-10 <= 2014-04 to be True
-					def cmpfunc(k, ts):
-						return k <= ts or k.startswith(ts)
-				else:
-					cmpfunc = operator.le
-				timestamp = timestamp[2:]
-			else:
-				cmpfunc = operator.lt
-				timestamp = timestamp[1:]
-		else:
-			minmaxfunc = min
-			if timestamp[1] == '=':
-				cmpfunc = operator.ge
-				timestamp = timestamp[2:]
-			else:
-				cmpfunc = operator.gt
-				timestamp = timestamp[1:]
+		op = timestamp[0]
+		timestamp = timestamp[1:]
+		if timestamp[0] == '=':
+			op += '='
+			timestamp = timestamp[1:]
+			if op == '<=' and '-' in timestamp:
+				# we want 2014-04-10 <= 2014-04 to be True
+				op = '<=~'
 		timestamp = timestamp404(timestamp)
-		return db.limited_endpoint(key, timestamp, cmpfunc, minmaxfunc)
+		return db.limited_endpoint(key, timestamp, op, offset)
 	else:
 		timestamp = timestamp404(timestamp)
-		return db.get(key, timestamp)
+		return db.get(key, timestamp, offset)
+
+@route('/batch', method='POST')
+def batch():
+	"""Several lookups in one request. Takes a list of [key, timestamp]
+	or [key, timestamp, offset], where timestamp is anything you can use
+	in /<user>/<build>/<timestamp> (including latest and first).
+	Returns a list of results in the same order."""
+	body = request.body
+	if PY3:
+		body = TextIOWrapper(body, encoding='utf-8')
+	res = []
+	for item in json.load(body):
+		if len(item) == 2:
+			item = list(item) + [0]
+		key, timestamp, offset = item
+		res.append(lookup(key, timestamp, offset404(offset)))
+	return res
 
 
 @route('/add', method='POST')
@@ -499,6 +931,14 @@ def truncate(user, build, timestamp):
 	return db.truncate(user + '/' + build, timestamp)
 
 
+@route('/compact/<user>/<build>', method='POST')
+@auth_basic(auth)
+def compact(user, build):
+	if user != request.auth[0]:
+		abort(401, "Error:  user does not match authentication!")
+	return db.compact(user + '/' + build, 'archive' in request.query)
+
+
 @route('/test/<user>', method='POST')
 @auth_basic(auth)
 def test(user):
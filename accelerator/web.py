@@ -51,6 +51,11 @@ class BaseWebHandler(BaseHTTPRequestHandler):
 
 	unicode_args = False
 
+	# Keep connections open between requests (every response has a
+	# Content-Length), but don't hold on to idle ones forever.
+	protocol_version = 'HTTP/1.1'
+	timeout = 60
+
 	# Stop it from doing name lookups for logging
 	def address_string(self):
 		return self.client_address[0]
@@ -95,6 +100,7 @@ class BaseWebHandler(BaseHTTPRequestHandler):
 		self._do_req2(path[0], cgi_args)
 
 	def _bad_request(self):
+		self.close_connection = True
 		self.do_response(400, "text/plain", "Bad request\n")
 
 	def argdec(self, v):
@@ -117,6 +123,7 @@ class BaseWebHandler(BaseHTTPRequestHandler):
 			elif e and e != ".":
 				p_a.append(self.argdec(unquote_plus(e)))
 		args = dict((a, self.argdec(cgi_args[a][-1])) for a in cgi_args)
+		self.responded = False
 		self.handle_req(p_a, args)
 
 	def encode_body(self, body):
@@ -127,6 +134,12 @@ class BaseWebHandler(BaseHTTPRequestHandler):
 		return body.encode("utf-8")
 
 	def do_response(self, code, content_type, body, extra_headers = []):
+		if getattr(self, 'responded', False):
+			# Only one response per request, or the next request on this
+			# connection would get this one.
+			self.close_connection = True
+			return
+		self.responded = True
 		try:
 			body = self.encode_body(body)
 			self.send_response(code)
@@ -138,4 +151,4 @@ class BaseWebHandler(BaseHTTPRequestHandler):
 			if self.is_head: return
 			self.wfile.write(body)
 		except Exception:
-			pass
+			self.close_connection = True
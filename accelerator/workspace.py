@@ -22,10 +22,130 @@ from __future__ import print_function
 from __future__ import division
 
 import os
+import sys
 
+from accelerator.compat import pickle
 from accelerator.job import Job
 
 
+def _job_mtime(a):
+	"""Returns (mtime, finished) for a job directory, or None if it's gone.
+	Finished means it has a post.json. If the mtime is the same as in the
+	index we know post.json is still there (creating or removing it would
+	change the mtime)."""
+	path, index_mtime = a
+	try:
+		mtime = os.stat(path).st_mtime
+	except OSError:
+		return None
+	finished = (mtime == index_mtime or os.path.exists(os.path.join(path, 'post.json')))
+	return mtime, finished
+
+
+class JobIndex:
+	""" Persistent cache of (setup.json, subjobs) for all jobs in a workdir.
+
+	    Stored as an append-only log of pickles in .jobindex in the workdir.
+	    Entries are valid as long as the mtime of the job directory has not
+	    changed. This is only a cache, anything missing or unreadable is
+	    simply loaded from the job directory. """
+
+	_header = ('accelerator jobindex', 1, sys.version_info[0],)
+
+	def __init__(self, path):
+		self.filename = os.path.join(path, '.jobindex')
+		self.entries = {}
+		self.records = 0
+		self.pending = []
+		self.need_rewrite = True
+		self.broken = False
+
+	def load(self):
+		self.entries = {}
+		self.records = 0
+		self.need_rewrite = True
+		try:
+			with open(self.filename, 'rb') as fh:
+				if pickle.load(fh) != self._header:
+					return
+				self.need_rewrite = False
+				size = os.fstat(fh.fileno()).st_size
+				while True:
+					pos = fh.tell()
+					try:
+						jobid, mtime, params = pickle.load(fh)
+					except EOFError:
+						if pos != size:
+							# A partial record at the end, appending
+							# after it would lose everything appended.
+							self.need_rewrite = True
+						break
+					self.entries[jobid] = (mtime, params)
+					self.records += 1
+		except Exception:
+			# Missing, truncated, from a different version or otherwise
+			# broken. Keep whatever we got and rewrite the index.
+			self.need_rewrite = True
+
+	def mtime(self, jobid):
+		return self.entries.get(jobid, (None,))[0]
+
+	def get(self, jobid, mtime):
+		""" params for jobid if the index is valid for this mtime, else None """
+		entry = self.entries.get(jobid)
+		if entry and mtime is not None and entry[0] == mtime:
+			return entry[1]
+
+	def add(self, jobid, mtime, params):
+		if mtime is None:
+			return
+		self.entries[jobid] = (mtime, params)
+		self.pending.append((jobid, mtime, params))
+
+	def remove(self, jobid):
+		self.entries.pop(jobid, None)
+
+	def flush(self, live_jobids=None):
+		""" Write pending entries to disk, rewriting the whole index if it
+		    has too much garbage in it. If live_jobids is specified all
+		    other entries are dropped. """
+		if live_jobids is not None:
+			for jobid in set(self.entries) - live_jobids:
+				del self.entries[jobid]
+		pending, self.pending = self.pending, []
+		if self.broken:
+			return
+		try:
+			if self.need_rewrite or self.records + len(pending) > 2 * len(self.entries) + 1000:
+				self._rewrite()
+			elif pending:
+				data = b''.join(pickle.dumps(record, 2) for record in pending)
+				# A single write so several servers can append to the same index.
+				with open(self.filename, 'ab') as fh:
+					fh.write(data)
+				self.records += len(pending)
+		except (OSError, IOError):
+			# Probably a workdir we can't write to, just don't use the index.
+			self.broken = True
+
+	def _rewrite(self):
+		tmp_filename = '%s.%dtmp' % (self.filename, os.getpid(),)
+		try:
+			with open(tmp_filename, 'wb') as fh:
+				pickle.dump(self._header, fh, 2)
+				for jobid, (mtime, params) in self.entries.items():
+					pickle.dump((jobid, mtime, params), fh, 2)
+			os.rename(tmp_filename, self.filename)
+		except Exception:
+			try:
+				os.unlink(tmp_filename)
+			except OSError:
+				pass
+			raise
+		self.records = len(self.entries)
+		self.need_rewrite = False
+
+
 class WorkSpace:
 	""" Handle all access to a single "physical" workdir. """
 
@@ -38,7 +158,17 @@ class WorkSpace:
 		self.slices = int(slices)
 		self.valid_jobids = set()
 		self.known_jobids = set()
+		self.known_changes = set() # added to or removed from known_jobids, for DataBase
 		self.recent_bad_jobids = set()
+		self.mtimes = {}
+		self.pending = {} # known but not valid jobids: mtime
+		self.index = JobIndex(path)
+		self._index_loaded = False
+		self.watcher = None
+		self._wd2jobid = {}
+		self._jobid2wd = {}
+		self._listed_mtime = None
+		self._full_recheck_time = 0
 		if not self._check_metafile():
 			exit(1)
 
@@ -66,34 +196,160 @@ class WorkSpace:
 
 
 	def add_single_jobid(self, jobid):
+		self._checked([jobid], [_job_mtime((os.path.join(self.path, jobid), None,))])
 		self.valid_jobids.add(jobid)
 
 
 	def update(self, pool):
-		"""find all new jobids on disk"""
-		from os.path import exists, join
+		"""find all new jobids on disk, and recheck recently bad ones"""
+		from os.path import join
 		from accelerator.job import dirnamematcher
-		from itertools import compress
+		if not self._index_loaded:
+			self.index.load()
+			self._index_loaded = True
+		if self.watcher is None:
+			self._start_watching()
+		self._listed_mtime = self._path_mtime()
 		cand = set(filter(dirnamematcher(self.name), os.listdir(self.path)))
-		bad = self.known_jobids - cand
-		for jid in bad:
+		self._forget(self.known_jobids - cand)
+		# Anything which was bad last time but had recently been touched
+		# needs to be rechecked, it might have been finished by another server.
+		new = [Job(j) for j in cand - (self.known_jobids - self.recent_bad_jobids)]
+		if new:
+			argv = [(join(self.path, j), self.index.mtime(j),) for j in new]
+			self._checked(new, pool.imap(_job_mtime, argv, chunksize=64))
+
+
+	def refresh(self):
+		"""Cheap incremental version of update, for use between full updates.
+		Uses inotify events when available, otherwise (and for changes made
+		by other hosts on network filesystems) the mtime of the workdir and
+		of unfinished job directories.
+		Returns (newly valid jobids, gone jobids)."""
+		from accelerator.job import dirnamematcher
+		from accelerator.compat import monotonic
+		from accelerator import inotify
+		matcher = dirnamematcher(self.name)
+		check = set(self.recent_bad_jobids)
+		gone = set()
+		relist = False
+		saw_workdir_events = False
+		if self.watcher:
+			for wd, mask, name in self.watcher.read():
+				if mask & inotify.IN_Q_OVERFLOW:
+					relist = True
+					check.update(self.pending)
+				elif wd == self._workdir_wd:
+					saw_workdir_events = True
+					if matcher(name):
+						if mask & (inotify.IN_DELETE | inotify.IN_MOVED_FROM):
+							gone.add(name)
+						else:
+							gone.discard(name)
+							check.add(name)
+				elif wd in self._wd2jobid and (name == 'post.json' or mask & inotify.IN_DELETE_SELF):
+					check.add(self._wd2jobid[wd])
+		now = monotonic()
+		if now - self._full_recheck_time > 60:
+			# Unfinished jobs that aren't recent don't get looked at often,
+			# but they can still be finished by another server.
+			check.update(self.pending)
+			self._full_recheck_time = now
+		path_mtime = self._path_mtime()
+		if path_mtime != self._listed_mtime:
+			if saw_workdir_events and not relist:
+				# Most likely our own changes, which we already have.
+				self._listed_mtime = path_mtime
+			else:
+				relist = True
+		if relist:
+			self._listed_mtime = path_mtime
+			cand = set(filter(matcher, os.listdir(self.path)))
+			gone = self.known_jobids - cand
+			check.update(cand - self.known_jobids)
+		gone = set(Job(j) for j in gone if j in self.known_jobids)
+		self._forget(gone)
+		check = [Job(j) for j in check if j not in gone and j not in self.valid_jobids]
+		argv = [(os.path.join(self.path, j), self.index.mtime(j),) for j in check]
+		return self._checked(check, map(_job_mtime, argv)), gone
+
+
+	def _path_mtime(self):
+		try:
+			return os.stat(self.path).st_mtime
+		except OSError:
+			return None
+
+
+	def _checked(self, jobids, results):
+		"""Record results from _job_mtime for jobids, returns the newly valid ones."""
+		from time import time
+		cutoff = time() - 64 # hopefully avoid races if we're on a network filesystem
+		good = []
+		for jid, res in zip(jobids, results):
+			if jid not in self.known_jobids:
+				self.known_jobids.add(jid)
+				self.known_changes.add(jid)
+			if res is None: # already gone again
+				continue
+			mtime, finished = res
+			if finished:
+				self.pending.pop(jid, None)
+				self.recent_bad_jobids.discard(jid)
+				self._unwatch(jid)
+				if jid not in self.valid_jobids:
+					self.valid_jobids.add(jid)
+					good.append(jid)
+				self.mtimes[jid] = mtime
+			else:
+				self.pending[jid] = mtime
+				if mtime > cutoff:
+					self.recent_bad_jobids.add(jid)
+				else:
+					self.recent_bad_jobids.discard(jid)
+				self._watch(jid)
+		return good
+
+
+	def _forget(self, jobids):
+		for jid in jobids:
 			self.known_jobids.discard(jid)
+			self.known_changes.add(jid)
 			self.valid_jobids.discard(jid)
-		# @@TODO: Fix races for remote servers:
-		# Anything which was bad last time but had recently been touched needs to be rechecked:
-		#     new = list(cand - (self.known_jobids - self.recent_bad_jobids))
-		#     cutoff = time() - 64 # hopefully avoid races if we're on a network filsystem
-		#     recent = set(j for j in new if mtime(j( > cutoff)
-		#     self.recent_bad_jobids = recent - good
-		# Also anything where the mtime has changed needs to be rechecked, at least
-		# in DataBase.
-		# So we need to keep mtimes and look at them, plus the above recent_bad_jobids
-		new = [Job(j) for j in cand - self.known_jobids]
-		if new:
-			pathv = [join(self.path, j, 'post.json') for j in new]
-			good = set(compress(new, pool.imap(exists, pathv, chunksize=64)))
-			self.valid_jobids.update(good)
-			self.known_jobids.update(new)
+			self.recent_bad_jobids.discard(jid)
+			self.mtimes.pop(jid, None)
+			self.pending.pop(jid, None)
+			self._unwatch(jid)
+
+
+	def _start_watching(self):
+		from accelerator import inotify
+		self.watcher = inotify.Inotify.create() or False
+		if self.watcher:
+			mask = inotify.IN_CREATE | inotify.IN_DELETE | inotify.IN_MOVED_FROM | inotify.IN_MOVED_TO | inotify.IN_ONLYDIR
+			self._workdir_wd = self.watcher.add_watch(self.path, mask)
+			if self._workdir_wd is None:
+				self.watcher.close()
+				self.watcher = False
+
+
+	def _watch(self, jobid):
+		# Watch unfinished jobs for post.json, but don't use up all watches
+		# on jobs that failed long ago.
+		if self.watcher and jobid not in self._jobid2wd and len(self._jobid2wd) < 4096:
+			from accelerator import inotify
+			mask = inotify.IN_CREATE | inotify.IN_MOVED_TO | inotify.IN_DELETE_SELF | inotify.IN_ONLYDIR
+			wd = self.watcher.add_watch(os.path.join(self.path, jobid), mask)
+			if wd is not None:
+				self._wd2jobid[wd] = jobid
+				self._jobid2wd[jobid] = wd
+
+
+	def _unwatch(self, jobid):
+		wd = self._jobid2wd.pop(jobid, None)
+		if wd is not None:
+			del self._wd2jobid[wd]
+			self.watcher.rm_watch(wd)
 
 
 	def allocate_jobs(self, num_jobs):
@@ -104,7 +360,10 @@ class WorkSpace:
 			fullpath = os.path.join(self.path, jobid)
 			print("WORKDIR:  Allocate_job \"%s\"" % fullpath)
 			self.known_jobids.add(jobid)
+			self.known_changes.add(jobid)
 			os.mkdir(fullpath)
+			self.pending[jobid] = None
+			self._watch(jobid)
 		return jobidv
 
 
@@ -16,6 +16,7 @@
  **/
 
 #define PY_SSIZE_T_CLEAN 1
+#define _GNU_SOURCE 1 /* for memmem */
 #include <Python.h>
 #include <bytesobject.h>
 #include <datetime.h>
@@ -30,6 +31,7 @@
 #include <sys/types.h>
 #include <sys/stat.h>
 #include <sys/fcntl.h>
+#include <time.h>
 
 
 // Choose some python number functions based on the size of long.
@@ -90,6 +92,14 @@ static inline void add_extra_to_exc_msg(const char *extra) {
 	}
 }
 
+// Used to count the time spent (de)compressing.
+static inline double monotonic_(void)
+{
+	struct timespec ts;
+	clock_gettime(CLOCK_MONOTONIC, &ts);
+	return ts.tv_sec + ts.tv_nsec / 1e9;
+}
+
 
 typedef struct dsu_compressor {
 	int (*read)(void *ctx, char *buf, int *len);
@@ -98,6 +108,8 @@ typedef struct dsu_compressor {
 	void *(*write_open)(int fd);
 	void (*read_close)(void *ctx);
 	int (*write_close)(void *ctx);
+	// Offset in the compressed file (of what has been consumed) when reading.
+	PY_LONG_LONG (*read_offset)(void *ctx);
 } dsu_compressor;
 
 typedef struct dsu_gz_ctx {
@@ -144,6 +156,13 @@ err:
 	return 1;
 }
 
+static PY_LONG_LONG dsu_gz_read_offset(void *ctx_)
+{
+	dsu_gz_ctx *ctx = ctx_;
+	if (!ctx->fh) return 0;
+	return gzoffset(ctx->fh);
+}
+
 static void dsu_gz_read_close(void *ctx_)
 {
 	dsu_gz_ctx *ctx = ctx_;
@@ -197,6 +216,7 @@ static const dsu_compressor dsu_gz = {
 	dsu_gz_write_open,
 	dsu_gz_read_close,
 	dsu_gz_write_close,
+	dsu_gz_read_offset,
 };
 
 
@@ -205,15 +225,23 @@ typedef struct read {
 	char *name;
 	PyObject *hashfilter;
 	PyObject *callback;
+	PyObject *stats;
 	PY_LONG_LONG want_count;
 	PY_LONG_LONG count;
 	PY_LONG_LONG break_count;
 	PY_LONG_LONG callback_interval;
 	PY_LONG_LONG callback_offset;
+	PY_LONG_LONG seek;
+	PY_LONG_LONG uncompressed_bytes;
+	double decompress_time;
+	PyObject *weakreflist;
+	char *needle;
+	Py_ssize_t needle_len;
 	uint64_t spread_None;
 	void *ctx;
 	const dsu_compressor *compressor;
 	int error;
+	int skipping;
 	int pos, len;
 	unsigned int sliceno;
 	unsigned int slices;
@@ -222,9 +250,34 @@ typedef struct read {
 
 #define FREE(p) do { PyMem_Free(p); (p) = 0; } while (0)
 
+// Give stats(compressed bytes, uncompressed bytes, values, seconds spent
+// (de)compressing) to the stats callback. This happens from close (and
+// dealloc), so errors can only be reported as unraisable.
+static void report_stats(PyObject *stats, PY_LONG_LONG compressed_bytes, PY_LONG_LONG uncompressed_bytes, PY_LONG_LONG count, double seconds)
+{
+	PyObject *old_type, *old_value, *old_traceback;
+	PyErr_Fetch(&old_type, &old_value, &old_traceback);
+	PyObject *res = PyObject_CallFunction(stats, "LLLd", compressed_bytes, uncompressed_bytes, count, seconds);
+	if (res) {
+		Py_DECREF(res);
+	} else {
+		PyErr_WriteUnraisable(stats);
+	}
+	PyErr_Restore(old_type, old_value, old_traceback);
+}
+
 static int Read_close_(Read *self)
 {
+	if (self->ctx && self->stats) {
+		PY_LONG_LONG compressed_bytes = self->compressor->read_offset(self->ctx) - self->seek;
+		report_stats(self->stats, compressed_bytes, self->uncompressed_bytes, self->count, self->decompress_time);
+	}
+	Py_CLEAR(self->stats);
+	self->uncompressed_bytes = 0;
+	self->decompress_time = 0;
 	FREE(self->name);
+	FREE(self->needle);
+	self->needle_len = 0;
 	Py_CLEAR(self->hashfilter);
 	self->count = 0;
 	self->want_count = -1;
@@ -261,6 +314,9 @@ static int Read_close_(Read *self)
 static int Read_read_(Read *self, int itemsize);
 static PyTypeObject ReadNumber_Type;
 static PyTypeObject ReadDateTime_Type;
+static PyTypeObject ReadBytes_Type;
+static PyTypeObject ReadAscii_Type;
+static PyTypeObject ReadUnicode_Type;
 static PyTypeObject ReadDate_Type;
 static PyTypeObject ReadTime_Type;
 static PyTypeObject ReadBool_Type;
@@ -374,14 +430,17 @@ static int Read_init(PyObject *self_, PyObject *args, PyObject *kwds)
 	PyObject *callback = 0;
 	PY_LONG_LONG callback_interval = 0;
 	PY_LONG_LONG callback_offset = 0;
+	PyObject *stats = 0;
+	PyObject *needle = 0;
 	Read_close_(self);
 	self->error = 0;
 	static char *kwlist[] = {
 		"name", "compression", "seek", "want_count", "hashfilter",
-		"callback", "callback_interval", "callback_offset", "fd", 0
+		"callback", "callback_interval", "callback_offset", "fd",
+		"stats", "needle", 0
 	};
 	if (!PyArg_ParseTupleAndKeywords(
-		args, kwds, "et|OLLOOLLi", kwlist,
+		args, kwds, "et|OLLOOLLiOO", kwlist,
 		Py_FileSystemDefaultEncoding, &name,
 		&compression,
 		&seek,
@@ -390,12 +449,34 @@ static int Read_init(PyObject *self_, PyObject *args, PyObject *kwds)
 		&callback,
 		&callback_interval,
 		&callback_offset,
-		&fd
+		&fd,
+		&stats,
+		&needle
 	)) return -1;
 	int idx = parse_compression(compression);
 	if (idx == -1) return -1;
 	self->compressor = compression_funcs[idx];
 	self->name = name;
+	if (needle && needle != Py_None) {
+		PyTypeObject *type = Py_TYPE(self);
+		if (type != &ReadBytes_Type && type != &ReadAscii_Type && type != &ReadUnicode_Type) {
+			PyErr_SetString(PyExc_ValueError, "needle is only supported for bytes, ascii and unicode");
+			goto err;
+		}
+		if (!PyBytes_Check(needle)) {
+			PyErr_SetString(PyExc_TypeError, "needle must be " BYTES_NAME);
+			goto err;
+		}
+		self->needle_len = PyBytes_GET_SIZE(needle);
+		if (self->needle_len) {
+			self->needle = PyMem_Malloc(self->needle_len);
+			if (!self->needle) {
+				PyErr_NoMemory();
+				goto err;
+			}
+			memcpy(self->needle, PyBytes_AS_STRING(needle), self->needle_len);
+		}
+	}
 	if (callback && callback != Py_None) {
 		if (!PyCallable_Check(callback)) {
 			PyErr_SetString(PyExc_ValueError, "callback must be callable");
@@ -427,6 +508,7 @@ static int Read_init(PyObject *self_, PyObject *args, PyObject *kwds)
 		goto err;
 	}
 	fd = -1; // belongs to self->ctx now
+	self->seek = self->compressor->read_offset(self->ctx);
 	if (self->want_count >= 0) {
 		self->break_count = self->want_count;
 	}
@@ -437,6 +519,20 @@ static int Read_init(PyObject *self_, PyObject *args, PyObject *kwds)
 	}
 	self->pos = self->len = 0;
 	err1(parse_hashfilter(hashfilter, &self->hashfilter, &self->sliceno, &self->slices, &self->spread_None));
+	if (self->needle && self->hashfilter) {
+		// With a hashfilter each value gives True/False, skipping some
+		// of them would make those not line up with the other columns.
+		PyErr_SetString(PyExc_ValueError, "needle can not be used with hashfilter");
+		goto err;
+	}
+	if (stats && stats != Py_None) {
+		if (!PyCallable_Check(stats)) {
+			PyErr_SetString(PyExc_ValueError, "stats must be callable");
+			goto err;
+		}
+		Py_INCREF(stats);
+		self->stats = stats;
+	}
 	res = 0;
 err:
 	if (fd >= 0) close(fd);
@@ -449,6 +545,7 @@ err:
 
 static void Read_dealloc(Read *self)
 {
+	if (self->weakreflist) PyObject_ClearWeakRefs((PyObject *)self);
 	Read_close_(self);
 	PyObject_Del(self);
 }
@@ -472,6 +569,16 @@ static PyObject *Read_self(Read *self)
 	return (PyObject *)self;
 }
 
+// All reading from the compressor goes through here, so the stats see it.
+static int Read_decompress_(Read *self, char *buf, int *len)
+{
+	const double t0 = monotonic_();
+	const int error = self->compressor->read(self->ctx, buf, len);
+	self->decompress_time += monotonic_() - t0;
+	if (!error && *len > 0) self->uncompressed_bytes += *len;
+	return error;
+}
+
 static int Read_read_(Read *self, int itemsize)
 {
 	if (!self->error) {
@@ -481,7 +588,7 @@ static int Read_read_(Read *self, int itemsize)
 			PY_LONG_LONG candidate = count_left * itemsize + itemsize;
 			if (candidate < self->len) self->len = candidate;
 		}
-		self->error = self->compressor->read(self->ctx, self->buf, &self->len);
+		self->error = Read_decompress_(self, self->buf, &self->len);
 	}
 	if (self->error) {
 		PyErr_SetString(PyExc_ValueError, "File format error");
@@ -582,9 +689,20 @@ static inline int do_callback(Read *self)
 	}                                                    	\
 } while(0)
 
+// Returned by mkblob* for values that don't contain the needle, the
+// iterator moves on to the next value without creating any object.
+// Also returned for every value while skip() is skipping.
+static PyObject no_match_sentinel;
+#define NO_MATCH (&no_match_sentinel)
+#define SKIP_CHECK do { if (self->skipping) return NO_MATCH; } while (0)
+
 #define MKmkBlob(name, decoder) \
 	static inline PyObject *mkblob ## name(Read *self, const char *ptr, int len)     	\
 	{                                                                                	\
+		SKIP_CHECK;                                                              	\
+		if (self->needle && !memmem(ptr, len, self->needle, self->needle_len)) { 	\
+			return NO_MATCH;                                                 	\
+		}                                                                        	\
 		HC_CHECK(hash(ptr, len));                                                	\
 		return decoder;                                                          	\
 	}
@@ -597,7 +715,7 @@ MKmkBlob(Unicode, PyUnicode_DecodeUTF8(ptr, len, 0))
 #endif
 
 #define MKBLOBITER(name, typename) \
-	static PyObject *name ## _iternext(Read *self)                                   	\
+	static PyObject *name ## _iternext_(Read *self)                                  	\
 	{                                                                                	\
 		ITERPROLOGUE(typename);                                                  	\
 		uint32_t size = ((uint8_t *)self->buf)[self->pos];                       	\
@@ -643,7 +761,7 @@ MKmkBlob(Unicode, PyUnicode_DecodeUTF8(ptr, len, 0))
 			self->pos = self->len;                                           	\
 			const int want_len = size - left_in_buf;                         	\
 			int read_len = want_len;                                         	\
-			self->error = self->compressor->read(self->ctx, tmp + left_in_buf, &read_len); \
+			self->error = Read_decompress_(self, tmp + left_in_buf, &read_len); \
 			if (self->error || read_len != want_len) {                       	\
 				free(tmp);                                               	\
 				goto fferror;                                            	\
@@ -656,7 +774,13 @@ MKmkBlob(Unicode, PyUnicode_DecodeUTF8(ptr, len, 0))
 			memmove(self->buf, ptr, left_in_buf);                            	\
 			ptr = self->buf + left_in_buf;                                   	\
 			int read_len = Z - left_in_buf;                                  	\
-			self->error = self->compressor->read(self->ctx, ptr, &read_len); 	\
+			if (self->want_count >= 0) {                                     	\
+				/* Like Read_read_, don't read far past our slice. */    	\
+				PY_LONG_LONG count_left = self->want_count - self->count;	\
+				PY_LONG_LONG candidate = size - left_in_buf + count_left * SIZE_ ## typename; \
+				if (candidate < read_len) read_len = candidate;          	\
+			}                                                                	\
+			self->error = Read_decompress_(self, ptr, &read_len);            	\
 			if (self->error || read_len <= 0) goto fferror;                  	\
 			if (read_len + left_in_buf < size) goto fferror;                 	\
 			self->len = read_len + left_in_buf;                              	\
@@ -668,6 +792,14 @@ MKmkBlob(Unicode, PyUnicode_DecodeUTF8(ptr, len, 0))
 fferror:                                                                                 	\
 		PyErr_SetString(PyExc_ValueError, "File format error");                  	\
 		return 0;                                                                	\
+	}                                                                                	\
+	static PyObject *name ## _iternext(Read *self)                                   	\
+	{                                                                                	\
+		PyObject *res;                                                           	\
+		do {                                                                     	\
+			res = name ## _iternext_(self);                                  	\
+		} while (res == NO_MATCH && !self->skipping);                            	\
+		return res;                                                              	\
 	}
 MKBLOBITER(ReadBytes  , Bytes);
 MKBLOBITER(ReadAscii  , Ascii);
@@ -702,6 +834,7 @@ static const uint8_t noneval_uint8_t = 255;
 		/* Z is a multiple of sizeof(T), so this never overruns. */  	\
 		const char *ptr = self->buf + self->pos;                     	\
 		self->pos += sizeof(T);                                      	\
+		SKIP_CHECK;                                                  	\
 		if (withnone && !memcmp(ptr, &noneval_ ## T, sizeof(T))) {   	\
 			HC_RETURN_NONE;                                      	\
 		}                                                            	\
@@ -737,6 +870,7 @@ static PyObject *ReadNumber_iternext(Read *self)
 	self->pos++;
 	if (!len) HC_RETURN_NONE;
 	if (len >= 0x80) {
+		SKIP_CHECK;
 		int64_t v = (len & 0x7f) - 5;
 		HC_CHECK(hash_int64(&v));
 		return pyInt_FromS64(v);
@@ -766,6 +900,7 @@ static PyObject *ReadNumber_iternext(Read *self)
 		memcpy(ptr, self->buf, morelen);
 		self->pos = morelen;
 	}
+	SKIP_CHECK;
 	if (is_float) {
 		double v;
 		memcpy(&v, buf, sizeof(v));
@@ -823,6 +958,7 @@ static PyObject *ReadDateTime_iternext(Read *self)
 	uint32_t a[2];
 	memcpy(a, self->buf + self->pos, 8);
 	self->pos += 8;
+	SKIP_CHECK;
 	if (!a[0]) HC_RETURN_NONE;
 	HC_CHECK(hash_datetime(self->buf + self->pos - 8));
 	return unfmt_datetime(a[0], a[1]);
@@ -844,6 +980,7 @@ static PyObject *ReadDate_iternext(Read *self)
 	uint32_t i0;
 	memcpy(&i0, self->buf + self->pos, 4);
 	self->pos += 4;
+	SKIP_CHECK;
 	if (!i0) HC_RETURN_NONE;
 	HC_CHECK(hash_32bits(self->buf + self->pos - 4));
 	return unfmt_date(i0);
@@ -871,6 +1008,7 @@ static PyObject *ReadTime_iternext(Read *self)
 	uint32_t a[2];
 	memcpy(a, self->buf + self->pos, 8);
 	self->pos += 8;
+	SKIP_CHECK;
 	if (!a[0]) HC_RETURN_NONE;
 	HC_CHECK(hash_datetime(self->buf + self->pos - 8));
 	return unfmt_time(a[0], a[1]);
@@ -881,10 +1019,33 @@ static PyObject *any_exit(PyObject *self, PyObject *args)
 	return PyObject_CallMethod(self, "close", NULL);
 }
 
+// Move past count values without making objects for them (or looking
+// for the needle in them). Stops early (without error) at the end.
+static PyObject *Read_skip(Read *self, PyObject *arg)
+{
+	PY_LONG_LONG count = PyLong_AsLongLong(arg);
+	if (count == -1 && PyErr_Occurred()) return 0;
+	if (count < 0) {
+		PyErr_SetString(PyExc_ValueError, "Can't skip backwards");
+		return 0;
+	}
+	iternextfunc next = Py_TYPE(self)->tp_iternext;
+	self->skipping = 1;
+	for (; count; count--) {
+		PyObject *res = next((PyObject *)self);
+		if (!res) break;
+		if (res != NO_MATCH) Py_DECREF(res); // None from some types
+	}
+	self->skipping = 0;
+	if (PyErr_Occurred()) return 0;
+	Py_RETURN_NONE;
+}
+
 static PyMethodDef Read_methods[] = {
 	{"__enter__", (PyCFunction)Read_self , METH_NOARGS , NULL},
 	{"__exit__",  (PyCFunction)any_exit  , METH_VARARGS, NULL},
 	{"close",     (PyCFunction)Read_close, METH_NOARGS , NULL},
+	{"skip",      (PyCFunction)Read_skip , METH_O      , NULL},
 	{NULL, NULL, 0, NULL}
 };
 
@@ -914,7 +1075,7 @@ static PyMethodDef Read_methods[] = {
 		0,                              /*tp_traverse      */	\
 		0,                              /*tp_clear         */	\
 		0,                              /*tp_richcompare   */	\
-		0,                              /*tp_weaklistoffset*/	\
+		offsetof(Read, weakreflist),    /*tp_weaklistoffset*/	\
 		(getiterfunc)Read_self,         /*tp_iter          */	\
 		(iternextfunc)name ## _iternext,/*tp_iternext      */	\
 		Read_methods,                   /*tp_methods       */	\
@@ -934,6 +1095,9 @@ static PyMethodDef Read_methods[] = {
 static PyMemberDef r_default_members[] = {
 	{"name"      , T_STRING   , offsetof(Read, name       ), READONLY},
 	{"hashfilter", T_OBJECT_EX, offsetof(Read, hashfilter ), READONLY},
+	// These two are reset when the reader is closed.
+	{"count"     , T_LONGLONG , offsetof(Read, count      ), READONLY},
+	{"uncompressed_bytes", T_LONGLONG, offsetof(Read, uncompressed_bytes), READONLY},
 	{0}
 };
 MKTYPE(ReadBytes);
@@ -985,6 +1149,9 @@ typedef struct write {
 	char *error_extra;
 	default_u *default_value;
 	unsigned PY_LONG_LONG count;
+	unsigned PY_LONG_LONG compressed_bytes;
+	unsigned PY_LONG_LONG uncompressed_bytes;
+	double compress_time;
 	PyObject *hashfilter;
 	PyObject *compression;
 	PyObject *default_obj;
@@ -1030,10 +1197,13 @@ static int Write_flush_(Write *self)
 	if (Write_ensure_open(self)) return 1;
 	const int len = self->len;
 	self->len = 0;
+	const double t0 = monotonic_();
 	if (self->compressor->write(self->ctx, self->buf, len)) {
 		PyErr_SetString(PyExc_IOError, "Write failed");
 		return 1;
 	}
+	self->compress_time += monotonic_() - t0;
+	self->uncompressed_bytes += len;
 	return 0;
 }
 
@@ -1046,6 +1216,19 @@ static PyObject *Write_flush(Write *self)
 
 static int Write_close_(Write *self)
 {
+	int res = 0;
+	if (self->closed) {
+		res = 1;
+	} else if (self->ctx) {
+		res = Write_flush_(self);
+		const double t0 = monotonic_();
+		res |= self->compressor->write_close(self->ctx);
+		self->compress_time += monotonic_() - t0;
+		self->ctx = 0;
+		self->closed = 1;
+		struct stat st;
+		if (!stat(self->name, &st)) self->compressed_bytes = st.st_size;
+	}
 	if (self->default_value) {
 		free(self->default_value);
 		self->default_value = 0;
@@ -1056,13 +1239,7 @@ static int Write_close_(Write *self)
 	Py_CLEAR(self->default_obj);
 	Py_CLEAR(self->min_obj);
 	Py_CLEAR(self->max_obj);
-	if (self->closed) return 1;
-	if (!self->ctx) return 0;
-	int err = Write_flush_(self);
-	err |= self->compressor->write_close(self->ctx);
-	self->ctx = 0;
-	self->closed = 1;
-	return err;
+	return res;
 }
 
 static int Write_parse_compression(Write *self, PyObject *compression)
@@ -1100,6 +1277,8 @@ static int init_WriteBlob(PyObject *self_, PyObject *args, PyObject *kwds)
 	err1(parse_hashfilter(hashfilter, &self->hashfilter, &self->sliceno, &self->slices, &self->spread_None));
 	self->closed = 0;
 	self->count = 0;
+	self->compressed_bytes = self->uncompressed_bytes = 0;
+	self->compress_time = 0;
 	self->len = 0;
 	return 0;
 err:
@@ -1136,10 +1315,13 @@ static PyObject *Write_write_(Write *self, const char *data, Py_ssize_t len)
 		if (Write_flush_(self)) return 0;
 	}
 	while (len > Z) {
+		const double t0 = monotonic_();
 		if (self->compressor->write(self->ctx, data, Z)) {
 			PyErr_SetString(PyExc_IOError, "Write failed");
 			return 0;
 		}
+		self->compress_time += monotonic_() - t0;
+		self->uncompressed_bytes += Z;
 		len -= Z;
 		data += Z;
 	}
@@ -1446,6 +1628,8 @@ MK_MINMAX_SET(Time    , unfmt_time((*(uint64_t *)cmp_value) >> 32, *(uint64_t *)
 		err1(parse_hashfilter(hashfilter, &self->hashfilter, &self->sliceno, &self->slices, &self->spread_None)); \
 		self->closed = 0;                                                        	\
 		self->count = 0;                                                         	\
+		self->compressed_bytes = self->uncompressed_bytes = 0;                    	\
+		self->compress_time = 0;                                                 	\
 		self->len = 0;                                                           	\
 		return 0;                                                                	\
 err:                                                                                     	\
@@ -1738,6 +1922,8 @@ static int init_WriteNumber(PyObject *self_, PyObject *args, PyObject *kwds)
 	err1(parse_hashfilter(hashfilter, &self->hashfilter, &self->sliceno, &self->slices, &self->spread_None));
 	self->closed = 0;
 	self->count = 0;
+	self->compressed_bytes = self->uncompressed_bytes = 0;
+	self->compress_time = 0;
 	self->len = 0;
 	return 0;
 err:
@@ -2005,6 +2191,9 @@ static PyMemberDef w_default_members[] = {
 	{"max"       , T_OBJECT   , offsetof(Write, max_obj    ), READONLY},
 	{"default"   , T_OBJECT_EX, offsetof(Write, default_obj), READONLY},
 	{"compression",T_OBJECT_EX, offsetof(Write, compression), READONLY},
+	{"compressed_bytes"  , T_ULONGLONG, offsetof(Write, compressed_bytes  ), READONLY},
+	{"uncompressed_bytes", T_ULONGLONG, offsetof(Write, uncompressed_bytes), READONLY},
+	{"compress_time"     , T_DOUBLE   , offsetof(Write, compress_time     ), READONLY},
 	{0}
 };
 